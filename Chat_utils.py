@@ -2,11 +2,27 @@
 import json
 import random
 import re
+import time
+import weakref
+from array import array
+
+from phrase_matcher import PhraseAutomaton
+from fuzzy_matcher import DeletionIndex
+from kb_compact import IntentTable, build_intent_table
+import batch_scoring
 
 # Pre-compile regular expressions for slightly better performance in preprocess_input
 PREPROCESS_PUNCT_RE = re.compile(r'[^\w\s\']')  # Allows word chars, whitespace, apostrophes
 PREPROCESS_SPACE_RE = re.compile(r'\s+')
 
+# Fallback texts used when the 'default' intent is missing or has no responses
+EMPTY_INPUT_RESPONSE = "Please say something."
+NO_MATCH_RESPONSE = "I'm really not sure how to respond to that. Can you try asking differently?"
+
+# Matches scoring below this (anything short of an exact phrase match, which scores 100 plus
+# the phrase length) are retried with misspellings corrected (see find_fuzzy_match)
+FUZZY_RETRY_BELOW_SCORE = 100
+
 
 def preprocess_input(text: str) -> str:
     """
@@ -21,11 +37,10 @@ def preprocess_input(text: str) -> str:
     return text
 
 
-def load_and_preprocess_knowledge_base(filepath="knowledge_base.json"):
+def read_knowledge_base_file(filepath="knowledge_base.json"):
     """
-    Loads the knowledge base from a JSON file and preprocesses all patterns
-    (text and keyword sets) for faster matching in get_response.
-    Returns the processed knowledge base or None if an error occurs.
+    Reads the raw (unprocessed) knowledge base from a JSON file.
+    Returns the parsed JSON or None if an error occurs.
     """
     try:
         with open(filepath, 'r', encoding='utf-8') as f:
@@ -40,110 +55,361 @@ def load_and_preprocess_knowledge_base(filepath="knowledge_base.json"):
         print(f"An unexpected error occurred while loading the knowledge base: {e}")
         return None
 
-    processed_intents = []
     if "intents" not in raw_knowledge_base:
         print("Error: 'intents' key not found in knowledge base.")
         return None
 
-    for intent_data in raw_knowledge_base["intents"]:
-        tag = intent_data.get("tag")
-        responses = intent_data.get("responses", [])
-        original_patterns = intent_data.get("patterns", [])
-
-        current_intent_processed_patterns = []
-        for pattern_text in original_patterns:
-            processed_text = preprocess_input(pattern_text)
-            if processed_text:  # Only include if pattern is not empty after preprocessing
-                keywords = set(processed_text.split())
-                current_intent_processed_patterns.append({
-                    "text": processed_text,  # Preprocessed pattern string
-                    "keywords": keywords  # Set of keywords from the preprocessed pattern
-                })
-
-        # Add intent if it has processed patterns or if it's a 'default' intent (which might have no patterns)
-        if current_intent_processed_patterns or tag == "default":
-            processed_intents.append({
-                "tag": tag,
-                "processed_patterns_data": current_intent_processed_patterns,  # Renamed for clarity
-                "responses": responses
+    return raw_knowledge_base
+
+
+def preprocess_intent(intent_data: dict):
+    """
+    Preprocesses the patterns (text and keyword sets) of one raw intent.
+    Returns the processed intent, or None if it has no usable patterns and
+    is not the 'default' intent.
+    """
+    tag = intent_data.get("tag")
+    responses = intent_data.get("responses", [])
+    original_patterns = intent_data.get("patterns", [])
+
+    current_intent_processed_patterns = []
+    for pattern_text in original_patterns:
+        processed_text = preprocess_input(pattern_text)
+        if processed_text:  # Only include if pattern is not empty after preprocessing
+            keywords = set(processed_text.split())
+            current_intent_processed_patterns.append({
+                "text": processed_text,  # Preprocessed pattern string
+                "keywords": keywords  # Set of keywords from the preprocessed pattern
             })
 
-    return {"intents": processed_intents}
+    # Add intent if it has processed patterns or if it's a 'default' intent (which might have no patterns)
+    if current_intent_processed_patterns or tag == "default":
+        return {
+            "tag": tag,
+            "processed_patterns_data": current_intent_processed_patterns,  # Renamed for clarity
+            "responses": responses
+        }
+    return None
+
+
+def build_processed_knowledge_base(processed_intents):
+    """
+    Assembles the processed knowledge base from already preprocessed intents
+    (or an IntentTable), storing them in the compact IntentTable form
+    (see kb_compact.py) and building the match indexes used by get_response.
+    """
+    intent_table = processed_intents if isinstance(processed_intents, IntentTable) \
+        else build_intent_table(processed_intents)
+    keyword_index = build_keyword_index(intent_table)
+    return {
+        "intents": intent_table,
+        "keyword_index": keyword_index,
+        "phrase_automaton": build_phrase_automaton(intent_table),
+        # Typo-tolerant lookups over the keyword vocabulary (see find_fuzzy_match)
+        "fuzzy_index": DeletionIndex(keyword_index)
+    }
+
+
+def load_and_preprocess_knowledge_base(filepath="knowledge_base.json"):
+    """
+    Loads the knowledge base from a JSON file and preprocesses all patterns
+    (text and keyword sets) for faster matching in get_response.
+    Returns the processed knowledge base or None if an error occurs.
+    """
+    raw_knowledge_base = read_knowledge_base_file(filepath)
+    if raw_knowledge_base is None:
+        return None
+
+    processed_intents = []
+    for intent_data in raw_knowledge_base["intents"]:
+        processed_intent = preprocess_intent(intent_data)
+        if processed_intent:
+            processed_intents.append(processed_intent)
+
+    return build_processed_knowledge_base(processed_intents)
+
+
+def _scored_pattern_ids(intent_table):
+    """Yields the ids of the patterns that can match: all but those of 'default' intents."""
+    default_intents = {intent_index for intent_index in range(len(intent_table))
+                       if intent_table.tag(intent_index) == "default"}
+    pattern_intent = intent_table.pattern_intent
+    for pattern_id in range(intent_table.pattern_count):
+        if pattern_intent[pattern_id] not in default_intents:
+            yield pattern_id
+
+
+def build_keyword_index(intent_table):
+    """
+    Builds an inverted index from keyword to the ids of the patterns containing
+    it (an array, in knowledge base order), so get_response only has to score
+    patterns that share at least one keyword with the user input. The 'default'
+    intent is skipped because it is never scored.
+    """
+    postings = {}  # token string id -> pattern ids
+    for pattern_id in _scored_pattern_ids(intent_table):
+        for token_id in set(intent_table.pattern_token_ids(pattern_id)):
+            pattern_ids = postings.get(token_id)
+            if pattern_ids is None:
+                pattern_ids = postings[token_id] = array('i')
+            pattern_ids.append(pattern_id)
+    strings = intent_table.strings
+    return {strings[token_id]: pattern_ids for token_id, pattern_ids in postings.items()}
+
+
+def build_phrase_automaton(intent_table):
+    """
+    Compiles every preprocessed pattern text into a single Aho-Corasick
+    automaton, with the pattern id as the payload, so the exact phrase pass
+    of get_response is one scan over the user input.
+    """
+    automaton = PhraseAutomaton()
+    for pattern_id in _scored_pattern_ids(intent_table):
+        automaton.add(intent_table.pattern_text(pattern_id), pattern_id)
+    return automaton.build()
 
 
-def get_response(user_input: str, knowledge_base: dict):
+def keyword_match_score(common_count, pattern_size):
+    """
+    Scores a keyword-based match for a pattern with pattern_size distinct
+    keywords, common_count of which appear in the user input.
+    Returns 0 if they share no keywords.
+    """
+    if not common_count:
+        return 0
+
+    score = common_count * 5  # Base score on number of common keywords
+
+    # Boost score if all keywords of the pattern are present in user input
+    if common_count == pattern_size:  # Exact keyword set match
+        score += 20 + pattern_size
+
+    # Boost score if a significant portion of pattern keywords match
+    elif (common_count / pattern_size) > 0.6:
+        score += 10
+
+    return score
+
+
+def score_keyword_match(pattern_keywords, user_input_keywords):
+    """
+    Scores a keyword-based match between a pattern's keyword set and the
+    user input's keyword set. Returns 0 if they share no keywords.
+    """
+    return keyword_match_score(len(pattern_keywords.intersection(user_input_keywords)), len(pattern_keywords))
+
+
+def _compiled_knowledge_base(knowledge_base: dict):
+    """
+    Returns the knowledge base itself if it was built by build_processed_knowledge_base,
+    or a compiled copy of one assembled by hand from processed intent dicts.
+    """
+    if isinstance(knowledge_base.get("intents"), IntentTable) and "keyword_index" in knowledge_base:
+        return knowledge_base
+    return build_processed_knowledge_base(knowledge_base.get("intents", []))
+
+
+def find_best_match(processed_user_input: str, knowledge_base: dict, stats=None):
+    """
+    Scores the (already preprocessed) user input against the knowledge base
+    and returns (intent_data, score) for the best matching pattern, or None
+    if nothing matched. Ties are broken in favour of the pattern that comes
+    first in the knowledge base. If stats (a dict) is given, the number of
+    patterns scored is added to stats["scanned_patterns"].
+    """
+    knowledge_base = _compiled_knowledge_base(knowledge_base)
+    intents = knowledge_base["intents"]
+    pattern_intent = intents.pattern_intent
+
+    # Entries are (-score, pattern_id) so the smallest entry is the highest
+    # score, earliest in the knowledge base (pattern ids follow KB order).
+    scored_matches = []
+
+    # 1. Exact phrase (substring) match using pre-processed pattern.
+    # Patterns found here skip the keyword check. Only the longest exact match
+    # of each intent can win, so that is the only one we keep per intent.
+    exact_matched = set()
+    longest_per_intent = {}
+    for pattern_length, pattern_id in knowledge_base["phrase_automaton"].find(processed_user_input):
+        exact_matched.add(pattern_id)
+        intent_index = pattern_intent[pattern_id]
+        current = longest_per_intent.get(intent_index)
+        if current is None or (-pattern_length, pattern_id) < current:
+            longest_per_intent[intent_index] = (-pattern_length, pattern_id)
+    for neg_length, pattern_id in longest_per_intent.values():
+        # Longer exact matches get higher score
+        scored_matches.append((-(100 - neg_length), pattern_id))
+
+    # 2. Keyword-based match, only for patterns sharing at least one keyword.
+    # Each posting of an input keyword is one keyword the pattern has in common with the input.
+    keyword_index = knowledge_base["keyword_index"]
+    common_counts = {}
+    for keyword in set(processed_user_input.split()):
+        for pattern_id in keyword_index.get(keyword, ()):
+            common_counts[pattern_id] = common_counts.get(pattern_id, 0) + 1
+
+    pattern_sizes = intents.pattern_sizes
+    for pattern_id, common_count in common_counts.items():
+        if pattern_id not in exact_matched:
+            scored_matches.append((-keyword_match_score(common_count, pattern_sizes[pattern_id]), pattern_id))
+
+    if stats is not None:
+        stats["scanned_patterns"] = (stats.get("scanned_patterns", 0)
+                                     + len(exact_matched) + len(common_counts.keys() - exact_matched))
+    if not scored_matches:
+        return None
+
+    neg_score, pattern_id = min(scored_matches)
+    return intents[pattern_intent[pattern_id]], -neg_score
+
+
+def find_fuzzy_match(processed_user_input: str, knowledge_base: dict, stats=None):
+    """
+    Match for input the exact tiers matched weakly or not at all: replaces
+    each word that is not in the knowledge base vocabulary with the closest
+    vocabulary word within a small edit distance (e.g. "pyhton" -> "python")
+    and scores the corrected input with find_best_match.
+    Returns (intent_data, score) or None, like find_best_match (stats too).
+    """
+    knowledge_base = _compiled_knowledge_base(knowledge_base)
+    corrected_input = knowledge_base["fuzzy_index"].correct(processed_user_input)
+    if corrected_input == processed_user_input:
+        return None  # Nothing to correct, so nothing new to match
+    return find_best_match(corrected_input, knowledge_base, stats)
+
+
+def get_default_response(knowledge_base: dict, fallback_text: str, rng=random):
+    """
+    Returns a random response from the 'default' intent, or fallback_text if
+    the default intent is missing or has no responses.
+    """
+    intents = knowledge_base.get("intents", [])
+    if isinstance(intents, IntentTable):
+        default_intent_data = intents[intents.default_intent] if intents.default_intent >= 0 else None
+    else:
+        default_intent_data = next((intent for intent in intents if intent.get("tag") == "default"), None)
+    if default_intent_data and default_intent_data.get("responses"):
+        return rng.choice(default_intent_data["responses"])
+    return fallback_text
+
+
+def get_response(user_input: str, knowledge_base: dict, fuzzy=True, stats=None):
     """
     Finds an appropriate response from the (preprocessed) knowledge base.
     The knowledge_base parameter is expected to be the output of
-    load_and_preprocess_knowledge_base.
+    load_and_preprocess_knowledge_base. If nothing matches or the match scores
+    below FUZZY_RETRY_BELOW_SCORE and fuzzy is True, misspelled words are
+    corrected and matched again (find_fuzzy_match); the better match wins.
+    If stats (a dict) is given, it receives the time spent in preprocess_input
+    ("preprocess_seconds"), the number of patterns scored ("scanned_patterns")
+    and the matched intent's tag and score ("intent" and "score", None if nothing matched).
     """
-    processed_user_input = preprocess_input(user_input)
-    # Create keyword set from user input once
-    user_input_keywords = set(processed_user_input.split())
+    if stats is None:
+        processed_user_input = preprocess_input(user_input)
+    else:
+        start_time = time.perf_counter()
+        processed_user_input = preprocess_input(user_input)
+        stats["preprocess_seconds"] = time.perf_counter() - start_time
+        stats.setdefault("scanned_patterns", 0)
+        stats["intent"] = stats["score"] = None
 
     if not processed_user_input:  # Handle cases where input becomes empty
-        default_intent_data = next(
-            (intent for intent in knowledge_base.get("intents", []) if intent.get("tag") == "default"), None)
-        if default_intent_data and default_intent_data.get("responses"):
-            return random.choice(default_intent_data["responses"])
-        return "Please say something."
-
-    possible_matches = []
-
-    for intent_data in knowledge_base.get("intents", []):
-        if intent_data.get("tag") == "default":
-            continue  # Handle default intent only if no other matches are found
-
-        # Iterate over the pre-processed patterns data for the current intent
-        for p_pattern_info in intent_data.get("processed_patterns_data", []):
-            processed_pattern_text = p_pattern_info["text"]
-            pattern_keywords = p_pattern_info["keywords"]  # Already a set of preprocessed keywords
-
-            # 1. Exact phrase (substring) match using pre-processed pattern
-            if processed_pattern_text in processed_user_input:
-                possible_matches.append({
-                    "responses": intent_data.get("responses", []),
-                    "score": 100 + len(processed_pattern_text)  # Longer exact matches get higher score
-                })
-                # If an exact match is found for this pattern, we can skip its keyword check.
-                # We continue checking other patterns in this intent or other intents.
-                continue
-
-                # 2. Keyword-based match using pre-generated keyword sets
-            if not pattern_keywords:  # Should ideally be filtered out during preprocessing
-                continue
-
-            common_keywords = pattern_keywords.intersection(user_input_keywords)
-
-            if common_keywords:
-                score = len(common_keywords) * 5  # Base score on number of common keywords
-
-                # Boost score if all keywords of the pattern are present in user input
-                if common_keywords == pattern_keywords:  # Exact keyword set match
-                    score += 20 + len(pattern_keywords)
-
-                    # Boost score if a significant portion of pattern keywords match
-                # (avoid division by zero if pattern_keywords is somehow empty)
-                elif pattern_keywords and (len(common_keywords) / len(pattern_keywords)) > 0.6:
-                    score += 10
-
-                possible_matches.append({
-                    "responses": intent_data.get("responses", []),
-                    "score": score
-                })
-
-    # If there are scored matches, sort them and pick the best one
-    if possible_matches:
-        possible_matches.sort(key=lambda x: x["score"], reverse=True)
-        best_match = possible_matches[0]
-        if best_match["responses"]:  # Ensure there are responses to choose from
-            return random.choice(best_match["responses"])
+        return get_default_response(knowledge_base, EMPTY_INPUT_RESPONSE)
+
+    best_match = find_best_match(processed_user_input, knowledge_base, stats)
+    if fuzzy:
+        best_match = _with_fuzzy_retry(best_match, processed_user_input, knowledge_base, stats)
+    if best_match:
+        best_intent_data, score = best_match
+        if stats is not None:
+            stats["intent"], stats["score"] = best_intent_data.get("tag"), score
+        if best_intent_data.get("responses"):  # Ensure there are responses to choose from
+            return random.choice(best_intent_data["responses"])
 
     # Fallback to default response if no suitable patterns matched
-    default_intent_data = next(
-        (intent for intent in knowledge_base.get("intents", []) if intent.get("tag") == "default"), None)
-    if default_intent_data and default_intent_data.get("responses"):
-        return random.choice(default_intent_data["responses"])
+    return get_default_response(knowledge_base, NO_MATCH_RESPONSE)
+
+
+def _with_fuzzy_retry(best_match, processed_user_input, knowledge_base, stats=None):
+    """best_match, or the fuzzy match if best_match is missing or weak and the fuzzy one scores higher."""
+    if best_match is not None and best_match[1] >= FUZZY_RETRY_BELOW_SCORE:
+        return best_match
+    fuzzy_match = find_fuzzy_match(processed_user_input, knowledge_base, stats)
+    if fuzzy_match is not None and (best_match is None or fuzzy_match[1] > best_match[1]):
+        return fuzzy_match
+    return best_match
+
+
+# Batch scoring arrays built on demand, per IntentTable (so they go away with their knowledge base)
+_token_incidence_cache = weakref.WeakKeyDictionary()
+
+
+def _token_incidence(knowledge_base: dict):
+    """
+    The batch scoring arrays of a compiled knowledge base: the precomputed ones
+    of a snapshot (see kb_snapshot.py), or ones built on first use and kept
+    with its IntentTable rather than in the caller's dict.
+    """
+    incidence = knowledge_base.get("token_incidence")
+    if incidence is None:
+        intents = knowledge_base["intents"]
+        incidence = _token_incidence_cache.get(intents)
+        if incidence is None:
+            incidence = batch_scoring.build_token_incidence(knowledge_base)
+            _token_incidence_cache[intents] = incidence
+    return incidence
+
+
+def get_responses(inputs, knowledge_base: dict, seed=None, use_numpy=True, fuzzy=True):
+    """
+    Batch version of get_response, for replaying chat logs.
+    Scores all inputs at once with the NumPy backend (batch_scoring) when it is
+    available, otherwise falls back to the scalar find_best_match path; both
+    pick the same winners. Inputs matched weakly or not at all are retried one
+    at a time with find_fuzzy_match when fuzzy is True, as in get_response.
+    Returns a list of dicts with the winning intent 'tag' (None if nothing
+    matched), its 'score' and the selected 'response'. Pass a seed to make
+    response selection reproducible.
+    """
+    rng = random.Random(seed) if seed is not None else random
+    processed_inputs = [preprocess_input(user_input) for user_input in inputs]
+    knowledge_base = _compiled_knowledge_base(knowledge_base)
+
+    if use_numpy and batch_scoring.np is not None:
+        incidence = _token_incidence(knowledge_base)
+        intents = knowledge_base["intents"]
+        best_matches = []
+        for match in batch_scoring.score_batch(processed_inputs, knowledge_base, incidence):
+            if match:
+                intent_index, score = match
+                best_matches.append((intents[intent_index], score))
+            else:
+                best_matches.append(None)
+    else:
+        best_matches = [find_best_match(processed_input, knowledge_base) if processed_input else None
+                        for processed_input in processed_inputs]
+
+    if fuzzy:
+        for i, processed_input in enumerate(processed_inputs):
+            if processed_input:
+                best_matches[i] = _with_fuzzy_retry(best_matches[i], processed_input, knowledge_base)
+
+    results = []
+    for processed_input, best_match in zip(processed_inputs, best_matches):
+        if not processed_input:
+            response = get_default_response(knowledge_base, EMPTY_INPUT_RESPONSE, rng)
+            results.append({"tag": None, "score": 0, "response": response})
+            continue
+
+        tag, score = None, 0
+        response = None
+        if best_match:
+            best_intent_data, score = best_match
+            tag = best_intent_data.get("tag")
+            if best_intent_data.get("responses"):
+                response = rng.choice(best_intent_data["responses"])
+        if response is None:
+            response = get_default_response(knowledge_base, NO_MATCH_RESPONSE, rng)
+        results.append({"tag": tag, "score": score, "response": response})
 
-    # Absolute fallback if default intent is missing or has no responses
-    return "I'm really not sure how to respond to that. Can you try asking differently?"
\ No newline at end of file
+    return results
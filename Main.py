@@ -3,70 +3,437 @@
 # It handles chat messages using Gemini and book review requests.
 # It renders HTML templates and processes form submissions.
 
-from flask import Flask, request, render_template_string, redirect, url_for, session
-from flask_cors import CORS # Import CORS if needed
+from flask import Flask, request, render_template, redirect, url_for, session, jsonify, Response
+from flask.sessions import SecureCookieSessionInterface
+import contextlib
+import hashlib
+import html
 import json
+import math
 import os
-import google.generativeai as genai # Import the Google Generative AI library
+import threading
+import time
+import uuid
 from dotenv import load_dotenv # Import load_dotenv
+from metrics import Metrics, format_metric
 
 # --- Load environment variables from .env file ---
 load_dotenv()
 
+# --- Language Model Backend ---
+# LLM_BACKEND selects the model that answers general chat (see llm_backend.py): 'gemini' (default)
+# or 'fake', a local stand-in for offline load tests configured through FAKE_LLM_OPTIONS
+# (e.g. "latency_ms=800,latency_sigma=0.6,tokens_per_second=40,error_rate=0.01,response_tokens=150").
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")
+FAKE_LLM_OPTIONS = os.getenv("FAKE_LLM_OPTIONS", "")
+
 # --- Configure Google Gemini API ---
-# IMPORTANT: Get API key from environment variable (loaded from .env by load_dotenv())
-try:
-    GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") # Use os.getenv to read from environment
+GEMINI_MODEL_NAME = os.getenv("GEMINI_MODEL_NAME", "gemini-1.5-flash-latest")
+# 'grpc' (the library default) or 'rest'; serve.py uses 'rest', which works with gevent and fork()
+GEMINI_TRANSPORT = os.getenv("GEMINI_TRANSPORT") or None
 
-    if not GEMINI_API_KEY: # Check if the key was actually loaded
-         print("WARNING: GEMINI_API_KEY not found in environment variables or .env file.")
-         print("Gemini chat functionality will be unavailable.")
-         gemini_available = False
-         gemini_model = None
-    else:
-        genai.configure(api_key=GEMINI_API_KEY)
-        # Initialize the Gemini model
-        # You can choose a different model like 'gemini-1.5-flash-latest' or 'gemini-1.5-pro-latest'
-        # based on your needs and availability.
-        gemini_model = genai.GenerativeModel('gemini-1.5-flash-latest')
-        print("JARVIS Backend: Gemini model initialized.")
-        gemini_available = True
-
-except Exception as e:
-    print(f"Error configuring or initializing Gemini model: {e}")
+# IMPORTANT: Get API key from environment variable (loaded from .env by load_dotenv())
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY") # Use os.getenv to read from environment
+if LLM_BACKEND == "gemini" and not GEMINI_API_KEY: # Check if the key was actually loaded
+    print("WARNING: GEMINI_API_KEY not found in environment variables or .env file.")
     print("Gemini chat functionality will be unavailable.")
-    gemini_model = None
-    gemini_available = False
 
 
 # Assuming chatbot_utils.py and wek.py are in the same directory
 try:
-    from Chat_utils import load_and_preprocess_knowledge_base, get_response
-    from wek import fetch_book_details_from_wikipedia
+    from Chat_utils import load_and_preprocess_knowledge_base, get_response, preprocess_input
+    from kb_snapshot import load_snapshot
+    from kb_loader import load_knowledge_base_sources
+    from kb_reloader import KnowledgeBaseReloader
+    from history_store import create_history_store
+    from upstream_pool import UpstreamPool, UpstreamBusyError, UpstreamTimeoutError
+    from response_cache import ResponseCache
+    from wek import fetch_book_details_from_wikipedia, fetch_book_details_batch, get_wikipedia
+    from local_retriever import LocalRetriever, knowledge_base_documents, read_qa_file
+    from llm_backend import create_llm_backend
+    from chat_log import ChatLog, process_log_path
+    from chat_context import ContextBuilder, llm_summarizer
+    from rate_limiter import create_rate_limiter
 except ImportError as e:
     print(f"Error importing local modules: {e}")
     print("Please ensure chatbot_utils.py and wek.py are in the same directory.")
     # Set functions to None if import fails
     load_and_preprocess_knowledge_base = None
     get_response = None
+    preprocess_input = None
+    load_snapshot = None
+    load_knowledge_base_sources = None
+    KnowledgeBaseReloader = None
+    create_history_store = None
+    UpstreamPool = None
+    UpstreamBusyError = UpstreamTimeoutError = ()  # An empty tuple in an except clause catches nothing
+    ResponseCache = None
     fetch_book_details_from_wikipedia = None
+    fetch_book_details_batch = None
+    get_wikipedia = None
+    LocalRetriever = None
+    create_llm_backend = None
+    ChatLog = None
+    ContextBuilder = None
+    create_rate_limiter = None
+
+
+# The Gemini client library is imported on the backend's first use (or by warm_up()), not here
+llm_backend = None
+if create_llm_backend:
+    llm_backend = create_llm_backend(LLM_BACKEND, gemini_api_key=GEMINI_API_KEY, gemini_model_name=GEMINI_MODEL_NAME,
+                                     gemini_transport=GEMINI_TRANSPORT, fake_options=FAKE_LLM_OPTIONS)
+    if llm_backend and LLM_BACKEND != "gemini":
+        print(f"JARVIS Backend: Using the '{llm_backend.name}' LLM backend.")
+
+
+def get_llm_backend():
+    """Returns the LLM backend, loading it on first use; None if no backend is available."""
+    if llm_backend and llm_backend.load():
+        return llm_backend
+    return None
 
 
 app = Flask(__name__)
 # Set a secret key for session management (required for using session)
 # Change this to a random, long string in a real application
 app.config['SECRET_KEY'] = 'your_secret_key_here_change_this'
-# CORS(app) # CORS is less relevant when not using JS fetch, but can be kept if needed
+# CORS is only needed if the API is called from another origin; enable it with:
+# from flask_cors import CORS; CORS(app)
+
+
+# --- Metrics ---
+# Latency histograms of the chat pipeline's steps (spans) are served at /metrics in the Prometheus
+# text format. METRICS_ENABLED=0 turns all recording off. SERVER_TIMING=1 also reports each request's
+# spans in a Server-Timing response header (shown in the browser's network panel).
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") != "0"
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+metrics = Metrics(METRICS_ENABLED, SERVER_TIMING)
+app.wsgi_app = metrics.wsgi_middleware(app.wsgi_app)
+
+
+class TimedSessionInterface(SecureCookieSessionInterface):
+    """Signed cookie sessions, with loading and saving the cookie timed as spans."""
+
+    def open_session(self, app, request):
+        with metrics.span("session_open"):
+            return super().open_session(app, request)
+
+    def save_session(self, app, session, response):
+        with metrics.span("session_save"):
+            super().save_session(app, session, response)
+
+
+if METRICS_ENABLED:
+    app.session_interface = TimedSessionInterface()
+
+
+# --- Chat History Store ---
+# Chat history is kept server-side; the session cookie only carries a session id.
+# CHAT_HISTORY_BACKEND: 'memory' (in-process LRU) or 'sqlite' (on-disk, shared by workers)
+# CHAT_HISTORY_LIMIT: number of messages kept/shown per session
+# CHAT_HISTORY_TTL: seconds after which the sqlite store deletes an idle session (0 keeps them)
+CHAT_HISTORY_BACKEND = os.getenv("CHAT_HISTORY_BACKEND", "memory")
+CHAT_HISTORY_LIMIT = int(os.getenv("CHAT_HISTORY_LIMIT", "200"))
+CHAT_HISTORY_DB = os.getenv("CHAT_HISTORY_DB", "chat_history.db")
+CHAT_HISTORY_TTL = int(os.getenv("CHAT_HISTORY_TTL", str(7 * 24 * 3600)))
+history_store = None
+
+if create_history_store:
+    history_store = create_history_store(CHAT_HISTORY_BACKEND, max_messages=CHAT_HISTORY_LIMIT,
+                                         db_path=CHAT_HISTORY_DB, session_ttl=CHAT_HISTORY_TTL)
+    print(f"JARVIS Backend: Using '{CHAT_HISTORY_BACKEND}' chat history store (limit {CHAT_HISTORY_LIMIT} messages).")
+
+
+# --- Chat Turn Log ---
+# Every chat turn (input, route taken, matched intent and score, latencies) is appended to CHAT_LOG_FILE
+# as a JSON line by a background writer, for tuning the knowledge base offline (see chat_log_replay.py).
+# Records are dropped rather than delaying requests if the writer falls behind. CHAT_LOG_FILE= disables it.
+# Under serve.py each worker writes its own file (chat_log.<pid>.jsonl).
+CHAT_LOG_FILE = os.getenv("CHAT_LOG_FILE", "chat_log.jsonl")
+CHAT_LOG_MAX_BYTES = int(os.getenv("CHAT_LOG_MAX_BYTES", str(50 * 1024 * 1024)))
+CHAT_LOG_BACKUPS = int(os.getenv("CHAT_LOG_BACKUPS", "5"))
+CHAT_LOG_BUFFER = int(os.getenv("CHAT_LOG_BUFFER", "10000"))
+chat_log = None
+
+if ChatLog and CHAT_LOG_FILE:
+    chat_log = ChatLog(CHAT_LOG_FILE, CHAT_LOG_MAX_BYTES, CHAT_LOG_BACKUPS, CHAT_LOG_BUFFER)
+    chat_log.start()
+
+
+def log_chat_turn(endpoint, session_id, user_input, response_type, turn, start_time, **extra):
+    """
+    Queues one chat turn for the chat log. turn holds what generate_bot_response
+    recorded (route, intent, score, outcome, upstream_ms); extra adds more fields.
+    """
+    if not chat_log:
+        return
+    record = {"endpoint": endpoint, "session": session_id, "input": user_input, "route": None, "intent": None,
+              "score": None, "outcome": "ok", "response_type": response_type}
+    record.update(turn)
+    record["latency_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+    record.update(extra)
+    chat_log.log(record)
+
+
+@contextlib.contextmanager
+def timing(turn, key):
+    """Stores the milliseconds spent in the block in turn[key]."""
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        turn[key] = round((time.perf_counter() - start_time) * 1000, 2)
+
+
+def get_session_id():
+    """Returns the id of the current chat session, creating one if needed."""
+    if 'session_id' not in session:
+        session['session_id'] = uuid.uuid4().hex
+    return session['session_id']
+
+
+def get_chat_history():
+    """Returns the current session's chat history (oldest first)."""
+    if not history_store:
+        return []
+    with metrics.span("history_read"):
+        return history_store.get_history(get_session_id())
+
+
+def add_chat_message(sender, text, message_type='chat', session_id=None):
+    """
+    Appends a message to the current session's chat history (or to session_id's,
+    for callers running outside the request context, like the /stream generator).
+    Returns the message's sequence number, or None if no history store is available.
+    """
+    if history_store:
+        session_id = session_id or get_session_id()
+        with metrics.span("history_write"):
+            return history_store.append(session_id, {'sender': sender, 'text': text, 'type': message_type})
+    return None
+
+
+# --- Upstream Call Pools ---
+# Gemini and Wikipedia calls run on bounded worker pools with per-call deadlines.
+# When a pool already has UPSTREAM_MAX_IN_FLIGHT calls outstanding, new requests get
+# a quick "busy" reply instead of tying up another request thread.
+UPSTREAM_POOL_SIZE = int(os.getenv("UPSTREAM_POOL_SIZE", "8"))
+UPSTREAM_MAX_IN_FLIGHT = int(os.getenv("UPSTREAM_MAX_IN_FLIGHT", str(UPSTREAM_POOL_SIZE * 2)))
+GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "30"))
+WIKIPEDIA_TIMEOUT = float(os.getenv("WIKIPEDIA_TIMEOUT", "15"))
+BUSY_RESPONSE = "I'm handling a lot of requests right now. Please try again in a moment."
+
+if UpstreamPool:
+    gemini_pool = UpstreamPool("gemini", UPSTREAM_POOL_SIZE, UPSTREAM_MAX_IN_FLIGHT, GEMINI_TIMEOUT)
+    wikipedia_pool = UpstreamPool("wikipedia", UPSTREAM_POOL_SIZE, UPSTREAM_MAX_IN_FLIGHT, WIKIPEDIA_TIMEOUT)
+else:
+    gemini_pool = None
+    wikipedia_pool = None
+
+
+# An LLM call that missed its deadline: the pool's, or the backend's own (e.g. the fake backend's TimeoutError)
+LLM_TIMEOUT_ERRORS = (UpstreamTimeoutError, TimeoutError) if UpstreamPool else (TimeoutError,)
+
+
+def call_upstream(pool, fn, *args, **kwargs):
+    """Runs an upstream call on its pool, or inline if the pool module is unavailable."""
+    if pool:
+        return pool.call(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
+
+
+# --- Rate Limiting ---
+# Token buckets per client (chat session, or IP address for clients without a session cookie) and route
+# class: 'kb' (every chat turn), 'llm' (a call to the LLM) and 'book' (Wikipedia lookups), written as
+# class=rate/burst with rate in requests per second; an empty value turns limiting off.
+# IP_RATE_LIMITS caps all sessions from one IP address together, so a script collecting fresh session
+# cookies can't get a fresh budget each time; it is looser than RATE_LIMITS since users behind one NAT
+# share it. GLOBAL_RATE_LIMITS caps a class for all clients together (e.g. to stay within the Gemini quota).
+# Turns over the kb limit get a 429; over the llm limit the knowledge base answers instead, and over
+# the book limit the user is asked to try again later. RATE_LIMIT_BACKEND: 'memory' (per process) or
+# 'shared' (a shared memory table created before serve.py forks, so limits hold across its workers).
+# Behind a reverse proxy, configure werkzeug's ProxyFix so request.remote_addr is the client's address.
+RATE_LIMITS = os.getenv("RATE_LIMITS", "kb=2/20,llm=0.2/10,book=0.1/5")
+IP_RATE_LIMITS = os.getenv("IP_RATE_LIMITS", "kb=10/100,llm=1/30,book=0.5/15")
+GLOBAL_RATE_LIMITS = os.getenv("GLOBAL_RATE_LIMITS", "llm=5/20,book=2/10")
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_SLOTS = int(os.getenv("RATE_LIMIT_SLOTS", "65536"))
+RATE_LIMITED_RESPONSE = "You're sending messages faster than I can answer them. Please wait a moment and try again."
+rate_limiter = None
+
+if create_rate_limiter:
+    rate_limiter = create_rate_limiter(RATE_LIMITS, GLOBAL_RATE_LIMITS, RATE_LIMIT_BACKEND, RATE_LIMIT_SLOTS,
+                                       IP_RATE_LIMITS)
+
+
+def rate_limit_keys():
+    """
+    The current client's rate limit keys as (client key, IP address). The
+    client key is its chat session if the request already carries one, and
+    the session also counts against its IP address's limit. Otherwise it is
+    the IP address (so clients that drop the session cookie can't get a fresh
+    budget with every request), and the IP address is None.
+    """
+    session_id = session.get('session_id')
+    if session_id:
+        return f"session:{session_id}", request.remote_addr
+    return f"ip:{request.remote_addr}", None
+
+
+def rate_limit_wait(client_keys, route_class):
+    """
+    Admits one request of route_class from client_keys (see rate_limit_keys).
+    Returns 0 if it may go ahead, otherwise the seconds until it would be admitted.
+    """
+    if not rate_limiter or client_keys is None:
+        return 0.0
+    client_key, ip_key = client_keys
+    return rate_limiter.acquire(client_key, route_class, ip_key)
+
+
+def rate_limited_response(retry_after, event_stream=False):
+    """The 429 reply to a chat turn over the client's kb limit (as an SSE 'error' event for /stream)."""
+    headers = {'Retry-After': str(max(1, math.ceil(retry_after)))}
+    if event_stream:
+        return Response(format_sse('error', {'text': RATE_LIMITED_RESPONSE}), status=429,
+                        mimetype='text/event-stream', headers=headers)
+    if wants_json():
+        response = jsonify(error=RATE_LIMITED_RESPONSE, retry_after=retry_after)
+    else:
+        response = Response(RATE_LIMITED_RESPONSE, mimetype='text/plain')
+    response.status_code = 429
+    response.headers.update(headers)
+    return response
+
+
+def book_rate_limited_text(retry_after):
+    return (f"I've looked up a lot of books for you in a short time. "
+            f"Please try again in {max(1, math.ceil(retry_after))} seconds.")
+
+
+# --- Gemini Response Cache ---
+# Completions (of whichever LLM backend is configured) are cached by normalized message (preprocess_input)
+# and model name, so repeated questions don't cost another Gemini call. Concurrent identical prompts share one call.
+# Only prompts without conversation context (a session's first message, or CONTEXT_MAX_TOKENS=0) are cached:
+# a reply that depends on the conversation can't be reused for another one, and keying it on the whole
+# context would make it a cache entry no later turn ever hits.
+# GEMINI_CACHE_DB enables the persistent disk tier (up to GEMINI_CACHE_DB_MAX_ROWS replies);
+# GEMINI_CACHE_TTL=0 disables the cache.
+GEMINI_CACHE_TTL = float(os.getenv("GEMINI_CACHE_TTL", "3600"))
+GEMINI_CACHE_MAX_BYTES = int(os.getenv("GEMINI_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+GEMINI_CACHE_DB = os.getenv("GEMINI_CACHE_DB", "")
+GEMINI_CACHE_DB_MAX_ROWS = int(os.getenv("GEMINI_CACHE_DB_MAX_ROWS", "100000"))
+gemini_cache = None
+
+if ResponseCache and GEMINI_CACHE_TTL > 0:
+    gemini_cache = ResponseCache(GEMINI_CACHE_MAX_BYTES, GEMINI_CACHE_TTL, GEMINI_CACHE_DB or None,
+                                 GEMINI_CACHE_DB_MAX_ROWS)
+
+
+def gemini_cache_key(backend, user_input, prompt):
+    """
+    Cache key for the prompt built for user_input (see build_llm_prompt): the
+    backend's model name plus the normalized message, or None if the prompt
+    carries conversation context and must not be cached.
+    """
+    if prompt != user_input:
+        return None
+    with metrics.span("preprocess_input"):
+        return f"{backend.model_name}\x00{preprocess_input(user_input)}"
+
+
+class LLMRateLimitedError(Exception):
+    """The client's LLM budget is spent, so its message goes to the knowledge base instead."""
+
+
+def generate_llm_text(backend, prompt, cache_key=None, client_keys=None):
+    """
+    Returns the LLM backend's reply to prompt, from the cache under cache_key
+    when one is given. Only replies the backend has to generate are charged to
+    client_keys' LLM rate limit; LLMRateLimitedError is raised when it is spent.
+    """
+    def compute():
+        if rate_limit_wait(client_keys, "llm"):
+            raise LLMRateLimitedError()
+        with metrics.span("llm_generate"):
+            return call_upstream(gemini_pool, backend.generate, prompt, GEMINI_TIMEOUT)
+
+    if gemini_cache and cache_key:
+        return gemini_cache.get_or_compute(cache_key, compute)
+    return compute()
+
+
+# --- Multi-turn Context ---
+# General chat prompts carry the session's earlier conversation within CONTEXT_MAX_TOKENS (estimated)
+# tokens: recent messages verbatim, older ones as a cached running summary of up to CONTEXT_SUMMARY_TOKENS
+# that is updated incrementally (see chat_context.py). CONTEXT_SUMMARIZER: 'extractive' (no model call)
+# or 'llm' (the LLM backend rewrites the summary when it is compacted). CONTEXT_MAX_TOKENS=0 sends only
+# the new message, as before.
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+CONTEXT_SUMMARY_TOKENS = int(os.getenv("CONTEXT_SUMMARY_TOKENS", "250"))
+CONTEXT_SUMMARIZER = os.getenv("CONTEXT_SUMMARIZER", "extractive")
+context_builder = None
+
+
+def generate_summary_text(prompt):
+    """Asks the LLM backend for a conversation summary (CONTEXT_SUMMARIZER=llm)."""
+    backend = get_llm_backend()
+    if not backend:
+        raise RuntimeError("no LLM backend is available")
+    with metrics.span("llm_summarize"):
+        return call_upstream(gemini_pool, backend.generate, prompt, GEMINI_TIMEOUT)
+
+
+if ContextBuilder and CONTEXT_MAX_TOKENS > 0:
+    context_builder = ContextBuilder(
+        CONTEXT_MAX_TOKENS, CONTEXT_SUMMARY_TOKENS,
+        summarize=llm_summarizer(generate_summary_text) if CONTEXT_SUMMARIZER == "llm" else None)
+
+
+def build_llm_prompt(user_input, session_id, turn):
+    """
+    Returns the LLM prompt for a general chat message: user_input with the
+    session's earlier conversation, within the context token budget. The
+    estimated prompt size is recorded in turn and the metrics.
+    """
+    if not context_builder or not history_store:
+        return user_input
+    with metrics.span("build_context"):
+        history = history_store.get_history(session_id)
+        if history and history[-1].get('sender') == 'user':
+            history = history[:-1]  # The message being answered
+        prompt, prompt_tokens = context_builder.build(session_id, history, user_input)
+    turn["prompt_tokens"] = prompt_tokens
+    metrics.observe_count("prompt_tokens", prompt_tokens, "Estimated tokens per LLM prompt.")
+    return prompt
 
 
 # --- Load Knowledge Base ---
 # Load the knowledge base when the application starts
 KNOWLEDGE_BASE_FILE = "knowledge_base.json"
+# Other files or directories of JSON/JSONL shards to merge into the knowledge base
+# (comma-separated, e.g. "responses.json,knowledge_base.py,kb_shards"); see kb_loader.py.
+KNOWLEDGE_BASE_EXTRA_SOURCES = [path.strip() for path in os.getenv("KNOWLEDGE_BASE_EXTRA_SOURCES", "").split(",")
+                                if path.strip()]
 knowledge_base_data = None # Initialize as None
 
 if load_and_preprocess_knowledge_base:
-    print(f"JARVIS Backend: Loading knowledge base from {KNOWLEDGE_BASE_FILE}...")
-    knowledge_base_data = load_and_preprocess_knowledge_base(KNOWLEDGE_BASE_FILE)
+    if KNOWLEDGE_BASE_EXTRA_SOURCES and load_knowledge_base_sources:
+        print(f"JARVIS Backend: Loading knowledge base from {KNOWLEDGE_BASE_FILE} and "
+              f"{', '.join(KNOWLEDGE_BASE_EXTRA_SOURCES)}...")
+        knowledge_base_data = load_knowledge_base_sources([KNOWLEDGE_BASE_FILE] + KNOWLEDGE_BASE_EXTRA_SOURCES)
+    else:
+        # Prefer the compiled snapshot (python kb_snapshot.py) if it matches the JSON;
+        # it is memory-mapped read-only so forked workers share its pages.
+        if load_snapshot:
+            knowledge_base_data = load_snapshot(KNOWLEDGE_BASE_FILE)
+            if knowledge_base_data:
+                print(f"JARVIS Backend: Knowledge base loaded from compiled snapshot of {KNOWLEDGE_BASE_FILE}.")
+
+        if not knowledge_base_data:
+            print(f"JARVIS Backend: Loading knowledge base from {KNOWLEDGE_BASE_FILE}...")
+            knowledge_base_data = load_and_preprocess_knowledge_base(KNOWLEDGE_BASE_FILE)
 
     # Check if knowledge base loaded successfully
     if not knowledge_base_data or not knowledge_base_data.get("intents"):
@@ -75,6 +442,129 @@ if load_and_preprocess_knowledge_base:
     else:
         print("JARVIS Backend: Knowledge base loaded successfully.")
 
+# --- Live Knowledge Base Reload ---
+# A background thread polls the KB file and swaps in a rebuilt knowledge base when it changes.
+# Set KB_RELOAD_INTERVAL=0 to disable (value is the poll interval in seconds).
+KB_RELOAD_INTERVAL = float(os.getenv("KB_RELOAD_INTERVAL", "2"))
+knowledge_base_reloader = None
+
+if KnowledgeBaseReloader and knowledge_base_data:
+    knowledge_base_reloader = KnowledgeBaseReloader(KNOWLEDGE_BASE_FILE, knowledge_base_data,
+                                                    poll_interval=KB_RELOAD_INTERVAL,
+                                                    extra_sources=KNOWLEDGE_BASE_EXTRA_SOURCES)
+    if KB_RELOAD_INTERVAL > 0:
+        knowledge_base_reloader.start()
+        print(f"JARVIS Backend: Watching {KNOWLEDGE_BASE_FILE} for changes every {KB_RELOAD_INTERVAL}s.")
+
+
+# --- Background Warm-up ---
+# The Gemini and Wikipedia clients are loaded on first use. The server entry points (python Main.py,
+# serve.py) load them ahead of time instead, unless WARM_UP=0, so the first chat turn doesn't wait.
+WARM_UP = os.getenv("WARM_UP", "1") != "0"
+
+
+def warm_up():
+    """Initializes the lazily loaded upstream clients (Gemini, wikipedia)."""
+    start_time = time.perf_counter()
+    if llm_backend:
+        llm_backend.load()
+    if get_wikipedia:
+        get_wikipedia()
+    print(f"JARVIS Backend: Upstream clients warmed up in {time.perf_counter() - start_time:.2f}s.")
+
+
+def start_warm_up():
+    """Runs warm_up() on a background thread, so requests are served meanwhile."""
+    if WARM_UP:
+        threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+
+
+def before_fork():
+    """Stops background threads before the process forks workers (see serve.py)."""
+    if knowledge_base_reloader:
+        knowledge_base_reloader.stop()
+    if chat_log:
+        chat_log.stop()
+
+
+def after_fork():
+    """Restarts per-process background work in a forked worker; threads don't survive fork()."""
+    global HISTORY_ETAG_SALT
+    HISTORY_ETAG_SALT = history_etag_salt()
+    if knowledge_base_reloader and KB_RELOAD_INTERVAL > 0:
+        knowledge_base_reloader.start()
+    if chat_log:
+        # Workers rotating one shared file would rename it under each other
+        chat_log.start(process_log_path(CHAT_LOG_FILE))
+
+
+def get_knowledge_base():
+    """Returns the current processed knowledge base (the latest reload, if any)."""
+    if knowledge_base_reloader:
+        return knowledge_base_reloader.knowledge_base
+    return knowledge_base_data
+
+
+# --- Local Answer Retrieval ---
+# General chat messages are first matched against the KB patterns and the Q&A files in
+# LOCAL_ANSWER_SOURCES (see local_retriever.py). Messages similar enough to a known question
+# (cosine similarity >= LOCAL_ANSWER_THRESHOLD) are answered locally instead of by Gemini.
+# Set LOCAL_ANSWER_THRESHOLD=0 to send every general chat message upstream.
+LOCAL_ANSWER_THRESHOLD = float(os.getenv("LOCAL_ANSWER_THRESHOLD", "0.8"))
+LOCAL_ANSWER_SOURCES = [path.strip() for path in
+                        os.getenv("LOCAL_ANSWER_SOURCES", "knowledge_base.py,responses.json").split(",")
+                        if path.strip()]
+local_answer_documents = []
+if LocalRetriever and LOCAL_ANSWER_THRESHOLD > 0:
+    for source_path in LOCAL_ANSWER_SOURCES:
+        local_answer_documents.extend(read_qa_file(source_path))
+
+_local_retriever = None
+_local_retriever_kb = None  # The knowledge base _local_retriever was built from
+_local_retriever_lock = threading.Lock()
+
+
+def get_local_retriever(knowledge_base_data):
+    """Returns the local retriever for a knowledge base, rebuilding it after a KB reload."""
+    global _local_retriever, _local_retriever_kb
+    with _local_retriever_lock:
+        if _local_retriever_kb is not knowledge_base_data:
+            retriever = LocalRetriever(knowledge_base_documents(knowledge_base_data) + local_answer_documents,
+                                       LOCAL_ANSWER_THRESHOLD)
+            if _local_retriever:
+                # Keep the hit rate across reloads
+                retriever.queries, retriever.hits = _local_retriever.queries, _local_retriever.hits
+            _local_retriever, _local_retriever_kb = retriever, knowledge_base_data
+        return _local_retriever
+
+
+def find_local_answer(user_input, knowledge_base_data):
+    """Returns a confident local answer to a general chat message, or None to ask Gemini."""
+    if not LocalRetriever or LOCAL_ANSWER_THRESHOLD <= 0 or not knowledge_base_data:
+        return None
+    with metrics.span("local_answer"):
+        return get_local_retriever(knowledge_base_data).answer(user_input)
+
+
+def kb_response(user_input, knowledge_base_data, turn=None):
+    """
+    Returns get_response's reply from the knowledge base, recording its time,
+    its preprocessing time and the number of patterns it scored (and the
+    matched intent and score in turn, if given).
+    """
+    if not metrics.enabled and turn is None:
+        return get_response(user_input, knowledge_base_data)
+    stats = {}
+    with metrics.span("get_response"):
+        response_text = get_response(user_input, knowledge_base_data, stats=stats)
+    if "preprocess_seconds" in stats:
+        metrics.observe("preprocess_input", stats["preprocess_seconds"])
+        metrics.observe_count("scanned_patterns", stats["scanned_patterns"],
+                              "Knowledge base patterns scored per get_response call.")
+        if turn is not None:
+            turn["intent"], turn["score"] = stats["intent"], stats["score"]
+    return response_text
+
 
 # --- HTML Template (Rendered by Flask) ---
 # This is the HTML structure that Flask will render and send to the browser.
@@ -215,30 +705,26 @@ HTML_TEMPLATE = """
         </div>
 
         {# Sidebar Area - Displaying User Questions #}
-        <div class="sidebar-area bg-gray-700 text-white p-4 rounded-lg overflow-y-auto">
+        <div id="sidebar" class="sidebar-area bg-gray-700 text-white p-4 rounded-lg overflow-y-auto">
             <h2 class="text-lg font-bold mb-4">Your Questions</h2> {# Changed title to "Your Questions" #}
-            {# Iterate through chat history and display only user messages #}
-            {% for message in chat_history %}
-                {% if message.sender == 'user' %}
-                    <div class="old-chat-entry">
-                        {{ message.text }}
-                    </div>
-                {% endif %}
+            {# Only user messages; the script below renders new ones the same way #}
+            {% for message in chat_history if message.sender == 'user' %}
+                <div class="old-chat-entry">{{ message.text }}</div>
             {% endfor %}
         </div>
 
         {# Main Content Area (Chat Display) #}
         <div class="main-area chat-container">
              <h1 class="text-2xl font-bold mb-4 text-center text-gray-800">JARVIS Chat</h1> {# Changed main title #}
-            <div id="chatBox" class="flex-grow overflow-y-auto border border-gray-300 rounded-lg p-4 mb-4 space-y-4">
+            {# data-last-seq: newest message on the page, the script asks /messages for anything after it #}
+            <div id="chatBox" class="flex-grow overflow-y-auto border border-gray-300 rounded-lg p-4 mb-4 space-y-4"
+                 data-last-seq="{{ chat_history[-1].seq if chat_history else 0 }}" data-messages-url="{{ url_for('messages') }}">
                 {% for message in chat_history %}
-                    <div class="chat-message {{ message.sender }}-message {% if message.type == 'book_review' %}book-review-message{% endif %}">
-                        {% if message.type == 'book_review' %}
-                            <strong>Book Review:</strong> {{ message.text | safe }} {# Use safe filter to render <br> #}
-                        {% else %}
-                            {{ message.text }}
-                        {% endif %}
-                    </div>
+                    {% if message.type == 'book_review' %}
+                        <div class="chat-message {{ message.sender }}-message book-review-message"><strong>Book Review:</strong> {{ message.text | safe }}</div> {# Use safe filter to render <br> #}
+                    {% else %}
+                        <div class="chat-message {{ message.sender }}-message">{{ message.text }}</div>
+                    {% endif %}
                 {% endfor %}
             </div>
         </div>
@@ -246,7 +732,7 @@ HTML_TEMPLATE = """
         {# Input Area #}
         {# This form submits data to the /process_input route #}
         <div class="input-area bg-gray-800 p-4 rounded-lg flex items-center justify-center">
-             <form method="POST" action="{{ url_for('process_input') }}" class="flex w-full max-w-lg">
+             <form id="chatForm" method="POST" action="{{ url_for('process_input') }}" data-stream-url="{{ url_for('stream_response') }}" class="flex w-full max-w-lg">
                 <input
                     type="text"
                     name="user_input" {# Name attribute is important for form data #}
@@ -265,68 +751,251 @@ HTML_TEMPLATE = """
         </div>
 
     </div>
+
+    {# Progressive rendering: stream the reply from /stream instead of a full page reload. #}
+    {# Without response streams, the form is posted with fetch and only the new messages are #}
+    {# fetched from /messages; without fetch, it falls back to the normal form POST. #}
+    <script>
+        (function () {
+            var form = document.getElementById('chatForm');
+            var chatBox = document.getElementById('chatBox');
+            var sidebar = document.getElementById('sidebar');
+            if (!form || !window.fetch) {
+                return;
+            }
+            var lastSeq = parseInt(chatBox.dataset.lastSeq, 10) || 0;
+            var canStream = !!(window.ReadableStream && window.TextDecoder);
+
+            function addMessage(container, className, text) {
+                var div = document.createElement('div');
+                div.className = className;
+                div.textContent = text;
+                container.appendChild(div);
+                return div;
+            }
+
+            // Same markup as the server-rendered messages
+            function renderMessage(message) {
+                if (message.sender === 'user') {
+                    addMessage(sidebar, 'old-chat-entry', message.text);
+                }
+                var div = addMessage(chatBox, 'chat-message ' + message.sender + '-message', message.text);
+                if (message.type === 'book_review') {
+                    div.classList.add('book-review-message');
+                    div.innerHTML = '<strong>Book Review:</strong> ' + message.text;
+                }
+            }
+
+            // Appends the messages stored since lastSeq (e.g. from another tab). The
+            // server answers 304 when there are none, so this is cheap to call often.
+            function syncMessages() {
+                return fetch(chatBox.dataset.messagesUrl + '?since=' + lastSeq, {
+                    headers: {'Accept': 'application/json'}, credentials: 'same-origin'
+                }).then(function (response) {
+                    return response.ok ? response.json() : {messages: []};
+                }).then(function (data) {
+                    data.messages.forEach(function (message) {
+                        if (message.seq > lastSeq) {
+                            renderMessage(message);
+                            lastSeq = message.seq;
+                        }
+                    });
+                    chatBox.scrollTop = chatBox.scrollHeight;
+                });
+            }
+
+            document.addEventListener('visibilitychange', function () {
+                if (document.visibilityState === 'visible') { syncMessages(); }
+            });
+
+            form.addEventListener('submit', function (event) {
+                var input = form.elements['user_input'];
+                var userInput = input.value.trim();
+                if (!userInput) {
+                    return;
+                }
+                event.preventDefault();
+                var formData = new FormData(form);
+                input.value = '';
+
+                if (!canStream) {
+                    fetch(form.action, {
+                        method: 'POST', body: formData, headers: {'Accept': 'application/json'}, credentials: 'same-origin'
+                    }).then(syncMessages).catch(function () {
+                        window.location.reload();
+                    });
+                    return;
+                }
+
+                addMessage(sidebar, 'old-chat-entry', 'You: ' + userInput);
+                addMessage(chatBox, 'chat-message user-message', 'You: ' + userInput);
+                var botDiv = addMessage(chatBox, 'chat-message bot-message', 'JARVIS: ');
+                var responseText = '';
+                chatBox.scrollTop = chatBox.scrollHeight;
+
+                function handleEvent(rawEvent) {
+                    var eventName = 'message';
+                    var data = '';
+                    rawEvent.split('\\n').forEach(function (line) {
+                        if (line.indexOf('event: ') === 0) { eventName = line.slice(7); }
+                        else if (line.indexOf('data: ') === 0) { data += line.slice(6); }
+                    });
+                    if (!data) { return; }
+                    var payload = JSON.parse(data);
+                    if (eventName === 'chunk' && payload.type === 'book_review') {
+                        // Book reviews are HTML, same markup as the server-rendered messages
+                        responseText += payload.text;
+                        botDiv.classList.add('book-review-message');
+                        botDiv.innerHTML = '<strong>Book Review:</strong> JARVIS: ' + responseText;
+                    } else if (eventName === 'chunk') {
+                        responseText += payload.text;
+                        botDiv.textContent = 'JARVIS: ' + responseText;
+                    } else if (eventName === 'error' && !responseText) {
+                        responseText = payload.text;
+                        botDiv.textContent = 'JARVIS: ' + responseText;
+                    } else if (eventName === 'done') {
+                        if (payload.type === 'book_review') {
+                            // Same markup as the server-rendered book review messages
+                            botDiv.classList.add('book-review-message');
+                            botDiv.innerHTML = '<strong>Book Review:</strong> JARVIS: ' + responseText;
+                        }
+                        // The streamed messages are already on the page
+                        if (payload.seq) { lastSeq = Math.max(lastSeq, payload.seq); }
+                    }
+                    chatBox.scrollTop = chatBox.scrollHeight;
+                }
+
+                fetch(form.dataset.streamUrl, {method: 'POST', body: formData}).then(function (response) {
+                    var reader = response.body.getReader();
+                    var decoder = new TextDecoder();
+                    var buffer = '';
+                    function read() {
+                        return reader.read().then(function (result) {
+                            if (result.done) { return; }
+                            buffer += decoder.decode(result.value, {stream: true});
+                            var events = buffer.split('\\n\\n');
+                            buffer = events.pop();
+                            events.forEach(handleEvent);
+                            return read();
+                        });
+                    }
+                    return read();
+                }).catch(function () {
+                    // Streaming failed; reload so the page shows the stored history
+                    window.location.reload();
+                });
+            });
+        })();
+    </script>
 </body>
 </html>
 """
 
-# --- Route for the main chat page ---
-@app.route('/')
-def index():
-    """
-    Renders the initial chat page or the current state of the chat.
-    """
-    # Initialize chat history in session if it doesn't exist
-    if 'chat_history' not in session:
-        initial_message = "JARVIS: Hello! I'm your friendly AI assistant."
-        if gemini_available:
-             initial_message += " I can answer general questions using Gemini."
-        initial_message += " Type 'Book review <title>' to get details about a book."
-        initial_message += " Type 'quit', 'bye', or 'exit' to end the session (in console)."
+# Compiled once; render_template_string would re-parse and re-compile it on every request
+CHAT_PAGE_TEMPLATE = app.jinja_env.from_string(HTML_TEMPLATE)
 
-        session['chat_history'] = [{'sender': 'bot', 'text': initial_message, 'type': 'chat'}]
+# ETags of the chat page and /messages are derived from the session's newest sequence number.
+# In-memory histories restart their sequence numbers with the process, so they also get a per-process
+# token (renewed in forked workers by after_fork, as each worker has its own histories).
+def history_etag_salt():
+    salt = hashlib.sha1(HTML_TEMPLATE.encode("utf-8")).hexdigest()[:12]
+    if CHAT_HISTORY_BACKEND != "sqlite":
+        salt += uuid.uuid4().hex[:8]
+    return salt
 
-    # Render the HTML template with the current chat history
-    return render_template_string(HTML_TEMPLATE, chat_history=session.get('chat_history', []))
 
-# --- Route to process user input from the form ---
-@app.route('/process_input', methods=['POST'])
-def process_input():
+HISTORY_ETAG_SALT = history_etag_salt()
+
+
+def history_etag(*parts):
+    """Returns an ETag for a view of the current session's history identified by parts."""
+    key = "|".join(str(part) for part in (HISTORY_ETAG_SALT, get_session_id()) + parts)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()
+
+
+def conditional_response(etag, build_response):
     """
-    Receives input from the HTML form, processes it using either
-    specific commands (like Book Review) or the Gemini model for general chat,
-    updates chat history, and redirects back to the index page.
+    Returns 304 Not Modified if the client already has etag, otherwise the
+    response from build_response() tagged with it. Either way the client is
+    told to revalidate before reusing its copy.
     """
-    # Check if knowledge base is loaded (needed for get_response and exit commands)
-    if not knowledge_base_data or not knowledge_base_data.get("intents"):
-         if 'chat_history' not in session:
-              session['chat_history'] = []
-         session['chat_history'].append({'sender': 'bot', 'text': "JARVIS: Backend error: Knowledge base not loaded.", 'type': 'chat'})
-         session.modified = True
-         return redirect(url_for('index'))
+    if etag in request.if_none_match:
+        response = Response(status=304)
+    else:
+        response = build_response()
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
-    # Get user input from the form data
-    user_input = request.form.get('user_input', '').strip()
 
-    if not user_input:
-        # If input is empty, just redirect back without adding a message
-        return redirect(url_for('index'))
+def wants_json():
+    """True if the request came from the chat page's script rather than a plain form post."""
+    return request.accept_mimetypes.best == 'application/json'
+
+
+def redirect_after_post():
+    """Sends a form post back to the chat page; the page's script gets 204 and fetches /messages instead."""
+    return Response(status=204) if wants_json() else redirect(url_for('index'))
+
+
+# --- Response generation shared by /process_input and /stream ---
+EXIT_COMMANDS = ["quit", "bye", "exit"]
 
-    # Add user message to chat history
-    if 'chat_history' not in session:
-        session['chat_history'] = []
-    session['chat_history'].append({'sender': 'user', 'text': f"You: {user_input}", 'type': 'chat'})
 
-    # --- Limit Session History Size ---
-    # Keep only the last N messages to prevent the cookie from getting too large.
-    # Adjust the number (e.g., 20, 30, 40) based on how long your messages are
-    # and the browser's cookie limit (typically around 4093 bytes).
-    # Keeping 30 messages (15 user + 15 bot) is a reasonable starting point.
-    MAX_HISTORY_SIZE = 30
-    if len(session['chat_history']) > MAX_HISTORY_SIZE:
-        # Keep the last MAX_HISTORY_SIZE messages
-        session['chat_history'] = session['chat_history'][-MAX_HISTORY_SIZE:]
+def is_general_chat(user_input):
+    """True if the input is not a command (book review or exit) and goes to general chat."""
+    user_input_lower = user_input.lower()
+    return not user_input_lower.startswith("book review") and user_input_lower not in EXIT_COMMANDS
+
+
+# Maximum number of titles looked up for one "Book review A; B; C" request
+MAX_BOOK_REVIEW_TITLES = int(os.getenv("MAX_BOOK_REVIEW_TITLES", "10"))
+
 
+def is_book_review_batch(user_input):
+    """True if the input is a book review command with more than one title."""
+    return user_input.lower().startswith("book review") and len(parse_book_titles(user_input)) > 1
 
+
+def parse_book_titles(user_input):
+    """Extracts the ';'-separated titles after "book review" (at most MAX_BOOK_REVIEW_TITLES)."""
+    titles = [title.strip() for title in user_input[len("book review"):].split(";")]
+    return [title for title in titles if title][:MAX_BOOK_REVIEW_TITLES]
+
+
+def book_details_html(details):
+    """
+    Book details text as HTML for a book_review message, which the chat page
+    renders unescaped: escaped (it can quote the user's title), newlines as <br>.
+    """
+    return html.escape(details).replace('\n', '<br>')
+
+
+def fetch_book_reviews(book_titles):
+    """
+    Looks up several book titles concurrently and yields one formatted
+    (HTML) review per title, in the order the lookups finish.
+    The whole batch holds a single slot in the Wikipedia pool.
+    """
+    try:
+        with metrics.span("wikipedia_fetch"), wikipedia_pool.slot() if wikipedia_pool else contextlib.nullcontext():
+            for book_title, details in fetch_book_details_batch(book_titles, timeout=WIKIPEDIA_TIMEOUT):
+                yield f"<strong>{html.escape(book_title)}</strong>: {book_details_html(details)}"
+    except UpstreamBusyError:
+        yield BUSY_RESPONSE
+
+
+def generate_bot_response(user_input, knowledge_base_data, turn=None, session_id=None, client_keys=None):
+    """
+    Produces the bot's reply to one user message, using either specific
+    commands (like Book Review) or the Gemini model for general chat
+    (with the conversation of session_id, by default the current session).
+    Returns (response_text, response_type). If turn (a dict) is given, it
+    receives what the chat log records: the route taken, the matched intent
+    and score, the outcome, the prompt size and the upstream call's time.
+    Book lookups and LLM calls count against client_keys' rate limits.
+    """
+    turn = {} if turn is None else turn
     # Convert user input to lowercase for command checking
     user_input_lower = user_input.lower()
 
@@ -336,15 +1005,37 @@ def process_input():
 
     # Check for the "Book review" command
     if user_input_lower.startswith("book review"):
-        if fetch_book_details_from_wikipedia:
-            # Attempt to extract the title after "book review"
-            book_title = user_input[len("book review"):].strip()
-            if book_title:
-                print(f"JARVIS Backend: Processing book review request for: '{book_title}'")
-                response_text = fetch_book_details_from_wikipedia(book_title)
+        turn["route"] = "book"
+        retry_after = rate_limit_wait(client_keys, "book") if fetch_book_details_from_wikipedia else 0.0
+        if retry_after:
+            turn["outcome"] = "rate_limited"
+            response_text = book_rate_limited_text(retry_after)
+            response_type = "chat"
+        elif fetch_book_details_from_wikipedia:
+            # Attempt to extract the title(s) after "book review" ("Book review A; B; C")
+            book_titles = parse_book_titles(user_input)
+            if len(book_titles) > 1:
+                print(f"JARVIS Backend: Processing batch book review request for: {book_titles}")
+                with timing(turn, "upstream_ms"):
+                    response_text = "<br><br>".join(text for text in fetch_book_reviews(book_titles))
                 response_type = "book_review"
-                # Replace newlines with <br> for HTML rendering
-                response_text = response_text.replace('\n', '<br>')
+            elif book_titles:
+                book_title = book_titles[0]
+                print(f"JARVIS Backend: Processing book review request for: '{book_title}'")
+                try:
+                    with metrics.span("wikipedia_fetch"), timing(turn, "upstream_ms"):
+                        response_text = call_upstream(wikipedia_pool, fetch_book_details_from_wikipedia, book_title)
+                    response_type = "book_review"
+                    response_text = book_details_html(response_text)
+                except UpstreamBusyError:
+                    turn["outcome"] = "busy"
+                    response_text = BUSY_RESPONSE
+                    response_type = "chat"
+                except UpstreamTimeoutError:
+                    turn["outcome"] = "timeout"
+                    print(f"JARVIS Backend: Wikipedia lookup for '{book_title}' timed out.")
+                    response_text = "Sorry, Wikipedia took too long to respond. Please try again."
+                    response_type = "chat"
             else:
                 response_text = "Please provide the book title after 'Book review'."
                 response_type = "chat"
@@ -354,9 +1045,10 @@ def process_input():
 
     # Check for exit commands (these are handled by the frontend user typing them)
     # We still process them here to potentially give a final message from KB
-    elif user_input_lower in ["quit", "bye", "exit"]:
+    elif user_input_lower in EXIT_COMMANDS:
+        turn["route"] = "exit"
         if get_response:
-            response_text = get_response(user_input_lower, knowledge_base_data)
+            response_text = kb_response(user_input_lower, knowledge_base_data, turn)
         else:
             response_text = "Chat functionality is not available due to module import errors."
         response_type = "chat"
@@ -364,38 +1056,373 @@ def process_input():
         # You could add logic here to clear the session if desired.
 
 
-    # Handle General Chat using Gemini or KB fallback
+    # Handle General Chat: a confident local answer, else the LLM (Gemini), else KB fallback
     else:
-        print(f"JARVIS Backend: Processing general chat message with Gemini: '{user_input}'")
-        if gemini_available and gemini_model:
+        local_answer = find_local_answer(user_input, knowledge_base_data)
+        backend = get_llm_backend() if local_answer is None else None
+        if local_answer is not None:
+            print(f"JARVIS Backend: Answered general chat message locally: '{user_input}'")
+            turn["route"] = "local"
+            response_text = local_answer
+            response_type = "chat"
+        elif backend:
+            print(f"JARVIS Backend: Processing general chat message with {backend.label}: '{user_input}'")
+            turn["route"] = "llm"
             try:
-                # Send the user input to the Gemini model
-                gemini_response = gemini_model.generate_content(user_input)
-                response_text = gemini_response.text
+                # Send the user input and earlier conversation to the model (or reuse a cached reply)
+                prompt = build_llm_prompt(user_input, session_id or get_session_id(), turn)
+                with timing(turn, "upstream_ms"):
+                    response_text = generate_llm_text(backend, prompt, gemini_cache_key(backend, user_input, prompt),
+                                                      client_keys)
+                response_type = "chat"
+            except LLMRateLimitedError:
+                # Over the LLM budget: the knowledge base answers instead
+                turn.update(route="kb", outcome="rate_limited")
+                response_text = kb_response(user_input, knowledge_base_data, turn)
+                response_type = "chat"
+            except UpstreamBusyError:
+                turn["outcome"] = "busy"
+                response_text = BUSY_RESPONSE
+                response_type = "chat"
+            except LLM_TIMEOUT_ERRORS:
+                turn["outcome"] = "timeout"
+                print(f"JARVIS Backend: {backend.label} call timed out.")
+                response_text = "Sorry, the AI model took too long to respond. Please try again."
                 response_type = "chat"
             except Exception as e:
-                print(f"Error generating content with Gemini: {e}")
+                turn["outcome"] = "error"
+                print(f"Error generating content with {backend.label}: {e}")
                 response_text = "Sorry, I encountered an error trying to use the AI model."
                 response_type = "chat"
         elif get_response:
-             # Fallback to the knowledge base if Gemini is not available
+             # Fallback to the knowledge base if Gemini is not available (or over its rate limit)
              print("JARVIS Backend: Gemini not available, falling back to Knowledge Base.")
-             response_text = get_response(user_input, knowledge_base_data)
+             turn["route"] = "kb"
+             response_text = kb_response(user_input, knowledge_base_data, turn)
              response_type = "chat"
         else:
             # Final fallback if neither Gemini nor KB is available
             response_text = "I'm currently unable to process chat messages."
             response_type = "chat"
 
+    return response_text, response_type
 
-    # Add bot response to chat history
-    session['chat_history'].append({'sender': 'bot', 'text': f"JARVIS: {response_text}", 'type': response_type})
 
-    # Mark the session as modified to ensure it's saved
-    session.modified = True
+# --- Route for the main chat page ---
+@app.route('/')
+def index():
+    """
+    Renders the initial chat page or the current state of the chat.
+    """
+    # Start the chat history with a greeting if this session has none yet
+    chat_history = get_chat_history()
+    # Not get_llm_backend(): loading Gemini here would put its import on the first page view
+    backend = llm_backend if llm_backend and llm_backend.available() else None
+    if not chat_history:
+        initial_message = "JARVIS: Hello! I'm your friendly AI assistant."
+        if backend:
+             initial_message += f" I can answer general questions using {backend.label}."
+        initial_message += " Type 'Book review <title>' to get details about a book."
+        initial_message += " Type 'quit', 'bye', or 'exit' to end the session (in console)."
+
+        add_chat_message('bot', initial_message)
+        chat_history = get_chat_history()
+
+    # Render the HTML template with the current chat history, unless the browser's copy is current
+    last_seq = chat_history[-1].get('seq', 0)
+    return conditional_response(
+        history_etag('page', last_seq, backend and backend.label),
+        lambda: Response(render_chat_page(chat_history)))
+
+
+def render_chat_page(chat_history):
+    """Renders the chat page for chat_history."""
+    with metrics.span("template_render"):
+        return render_template(CHAT_PAGE_TEMPLATE, chat_history=chat_history)
+
+
+# --- Route returning only the messages the page doesn't have yet ---
+@app.route('/messages')
+def messages():
+    """
+    Returns the current session's messages with a sequence number greater than
+    ?since= as JSON ({"messages": [...], "last_seq": n}), so the chat page can
+    append them instead of reloading. Answers 304 if nothing new was added.
+    """
+    since_seq = request.args.get('since', default=0, type=int)
+    new_messages = []
+    if history_store:
+        with metrics.span("history_read"):
+            new_messages = history_store.get_history(get_session_id(), since_seq=since_seq)
+    last_seq = new_messages[-1]['seq'] if new_messages else since_seq
+    return conditional_response(
+        history_etag('messages', since_seq, last_seq),
+        lambda: jsonify(messages=new_messages, last_seq=last_seq))
+
+
+# --- Route to process user input from the form ---
+@app.route('/process_input', methods=['POST'])
+def process_input():
+    """
+    Receives input from the HTML form, processes it using either
+    specific commands (like Book Review) or the Gemini model for general chat,
+    updates chat history, and redirects back to the index page (or, for the
+    page's script, answers 204 so it can fetch just the new messages from /messages).
+    """
+
+    start_time = time.perf_counter()
+    # Take one reference to the knowledge base so a reload mid-request can't mix versions
+    knowledge_base_data = get_knowledge_base()
+
+    # Check if knowledge base is loaded (needed for get_response and exit commands)
+    if not knowledge_base_data or not knowledge_base_data.get("intents"):
+         add_chat_message('bot', "JARVIS: Backend error: Knowledge base not loaded.")
+         return redirect_after_post()
+
+    # Get user input from the form data
+    user_input = request.form.get('user_input', '').strip()
+
+    if not user_input:
+        # If input is empty, just redirect back without adding a message
+        return redirect_after_post()
+
+    client_keys = rate_limit_keys()
+    retry_after = rate_limit_wait(client_keys, "kb")
+    if retry_after:
+        return rate_limited_response(retry_after)
+
+    # Add user message to chat history
+    # (stored server-side, so its length is limited by CHAT_HISTORY_LIMIT rather than the cookie size)
+    add_chat_message('user', f"You: {user_input}")
+
+    turn = {}
+    response_text, response_type = generate_bot_response(user_input, knowledge_base_data, turn,
+                                                         client_keys=client_keys)
+
+    # Add bot response to chat history
+    add_chat_message('bot', f"JARVIS: {response_text}", response_type)
+    log_chat_turn('process_input', get_session_id(), user_input, response_type, turn, start_time)
 
     # Redirect back to the index page to display the updated chat history
-    return redirect(url_for('index'))
+    return redirect_after_post()
+
+
+# --- Route to stream a response as Server-Sent Events ---
+def format_sse(event, data):
+    """Formats one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+@app.route('/stream', methods=['POST'])
+def stream_response():
+    """
+    Streaming variant of /process_input used by the chat page's JavaScript.
+    General chat messages are streamed from Gemini chunk by chunk as 'chunk'
+    events; other messages (local answers, book review, exit commands, KB
+    fallback) are sent as a single chunk. A final 'done' event carries the response type, the
+    stored message's sequence number and the time to first token. The full
+    response is saved to the chat history once the stream completes.
+    """
+    knowledge_base_data = get_knowledge_base()
+    user_input = request.form.get('user_input', '').strip()
+    if not user_input:
+        return Response(status=204)
+
+    client_keys = rate_limit_keys()
+    retry_after = rate_limit_wait(client_keys, "kb")
+    if retry_after:
+        return rate_limited_response(retry_after, event_stream=True)
+
+    # The generator runs after the request context is gone, so resolve the session id now
+    session_id = get_session_id()
+    add_chat_message('user', f"You: {user_input}", session_id=session_id)
+
+    def event_stream():
+        start_time = time.perf_counter()
+        first_token_ms = None
+        turn = {}
+
+        backend = get_llm_backend() if is_general_chat(user_input) else None
+        # Without an LLM, generate_bot_response (below) tries the local answer itself
+        local_answer = find_local_answer(user_input, knowledge_base_data) if backend else None
+        prompt = cache_key = cached_text = None
+        llm_limited = False
+        if backend is not None and local_answer is None:
+            prompt = build_llm_prompt(user_input, session_id, turn)
+            cache_key = gemini_cache_key(backend, user_input, prompt) if gemini_cache else None
+            cached_text = gemini_cache.get(cache_key) if cache_key else None
+            # Only replies the backend has to generate are charged to the LLM budget
+            llm_limited = cached_text is None and rate_limit_wait(client_keys, "llm") > 0
+
+        if not knowledge_base_data or not knowledge_base_data.get("intents"):
+            response_text, response_type = "Backend error: Knowledge base not loaded.", "chat"
+            turn["outcome"] = "error"
+            yield format_sse('chunk', {'text': response_text})
+
+        elif local_answer is not None:
+            print(f"JARVIS Backend: Answered general chat message locally: '{user_input}'")
+            response_text, response_type = local_answer, "chat"
+            turn["route"] = "local"
+            first_token_ms = (time.perf_counter() - start_time) * 1000
+            yield format_sse('chunk', {'text': response_text, 'type': response_type})
+
+        elif llm_limited:
+            # Over the LLM budget: the knowledge base answers instead
+            response_text, response_type = kb_response(user_input, knowledge_base_data, turn), "chat"
+            turn.update(route="kb", outcome="rate_limited")
+            first_token_ms = (time.perf_counter() - start_time) * 1000
+            yield format_sse('chunk', {'text': response_text, 'type': response_type})
+
+        elif backend:
+            print(f"JARVIS Backend: Streaming general chat message with {backend.label}: '{user_input}'")
+            response_type = "chat"
+            turn["route"] = "llm"
+            parts = []
+            if cached_text is not None:
+                first_token_ms = (time.perf_counter() - start_time) * 1000
+                parts.append(cached_text)
+                yield format_sse('chunk', {'text': cached_text})
+            else:
+                stream_completed = False
+                try:
+                    # The stream is consumed on this thread, so it only holds a slot in the Gemini pool
+                    with metrics.span("llm_stream"), gemini_pool.slot() if gemini_pool else contextlib.nullcontext():
+                        stream_start_time = time.perf_counter()
+                        for text in backend.stream(prompt, GEMINI_TIMEOUT):
+                            if first_token_ms is None:
+                                first_token_ms = (time.perf_counter() - start_time) * 1000
+                                metrics.observe("llm_first_token", time.perf_counter() - stream_start_time)
+                            parts.append(text)
+                            yield format_sse('chunk', {'text': text})
+                    stream_completed = True
+                except UpstreamBusyError:
+                    turn["outcome"] = "busy"
+                    parts.append(BUSY_RESPONSE)
+                    yield format_sse('chunk', {'text': BUSY_RESPONSE})
+                except LLM_TIMEOUT_ERRORS:
+                    turn["outcome"] = "timeout"
+                    print(f"JARVIS Backend: {backend.label} stream timed out.")
+                    timeout_text = "Sorry, the AI model took too long to respond. Please try again."
+                    yield format_sse('error', {'text': timeout_text})
+                    if not parts:
+                        parts.append(timeout_text)
+                except Exception as e:
+                    turn["outcome"] = "error"
+                    print(f"Error streaming content with {backend.label}: {e}")
+                    error_text = "Sorry, I encountered an error trying to use the AI model."
+                    yield format_sse('error', {'text': error_text})
+                    if not parts:
+                        parts.append(error_text)
+                # Only complete streams are cached
+                if stream_completed and cache_key and parts:
+                    gemini_cache.put(cache_key, "".join(parts))
+            response_text = "".join(parts)
+
+        elif is_book_review_batch(user_input) and fetch_book_details_batch:
+            # Send each title's review as soon as its lookup finishes
+            response_type = "book_review"
+            turn["route"] = "book"
+            reviews = []
+            retry_after = rate_limit_wait(client_keys, "book")
+            if retry_after:
+                turn["outcome"] = "rate_limited"
+                response_type = "chat"
+                reviews.append(book_rate_limited_text(retry_after))
+                yield format_sse('chunk', {'text': reviews[0], 'type': response_type})
+            else:
+                for review in fetch_book_reviews(parse_book_titles(user_input)):
+                    if first_token_ms is None:
+                        first_token_ms = (time.perf_counter() - start_time) * 1000
+                    text = review if not reviews else "<br><br>" + review
+                    reviews.append(text)
+                    yield format_sse('chunk', {'text': text, 'type': response_type})
+            response_text = "".join(reviews)
+
+        else:
+            response_text, response_type = generate_bot_response(user_input, knowledge_base_data, turn, session_id,
+                                                                 client_keys)
+            first_token_ms = (time.perf_counter() - start_time) * 1000
+            yield format_sse('chunk', {'text': response_text, 'type': response_type})
+
+        seq = add_chat_message('bot', f"JARVIS: {response_text}", response_type, session_id=session_id)
+        log_chat_turn('stream', session_id, user_input, response_type, turn, start_time,
+                      ttft_ms=round(first_token_ms, 2) if first_token_ms is not None else None)
+        if first_token_ms is not None:
+            print(f"JARVIS Backend: Stream time to first token: {first_token_ms:.1f} ms")
+        yield format_sse('done', {'type': response_type, 'seq': seq, 'ttft_ms': first_token_ms})
+
+    return Response(event_stream(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+# --- Knowledge base reload status ---
+@app.route('/kb_status')
+def kb_status():
+    """
+    Reports knowledge base reload statistics (reload count, last build duration, ...)
+    and how many general chat messages were answered locally instead of by Gemini
+    (plus chat log record counts, prompt sizes, the context summary cache hit rate
+    and rate limiter decisions).
+    """
+    if not knowledge_base_reloader:
+        stats = {"reload_enabled": False}
+    else:
+        stats = knowledge_base_reloader.get_stats()
+        stats["reload_enabled"] = KB_RELOAD_INTERVAL > 0
+    if _local_retriever:
+        stats["local_answers"] = _local_retriever.get_stats()
+    if chat_log:
+        stats["chat_log"] = chat_log.get_stats()
+    if context_builder:
+        stats["context"] = context_builder.get_stats()
+    if rate_limiter:
+        stats["rate_limits"] = rate_limiter.get_stats()
+    return jsonify(stats)
+
+
+# --- Metrics in the Prometheus text format ---
+@app.route('/metrics')
+def metrics_endpoint():
+    """
+    Serves the span latency histograms (jarvis_span_seconds{span=...}), the
+    scanned-pattern and prompt-size histograms and upstream pool, reply cache,
+    chat log, context summary and rate limiter counters in the Prometheus text format. Under serve.py each worker reports its own numbers.
+    """
+    if not metrics.enabled:
+        return Response("Metrics are disabled (METRICS_ENABLED=0).\n", status=404, mimetype='text/plain')
+    parts = [metrics.render()]
+    pools = [pool for pool in (gemini_pool, wikipedia_pool) if pool]
+    if pools:
+        pool_stats = [({"pool": pool.name}, pool.get_stats()) for pool in pools]
+        parts.append(format_metric("jarvis_upstream_in_flight", "Upstream calls holding a pool slot.", "gauge",
+                                   [(labels, stats["in_flight"]) for labels, stats in pool_stats]))
+        for key, help_text in (("completed", "Upstream calls completed."),
+                               ("rejected", "Upstream calls turned away because the pool was busy."),
+                               ("timed_out", "Upstream calls that missed their deadline.")):
+            parts.append(format_metric(f"jarvis_upstream_{key}_total", help_text, "counter",
+                                       [(labels, stats[key]) for labels, stats in pool_stats]))
+    if gemini_cache:
+        cache_stats = gemini_cache.get_stats()
+        parts.append(format_metric("jarvis_llm_cache_lookups_total", "LLM reply cache lookups by result.", "counter",
+                                   [({"result": result}, cache_stats[key]) for result, key in
+                                    (("hit", "hits"), ("disk_hit", "disk_hits"), ("miss", "misses"))]))
+    if chat_log:
+        log_stats = chat_log.get_stats()
+        parts.append(format_metric("jarvis_chat_log_records_total", "Chat log records by outcome.", "counter",
+                                   [({"result": result}, log_stats[result]) for result in ("written", "dropped")]))
+    if context_builder:
+        context_stats = context_builder.get_stats()
+        parts.append(format_metric("jarvis_context_summary_total",
+                                   "Conversation summary lookups: cached summary reused (hit) or compacted (update).",
+                                   "counter", [({"result": "hit"}, context_stats["summary_hits"]),
+                                               ({"result": "update"}, context_stats["summary_updates"])]))
+    if rate_limiter:
+        parts.append(format_metric("jarvis_rate_limit_decisions_total",
+                                   "Rate limiter decisions by route class and result (admitted or the limit hit).",
+                                   "counter", [({"route": route_class, "result": result}, count)
+                                               for route_class, counts in sorted(rate_limiter.get_stats().items())
+                                               for result, count in sorted(counts.items())]))
+    return Response("".join(parts), mimetype='text/plain; version=0.0.4')
 
 
 # --- Basic Root Endpoint (Optional - redirects to index) ---
@@ -408,5 +1435,8 @@ def old_index():
 if __name__ == '__main__':
     # Run the Flask development server
     print("JARVIS Backend: Starting Flask server (Gemini Integrated)...")
+    # With debug=True the code runs in a reloader child process; only warm that one up
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        start_warm_up()
     # Use debug=True for development
     app.run(debug=True, port=5000)
@@ -0,0 +1,136 @@
+# batch_scoring.py
+# Vectorized (NumPy) scoring backend for Chat_utils.get_responses.
+# Scores a whole batch of preprocessed inputs against the knowledge base at once,
+# using sparse token-incidence matrices in COO form, and returns the same winners
+# as the scalar find_best_match path.
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def build_token_incidence(knowledge_base: dict):
+    """
+    Encodes the preprocessed KB patterns as a sparse token-incidence matrix.
+
+    Patterns are numbered by their id in the knowledge base's IntentTable
+    (intent order, then pattern order), which is also the scalar path's
+    tie-break order. The matrix is stored column-wise (token -> pattern ids),
+    which is what the batch overlap computation needs; the columns are the
+    keyword index postings. Returns None if NumPy is not installed.
+    """
+    if np is None:
+        return None
+
+    intents = knowledge_base["intents"]
+    token_ids = {}
+    indptr = [0]
+    indices = []
+    for token, pattern_ids in knowledge_base["keyword_index"].items():
+        token_ids[token] = len(token_ids)
+        indices.extend(pattern_ids)  # Already in ascending order
+        indptr.append(len(indices))
+
+    return {
+        "token_ids": token_ids,
+        "indptr": np.asarray(indptr, dtype=np.int64),
+        "indices": np.asarray(indices, dtype=np.int64),
+        "pattern_intent": np.asarray(intents.pattern_intent, dtype=np.int64),
+        "pattern_sizes": np.asarray(intents.pattern_sizes, dtype=np.int64),
+    }
+
+
+def score_batch(processed_inputs, knowledge_base: dict, incidence: dict):
+    """
+    Scores a batch of preprocessed inputs. Returns a list with one entry per
+    input: (intent_index, score) for the winning pattern, or None if nothing
+    matched. Empty inputs are reported as None.
+    """
+    n_inputs = len(processed_inputs)
+    n_patterns = len(incidence["pattern_sizes"])
+    if n_inputs == 0:
+        return []
+    if n_patterns == 0:
+        return [None] * n_inputs
+
+    token_ids = incidence["token_ids"]
+    indptr = incidence["indptr"]
+    indices = incidence["indices"]
+    pattern_sizes = incidence["pattern_sizes"]
+
+    # --- Input incidence matrix (COO): one (input, token) entry per distinct known token ---
+    input_rows = []
+    input_tokens = []
+    for row, processed_input in enumerate(processed_inputs):
+        for token in set(processed_input.split()):
+            token_id = token_ids.get(token)
+            if token_id is not None:
+                input_rows.append(row)
+                input_tokens.append(token_id)
+
+    # --- Keyword overlap: inputs x patterns = input_incidence @ pattern_incidence.T ---
+    # Expand every (input, token) entry into the token's pattern postings and count
+    # how many times each (input, pattern) pair occurs; that count is the number
+    # of common keywords.
+    if input_rows:
+        input_rows = np.asarray(input_rows, dtype=np.int64)
+        input_tokens = np.asarray(input_tokens, dtype=np.int64)
+        starts = indptr[input_tokens]
+        lengths = indptr[input_tokens + 1] - starts
+        total = int(lengths.sum())
+        row_of_posting = np.repeat(input_rows, lengths)
+        offsets = np.arange(total, dtype=np.int64) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pattern_of_posting = indices[np.repeat(starts, lengths) + offsets]
+        pair_keys, common = np.unique(row_of_posting * n_patterns + pattern_of_posting, return_counts=True)
+    else:
+        pair_keys = np.zeros(0, dtype=np.int64)
+        common = np.zeros(0, dtype=np.int64)
+
+    pair_rows = pair_keys // n_patterns
+    pair_patterns = pair_keys % n_patterns
+    sizes = pattern_sizes[pair_patterns]
+
+    # --- Keyword scores: 5 per common keyword, +20+len for a full match, +10 above 60% ---
+    full_match = common == sizes
+    ratio_match = ~full_match & (common * 5 > sizes * 3)  # common / size > 0.6, in integers
+    scores = common * 5 + np.where(full_match, 20 + sizes, 0) + np.where(ratio_match, 10, 0)
+
+    # --- Exact phrase matches replace the keyword score of the matched pattern ---
+    phrase_automaton = knowledge_base.get("phrase_automaton")
+    exact_rows = []
+    exact_patterns = []
+    exact_scores = []
+    if phrase_automaton is not None:
+        for row, processed_input in enumerate(processed_inputs):
+            if not processed_input:
+                continue
+            for pattern_length, pattern_id in phrase_automaton.find(processed_input):
+                exact_rows.append(row)
+                exact_patterns.append(pattern_id)
+                exact_scores.append(100 + pattern_length)
+
+    if exact_rows:
+        exact_keys = np.asarray(exact_rows, dtype=np.int64) * n_patterns + np.asarray(exact_patterns, dtype=np.int64)
+        keep = ~np.isin(pair_keys, exact_keys)
+        pair_rows = np.concatenate([pair_rows[keep], np.asarray(exact_rows, dtype=np.int64)])
+        pair_patterns = np.concatenate([pair_patterns[keep], np.asarray(exact_patterns, dtype=np.int64)])
+        scores = np.concatenate([scores[keep], np.asarray(exact_scores, dtype=np.int64)])
+
+    # --- Winner per input: highest score, then earliest pattern in the KB ---
+    results = [None] * n_inputs
+    if len(scores) == 0:
+        return results
+    order = np.lexsort((pair_patterns, -scores, pair_rows))
+    sorted_rows = pair_rows[order]
+    first_of_row = np.ones(len(order), dtype=bool)
+    first_of_row[1:] = sorted_rows[1:] != sorted_rows[:-1]
+    winners = order[first_of_row]
+
+    pattern_intent = incidence["pattern_intent"]
+    for row, pattern, score in zip(pair_rows[winners].tolist(),
+                                   pair_patterns[winners].tolist(),
+                                   scores[winners].tolist()):
+        if processed_inputs[row]:
+            results[row] = (int(pattern_intent[pattern]), int(score))
+    return results
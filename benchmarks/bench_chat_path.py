@@ -0,0 +1,138 @@
+# bench_chat_path.py
+# Offline load test of the whole general-chat request path: starts serve.py with the fake LLM
+# backend (see llm_backend.py), so no network access or API key is needed, and sends
+# concurrent /stream requests with distinct prompts (local answers and the reply cache are
+# off, so every request reaches the backend). Reports throughput, latency percentiles (time to
+# first chunk and full reply) and how many requests the upstream pool turned away as busy.
+#
+# Usage: python benchmarks/bench_chat_path.py [--concurrency N] [--requests N] [--workers N]
+#            [--fake-options "latency_ms=500,latency_sigma=0.5,tokens_per_second=50,error_rate=0.01"]
+#            [--pool-size N] [--max-in-flight N]
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+import urllib.parse
+
+from bench_serve import ROOT, wait_until_ready
+
+BUSY_TEXT = "I'm handling a lot of requests right now."
+
+
+def percentile(values, fraction):
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def stream_request(port, prompt):
+    """Sends one /stream request; returns (first_chunk_seconds, total_seconds, outcome)."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=120)
+    start_time = time.perf_counter()
+    first_chunk = None
+    text = ""
+    outcome = "ok"
+    try:
+        connection.request("POST", "/stream", urllib.parse.urlencode({"user_input": prompt}),
+                           {"Content-Type": "application/x-www-form-urlencoded"})
+        response = connection.getresponse()
+        event = None
+        for raw_line in response:
+            line = raw_line.decode("utf-8").rstrip("\n")
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                if first_chunk is None:
+                    first_chunk = time.perf_counter() - start_time
+                payload = json.loads(line[6:])
+                if event == "chunk":
+                    text += payload.get("text", "")
+                elif event == "error":
+                    outcome = "error"
+    except (OSError, http.client.HTTPException):
+        outcome = "failed"
+    finally:
+        connection.close()
+    if outcome == "ok" and text.startswith(BUSY_TEXT):
+        outcome = "busy"
+    return first_chunk, time.perf_counter() - start_time, outcome
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--concurrency", type=int, default=64, help="Requests in flight at once")
+    parser.add_argument("--requests", type=int, default=1000, help="Total requests")
+    parser.add_argument("--workers", type=int, default=1, help="serve.py worker processes")
+    parser.add_argument("--fake-options", default="latency_ms=500,latency_sigma=0.5,tokens_per_second=50",
+                        help="FAKE_LLM_OPTIONS for the server")
+    parser.add_argument("--pool-size", type=int, help="UPSTREAM_POOL_SIZE for the server")
+    parser.add_argument("--max-in-flight", type=int, help="UPSTREAM_MAX_IN_FLIGHT for the server")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    env = dict(os.environ, LLM_BACKEND="fake", FAKE_LLM_OPTIONS=args.fake_options, LOCAL_ANSWER_THRESHOLD="0",
+               GEMINI_CACHE_TTL="0", KB_RELOAD_INTERVAL="0", WARM_UP="0", RATE_LIMITS="", IP_RATE_LIMITS="",
+               GLOBAL_RATE_LIMITS="")
+    if args.pool_size:
+        env["UPSTREAM_POOL_SIZE"] = str(args.pool_size)
+    if args.max_in_flight:
+        env["UPSTREAM_MAX_IN_FLIGHT"] = str(args.max_in_flight)
+    server = subprocess.Popen([sys.executable, "serve.py", "--port", str(args.port), "--workers", str(args.workers)],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    results = []
+    results_lock = threading.Lock()
+    next_request = iter(range(args.requests))
+    next_request_lock = threading.Lock()
+
+    def client():
+        while True:
+            with next_request_lock:
+                index = next(next_request, None)
+            if index is None:
+                return
+            result = stream_request(args.port, f"tell me something interesting about topic number {index}")
+            with results_lock:
+                results.append(result)
+
+    try:
+        if not wait_until_ready(args.port):
+            print("The server did not start.")
+            return 1
+        start_time = time.perf_counter()
+        clients = [threading.Thread(target=client) for _ in range(args.concurrency)]
+        for thread in clients:
+            thread.start()
+        for thread in clients:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+    finally:
+        server.terminate()
+        server.wait()
+
+    outcomes = {}
+    for _, _, outcome in results:
+        outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    ok = [r for r in results if r[2] == "ok"]
+    first_chunks = [r[0] for r in ok if r[0] is not None]
+    totals = [r[1] for r in ok]
+    print(f"Fake backend: {args.fake_options}")
+    print(f"{len(results)} requests, concurrency {args.concurrency}, {args.workers} worker(s), {elapsed:.1f}s")
+    print(f"Throughput: {len(results) / elapsed:.1f} requests/s ({len(ok) / elapsed:.1f} completed replies/s)")
+    print("Outcomes: " + ", ".join(f"{name} {count}" for name, count in sorted(outcomes.items())))
+    print(f"\n{'':>14} {'p50 (ms)':>9} {'p95 (ms)':>9} {'p99 (ms)':>9} {'mean (ms)':>10}")
+    for label, values in (("first chunk", first_chunks), ("full reply", totals)):
+        mean = statistics.mean(values) if values else float("nan")
+        print(f"{label:>14} {percentile(values, 0.5) * 1000:>9.0f} {percentile(values, 0.95) * 1000:>9.0f} "
+              f"{percentile(values, 0.99) * 1000:>9.0f} {mean * 1000:>10.0f}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
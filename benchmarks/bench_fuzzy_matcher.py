@@ -0,0 +1,76 @@
+# bench_fuzzy_matcher.py
+# Micro-benchmark for the typo-tolerant vocabulary lookup in fuzzy_matcher.py.
+# Builds a DeletionIndex over a synthetic vocabulary (syllable words from synthetic_kb.py,
+# the size of a 200k-pattern knowledge base's) and times uncached nearest() lookups of
+# misspelled vocabulary words (one and two typos) and of random letter strings, which are
+# near nothing and make the lookup try every candidate. Exits with status 1 if the 99th
+# percentile of any kind of lookup is above --max-ms, so it can gate a change.
+#
+# Usage: python benchmarks/bench_fuzzy_matcher.py [--vocabulary N] [--lookups N] [--max-ms MS]
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fuzzy_matcher import DeletionIndex  # noqa: E402
+from synthetic_kb import LETTERS, make_vocabulary, misspell  # noqa: E402
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def lookup_times(index, tokens):
+    """Seconds per nearest() call, each on an empty lookup cache."""
+    timings = []
+    for token in tokens:
+        index._lookup_cache.clear()
+        start = time.perf_counter()
+        index.nearest(token)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--vocabulary", type=int, default=100000, help="Terms in the index")
+    parser.add_argument("--lookups", type=int, default=2000, help="Timed lookups of each kind")
+    parser.add_argument("--max-ms", type=float, default=1.0, help="Allowed 99th percentile lookup time")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    vocabulary = make_vocabulary(args.vocabulary, rng)
+    start = time.perf_counter()
+    index = DeletionIndex(vocabulary)
+    print(f"Vocabulary: {len(vocabulary)} terms, {len(index._hashes)} index entries, "
+          f"built in {time.perf_counter() - start:.2f} s")
+
+    kinds = {
+        "one typo": [misspell(rng.choice(vocabulary), rng) for _ in range(args.lookups)],
+        "two typos": [misspell(misspell(rng.choice(vocabulary), rng), rng) for _ in range(args.lookups)],
+        "random": ["".join(rng.choice(LETTERS) for _ in range(rng.randint(4, 12))) for _ in range(args.lookups)],
+    }
+    print(f"{'lookup':>10} {'median ms':>10} {'p90 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    too_slow = []
+    for kind, tokens in kinds.items():
+        timings = lookup_times(index, tokens)
+        p99 = percentile(timings, 0.99) * 1000
+        print(f"{kind:>10} {percentile(timings, 0.5) * 1000:>10.3f} {percentile(timings, 0.9) * 1000:>8.3f} "
+              f"{p99:>8.3f} {max(timings) * 1000:>8.3f}")
+        if p99 > args.max_ms:
+            too_slow.append(kind)
+
+    if too_slow:
+        print(f"p99 above {args.max_ms} ms: {', '.join(too_slow)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,62 @@
+# bench_kb_memory.py
+# Memory footprint of the processed knowledge base, in bytes per pattern.
+# Generates a synthetic knowledge base (see synthetic_kb.py) and measures, with
+# tracemalloc, the preprocessed intents as dicts (the form preprocess_intent returns)
+# against the compact IntentTable, then each index built on top of the table.
+#
+# Usage: python benchmarks/bench_kb_memory.py [--patterns N] [--seed S]
+
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from Chat_utils import preprocess_intent, build_keyword_index, build_phrase_automaton  # noqa: E402
+from fuzzy_matcher import DeletionIndex  # noqa: E402
+from kb_compact import build_intent_table  # noqa: E402
+from synthetic_kb import synthetic_intents  # noqa: E402
+
+
+def traced(build):
+    """Returns (result, bytes still allocated by build once it returns)."""
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patterns", type=int, default=20000, help="Number of synthetic patterns")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic knowledge base")
+    args = parser.parse_args()
+
+    raw_intents = synthetic_intents(args.patterns, random.Random(args.seed))
+    processed_intents, dict_size = traced(
+        lambda: [intent for intent in map(preprocess_intent, raw_intents) if intent])
+    table, table_size = traced(lambda: build_intent_table(processed_intents))
+    pattern_count = table.pattern_count
+    del processed_intents
+
+    keyword_index, keyword_index_size = traced(lambda: build_keyword_index(table))
+    _, automaton_size = traced(lambda: build_phrase_automaton(table))
+    _, fuzzy_size = traced(lambda: DeletionIndex(keyword_index))
+
+    print(f"Patterns: {pattern_count} in {len(table)} intents, {len(table.strings)} interned strings")
+    print(f"\n{'structure':>24} {'bytes/pattern':>14}")
+    for label, size in (("intents as dicts", dict_size), ("IntentTable", table_size),
+                        ("keyword index", keyword_index_size), ("phrase automaton", automaton_size),
+                        ("fuzzy deletion index", fuzzy_size)):
+        print(f"{label:>24} {size / pattern_count:>14.0f}")
+    total = table_size + keyword_index_size + automaton_size + fuzzy_size
+    print(f"{'total (compact)':>24} {total / pattern_count:>14.0f}")
+
+
+if __name__ == '__main__':
+    main()
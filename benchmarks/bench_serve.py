@@ -0,0 +1,102 @@
+# bench_serve.py
+# Local load test for serve.py: starts the server with 1, 2, 4, ... workers (up to the CPU
+# count) and measures requests/sec for knowledge-base chat turns (POST /process_input as the
+# page's script sends it, answered locally, no Gemini key) from keep-alive client processes.
+# The clients run on the same machine, so they compete with the workers for cores: for a
+# clean scaling curve run it on a machine with spare cores, or drive the server from another host.
+#
+# Usage: python benchmarks/bench_serve.py [--workers 1,2,4] [--clients N] [--duration S] [--port P]
+
+import argparse
+import http.client
+import multiprocessing
+import os
+import subprocess
+import sys
+import time
+import urllib.parse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+QUESTIONS = ["hello", "what is python", "tell me about lists in python", "thanks", "what are data types",
+             "who are you", "how do loops work", "goodbye friend"]
+
+
+def wait_until_ready(port, timeout=60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            connection.request("GET", "/kb_status")
+            connection.getresponse().read()
+            connection.close()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def client_loop(port, duration):
+    """Sends chat turns over one keep-alive connection for duration seconds; returns (ok, errors)."""
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    headers = {"Content-Type": "application/x-www-form-urlencoded", "Accept": "application/json"}
+    ok = errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        body = urllib.parse.urlencode({"user_input": QUESTIONS[(ok + errors) % len(QUESTIONS)]})
+        try:
+            connection.request("POST", "/process_input", body, headers)
+            response = connection.getresponse()
+            response.read()
+            if response.status == 204:
+                ok += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            connection.close()
+            connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    connection.close()
+    return ok, errors
+
+
+def run_load(port, clients, duration):
+    with multiprocessing.Pool(clients) as pool:
+        results = pool.starmap(client_loop, [(port, duration)] * clients)
+    return sum(ok for ok, _ in results), sum(errors for _, errors in results)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    cpu_count = os.cpu_count() or 1
+    default_workers = sorted({min(n, cpu_count) for n in (1, 2, 4, 8, 16, cpu_count)})
+    parser.add_argument("--workers", default=",".join(map(str, default_workers)),
+                        help="Comma-separated worker counts to test")
+    parser.add_argument("--clients", type=int, default=max(2, cpu_count), help="Client processes")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds of load per worker count")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    env = dict(os.environ, GEMINI_API_KEY="", KB_RELOAD_INTERVAL="0", RATE_LIMITS="", IP_RATE_LIMITS="",
+               GLOBAL_RATE_LIMITS="")
+    print(f"CPUs: {cpu_count}, client processes: {args.clients}, {args.duration:.0f}s per run")
+    print(f"\n{'workers':>8} {'requests/s':>11} {'errors':>7} {'speedup':>8}")
+    baseline = None
+    for workers in [int(n) for n in args.workers.split(",")]:
+        server = subprocess.Popen([sys.executable, "serve.py", "--port", str(args.port), "--workers", str(workers)],
+                                  cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not wait_until_ready(args.port):
+                print(f"{workers:>8} server did not start")
+                continue
+            ok, errors = run_load(args.port, args.clients, args.duration)
+        finally:
+            server.terminate()
+            server.wait()
+        rate = ok / args.duration
+        baseline = baseline or rate
+        print(f"{workers:>8} {rate:>11.0f} {errors:>7} {rate / baseline:>7.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,68 @@
+# bench_startup.py
+# Startup-time benchmark: imports a module (Main by default) in fresh interpreters with
+# python -X importtime and reports the total import time and the modules that cost the most.
+# Heavy upstream clients (google.generativeai, wikipedia) are loaded on first use, so they
+# should not show up here; --budget-ms makes the script fail when startup regresses.
+#
+# Usage: python benchmarks/bench_startup.py [--module Main] [--repeat N] [--top N] [--budget-ms MS]
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_importtime(stderr):
+    """Returns {module: (self_us, cumulative_us)} from -X importtime output."""
+    timings = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, module = line[len("import time:"):].split("|")
+        timings[module.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def measure(module):
+    """Imports module in a new interpreter and returns its import timings."""
+    env = dict(os.environ, KB_RELOAD_INTERVAL="0")
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                            cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--module", default="Main", help="Module to import")
+    parser.add_argument("--repeat", type=int, default=5, help="Fresh interpreters to measure")
+    parser.add_argument("--top", type=int, default=10, help="Number of heaviest packages to list")
+    parser.add_argument("--budget-ms", type=float, default=0, help="Fail if the median import time exceeds this")
+    args = parser.parse_args()
+
+    runs = [measure(args.module) for _ in range(args.repeat)]
+    totals_ms = [run[args.module][1] / 1000 for run in runs]
+    median_ms = statistics.median(totals_ms)
+    print(f"import {args.module}: median {median_ms:.0f} ms, min {min(totals_ms):.0f} ms, "
+          f"max {max(totals_ms):.0f} ms over {args.repeat} runs")
+
+    # Cumulative time of every module, from the run closest to the median
+    run = min(runs, key=lambda r: abs(r[args.module][1] / 1000 - median_ms))
+    heaviest = sorted(((cumulative, name) for name, (_, cumulative) in run.items()
+                       if "." not in name and name != args.module), reverse=True)
+    print(f"\n{'package':>32} {'cumulative (ms)':>16}")
+    for cumulative, name in heaviest[:args.top]:
+        print(f"{name:>32} {cumulative / 1000:>16.1f}")
+
+    if args.budget_ms and median_ms > args.budget_ms:
+        print(f"\nStartup regression: {median_ms:.0f} ms is over the {args.budget_ms:.0f} ms budget.")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
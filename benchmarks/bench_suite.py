@@ -0,0 +1,212 @@
+# bench_suite.py
+# Regression benchmarks for the knowledge base matcher, the KB loader and the request path.
+# "run" generates synthetic knowledge bases of each size (see synthetic_kb.py) and times:
+#   preprocess  - preprocess_input over the input corpus (per input)
+#   match       - get_response and the batch get_responses (per input)
+#   load        - load_and_preprocess_knowledge_base and load_snapshot of the JSON file
+#   request     - POST /process_input through Flask's test client (per request), with the
+#                 fake LLM backend (no latency) and stubbed Wikipedia lookups, once with the
+#                 LLM tier and once falling back to the KB (get_response)
+# and saves each run's time per operation as JSON. "compare" reads two result files and flags
+# the benchmarks that got slower by more than --threshold (exit status 1), e.g. to check a
+# change to get_response against a run from the previous commit. It compares the fastest run
+# by default, which is the least sensitive to other load on the machine.
+#
+# Usage: python benchmarks/bench_suite.py run [--sizes 100,1000,10000,100000] [--queries N] [--repeat N]
+#            [--only preprocess,match,load,request] [--output FILE]
+#        python benchmarks/bench_suite.py compare BASELINE.json CURRENT.json [--threshold 0.1]
+#            [--statistic min|median]
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from Chat_utils import preprocess_input, get_response, get_responses, load_and_preprocess_knowledge_base  # noqa: E402
+from kb_snapshot import compile_snapshot, load_snapshot  # noqa: E402
+from synthetic_kb import synthetic_intents, input_corpus, write_knowledge_base  # noqa: E402
+
+GROUPS = ("preprocess", "match", "load", "request")
+DEFAULT_OUTPUT = os.path.join(ROOT, "benchmarks", "results", "latest.json")
+
+
+def measure(run_once, operations, repeat):
+    """Calls run_once() repeat times; returns the seconds per operation of each run."""
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        run_once()
+        timings.append((time.perf_counter() - start_time) / operations)
+    return timings
+
+
+def summarize(timings):
+    return {"median_s": statistics.median(timings), "min_s": min(timings), "runs_s": timings}
+
+
+def format_seconds(seconds):
+    for unit, scale in (("s", 1), ("ms", 1e-3), ("us", 1e-6)):
+        if seconds >= scale:
+            return f"{seconds / scale:.2f} {unit}"
+    return f"{seconds / 1e-9:.0f} ns"
+
+
+def request_benchmarks(knowledge_base, corpus, repeat):
+    """Times /process_input with the LLM tier (fake backend) and with the KB fallback."""
+    os.environ.update(LLM_BACKEND="fake", FAKE_LLM_OPTIONS="latency_ms=0,latency_sigma=0,tokens_per_second=0",
+                      GEMINI_CACHE_TTL="0", KB_RELOAD_INTERVAL="0", WARM_UP="0", CHAT_HISTORY_BACKEND="memory",
+                      CHAT_LOG_FILE="", RATE_LIMITS="", IP_RATE_LIMITS="", GLOBAL_RATE_LIMITS="")
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        import Main
+
+        Main.knowledge_base_reloader = None
+        Main.knowledge_base_data = knowledge_base
+        Main.fetch_book_details_from_wikipedia = lambda title: f"Title: {title}\nSummary: A book."
+        Main.fetch_book_details_batch = lambda titles, timeout=None: ((title, "A book.") for title in titles)
+        client = Main.app.test_client()
+        headers = {"Accept": "application/json"}
+
+        def post_all():
+            for user_input in corpus:
+                client.post("/process_input", data={"user_input": user_input}, headers=headers)
+
+        results = {}
+        llm_backend = Main.llm_backend
+        for tier, backend in (("llm", llm_backend), ("kb", None)):
+            Main.llm_backend = backend
+            post_all()  # Warm up (builds the local retriever for this knowledge base)
+            results[tier] = measure(post_all, len(corpus), repeat)
+        Main.llm_backend = llm_backend
+    return results
+
+
+def run(args):
+    os.chdir(ROOT)  # Main reads its data files relative to the working directory
+    sizes = [int(float(size)) for size in args.sizes.split(",")]
+    groups = args.only.split(",") if args.only else GROUPS
+    results = {}
+
+    def record(name, timings):
+        results[name] = summarize(timings)
+        print(f"{name:>56} {format_seconds(results[name]['median_s']):>12}")
+
+    print(f"{'benchmark':>56} {'median':>12}")
+    for size in sizes:
+        rng = random.Random(args.seed)
+        intents = synthetic_intents(size, rng)
+        corpus = input_corpus(intents, args.queries, rng)
+        with tempfile.TemporaryDirectory() as directory:
+            kb_path = os.path.join(directory, "knowledge_base.json")
+            write_knowledge_base(intents, kb_path)
+            knowledge_base = load_and_preprocess_knowledge_base(kb_path)
+
+            if "preprocess" in groups and size == sizes[0]:  # Doesn't depend on the KB size
+                record("preprocess.preprocess_input",
+                       measure(lambda: [preprocess_input(text) for text in corpus], len(corpus), args.repeat))
+            if "match" in groups:
+                record(f"match.get_response[patterns={size}]",
+                       measure(lambda: [get_response(text, knowledge_base) for text in corpus],
+                               len(corpus), args.repeat))
+                record(f"match.get_responses[patterns={size}]",
+                       measure(lambda: get_responses(corpus, knowledge_base, seed=0), len(corpus), args.repeat))
+            if "load" in groups:
+                record(f"load.load_and_preprocess_knowledge_base[patterns={size}]",
+                       measure(lambda: load_and_preprocess_knowledge_base(kb_path), 1, args.load_repeat))
+                snapshot_path = compile_snapshot(kb_path)
+                record(f"load.load_snapshot[patterns={size}]",
+                       measure(lambda: load_snapshot(kb_path, snapshot_path), 1, args.load_repeat))
+            if "request" in groups:
+                book_inputs = [f"book review {text}" for text in rng.sample(corpus, max(1, len(corpus) // 20))]
+                for tier, timings in request_benchmarks(knowledge_base, corpus + book_inputs, args.repeat).items():
+                    record(f"request.process_input.{tier}[patterns={size}]", timings)
+
+    output = {"meta": run_metadata(args), "results": results}
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"\nSaved {len(results)} results to {args.output}")
+    return 0
+
+
+def run_metadata(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                                text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(),
+            "machine": platform.platform(), "cpus": os.cpu_count(), "sizes": args.sizes,
+            "queries": args.queries, "repeat": args.repeat, "seed": args.seed}
+
+
+def compare(args):
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+    for label, data in (("baseline", baseline), ("current", current)):
+        meta = data.get("meta", {})
+        print(f"{label:>8}: commit {meta.get('commit')}, {meta.get('time')}, Python {meta.get('python')}")
+
+    key = f"{args.statistic}_s"
+    regressions = 0
+    print(f"\n{'benchmark':>56} {'baseline':>12} {'current':>12} {'change':>8}")
+    for name, result in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:>56} {'-':>12} {format_seconds(result[key]):>12} {'new':>8}")
+            continue
+        change = result[key] / base[key] - 1
+        flag = ""
+        if change > args.threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif change < -args.threshold:
+            flag = "  faster"
+        print(f"{name:>56} {format_seconds(base[key]):>12} {format_seconds(result[key]):>12} "
+              f"{change * 100:>+7.1f}%{flag}")
+    for name in baseline["results"].keys() - current["results"].keys():
+        print(f"{name:>56} (missing from the current results)")
+
+    if regressions:
+        print(f"\n{regressions} benchmark(s) more than {args.threshold * 100:.0f}% slower than the baseline.")
+        return 1
+    print(f"\nNo benchmark is more than {args.threshold * 100:.0f}% slower than the baseline.")
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="Run the benchmarks and save the results")
+    run_parser.add_argument("--sizes", default="100,1000,10000,100000",
+                            help="Comma-separated KB sizes in patterns (up to 1e6)")
+    run_parser.add_argument("--queries", type=int, default=1000, help="Inputs in the corpus")
+    run_parser.add_argument("--repeat", type=int, default=5, help="Timed passes over the corpus")
+    run_parser.add_argument("--load-repeat", type=int, default=3, help="Timed loads of each KB")
+    run_parser.add_argument("--only", help=f"Comma-separated benchmark groups ({','.join(GROUPS)})")
+    run_parser.add_argument("--seed", type=int, default=0)
+    run_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON results file")
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10,
+                                help="Slowdown (fraction of the baseline time) reported as a regression")
+    compare_parser.add_argument("--statistic", choices=("min", "median"), default="min",
+                                help="Time per operation compared: fastest or median run")
+    args = parser.parse_args()
+    return run(args) if args.command == "run" else compare(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,119 @@
+# synthetic_kb.py
+# Synthetic knowledge bases and user-input corpora shared by the benchmarks.
+# Words are built from syllables so they look like words to the fuzzy matcher, and are
+# drawn from a Zipf-like distribution, so common words are shared by many patterns the
+# way real phrasing is. Everything is derived from the random.Random passed in.
+#
+# Usage: python benchmarks/synthetic_kb.py --patterns N [--vocabulary N] [--seed S] out.json
+#        (writes a knowledge base JSON file, e.g. to try the server on a large KB)
+
+import argparse
+import itertools
+import json
+import random
+
+SYLLABLES = ("ba", "co", "de", "fi", "gu", "ha", "jo", "ki", "lu", "ma", "ne", "po", "ra", "si", "tu",
+             "ve", "wo", "ya", "zen", "tor", "lin", "mar", "pel", "dus", "kor", "nit", "ses", "gal")
+# Words real questions wrap around the topic words
+FILLER_WORDS = ("can", "you", "tell", "me", "about", "what", "is", "the", "how", "do", "i", "please",
+                "explain", "a", "why", "does", "work", "in", "and", "of")
+OFF_TOPIC_INPUTS = ("what's the weather like today", "play some music", "who won the game last night",
+                    "order a pizza", "set an alarm for seven", "how far away is the moon",
+                    "recommend a good movie", "translate hello into french")
+LETTERS = "abcdefghijklmnopqrstuvwxyz"
+
+
+def make_vocabulary(size, rng):
+    """Returns size distinct made-up words of one to four syllables."""
+    words = set()
+    while len(words) < size:
+        words.add("".join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def default_vocabulary_size(pattern_count):
+    """Vocabulary that grows with the knowledge base, as topics are added."""
+    return min(100000, max(500, pattern_count // 2))
+
+
+def synthetic_intents(pattern_count, rng, vocabulary_size=None, patterns_per_intent=8, vocabulary=None):
+    """Returns raw intents (plus 'default') with about pattern_count patterns in total."""
+    if vocabulary is None:
+        vocabulary = make_vocabulary(vocabulary_size or default_vocabulary_size(pattern_count), rng)
+    rng.shuffle(vocabulary)  # The Zipf rank must not follow alphabetical order
+    cumulative_weights = list(itertools.accumulate(1 / (rank + 1) for rank in range(len(vocabulary))))
+    intents = []
+    for intent_index in range(max(1, pattern_count // patterns_per_intent)):
+        patterns = [" ".join(rng.choices(vocabulary, cum_weights=cumulative_weights, k=rng.randint(2, 8)))
+                    for _ in range(patterns_per_intent)]
+        intents.append({"tag": f"intent_{intent_index}", "patterns": patterns,
+                        "responses": [f"Response {intent_index}.{i}" for i in range(rng.randint(1, 3))]})
+    intents.append({"tag": "default", "patterns": [], "responses": ["I'm not sure I understand."]})
+    return intents
+
+
+def misspell(word, rng):
+    """Applies one typo (swap, drop, double or replace a letter) to word."""
+    if len(word) < 3:
+        return word
+    position = rng.randrange(len(word) - 1)
+    kind = rng.randrange(4)
+    if kind == 0:
+        return word[:position] + word[position + 1] + word[position] + word[position + 2:]
+    if kind == 1:
+        return word[:position] + word[position + 1:]
+    if kind == 2:
+        return word[:position] + word[position] + word[position:]
+    return word[:position] + rng.choice(LETTERS) + word[position + 1:]
+
+
+def input_corpus(intents, count, rng):
+    """
+    Returns count user inputs in a realistic mix: patterns typed as is (with
+    varied case and punctuation), patterns inside a longer question, a few of
+    a pattern's words among filler words, patterns with a typo, and off-topic
+    chat that should match nothing.
+    """
+    patterns = [pattern for intent in intents for pattern in intent["patterns"]]
+    inputs = []
+    for _ in range(count):
+        pattern = rng.choice(patterns) if patterns else ""
+        words = pattern.split()
+        kind = rng.random()
+        if kind < 0.3 or not words:
+            text = rng.choice((pattern, pattern.capitalize(), pattern + "?", pattern.upper() + "!"))
+        elif kind < 0.55:
+            text = f"{' '.join(rng.sample(FILLER_WORDS, 3))} {pattern} please"
+        elif kind < 0.75:
+            kept = rng.sample(words, max(1, len(words) // 2))
+            text = " ".join(kept + rng.sample(FILLER_WORDS, 4))
+        elif kind < 0.85:
+            index = rng.randrange(len(words))
+            words[index] = misspell(words[index], rng)
+            text = " ".join(words)
+        else:
+            text = rng.choice(OFF_TOPIC_INPUTS)
+        inputs.append(text)
+    return inputs
+
+
+def write_knowledge_base(intents, filepath):
+    with open(filepath, "w", encoding="utf-8") as f:
+        json.dump({"intents": intents}, f)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--patterns", type=int, default=10000, help="Number of synthetic patterns")
+    parser.add_argument("--vocabulary", type=int, help="Number of distinct words (default: grows with --patterns)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("output", help="Knowledge base JSON file to write")
+    args = parser.parse_args()
+    intents = synthetic_intents(args.patterns, random.Random(args.seed), args.vocabulary)
+    write_knowledge_base(intents, args.output)
+    print(f"Wrote {sum(len(intent['patterns']) for intent in intents)} patterns in {len(intents)} intents "
+          f"to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,146 @@
+# book_classifier.py
+# Decides whether a Wikipedia page is about a book, for wek.py's book review lookups.
+# Category keywords (positive and negative, each with a weight) are compiled once into
+# a single trie-shaped regular expression, so a category is scanned in one pass however
+# many keywords there are. The keywords found in each category name are memoized: most of a
+# popular page's categories (maintenance, "Articles with ...") are shared with many other pages,
+# so they are only ever scanned once. Hints from the page summary (e.g. "is a novel", "directed by")
+# add to the score, which lets negative evidence override a stray "fiction" category.
+#
+# The keyword sets can be replaced with a JSON file named by BOOK_CLASSIFIER_CONFIG:
+#   {"category_weights": {"novels": 3, ...}, "summary_hints": {"is a novel": 4, ...}, "threshold": 1}
+
+import json
+import os
+import re
+
+# Substrings of (lowercased) category names, with their weight towards "this is a book"
+DEFAULT_CATEGORY_WEIGHTS = {
+    # Positive: the original keyword list
+    "novels": 3, "fiction": 2, "literature": 1, "books": 2, "works": 1,
+    "fantasy": 1, "science fiction": 2, "mystery": 1, "thriller": 1,
+    "historical novels": 3, "children's books": 3, "young adult fiction": 3,
+    "romance novels": 3, "horror novels": 3, "biographies": 2, "autobiographies": 2,
+    # Positive: other common book categories
+    "novellas": 3, "memoirs": 2, "non-fiction books": 3, "picture books": 3, "book series": 2,
+    "short story collections": 3, "poetry collections": 3,
+    # Negative: categories of pages that mention books but aren't one
+    "films": -2, "films based on": -4, "film series": -3,
+    "video games": -4, "albums": -4, "songs": -4, "singles": -4,
+    "television series": -3, "television programs": -3, "musicals": -2,
+    "births": -5, "deaths": -5, "living people": -5, "writers": -2, "novelists": -2,
+    "cities": -5, "countries": -5, "programming languages": -5, "companies": -4,
+}
+
+# Phrases from the opening of the page summary (what the infobox would usually say)
+DEFAULT_SUMMARY_HINTS = {
+    "is a novel": 4, "is a book": 4, "is a novella": 4, "is a memoir": 4, "is a children's": 3,
+    "is a collection of": 2, "is a non-fiction": 4, "novel by": 3, "novel written by": 4,
+    "book by": 3, "book written by": 4, "published in": 2, "published by": 2, "first published": 2,
+    "directed by": -5, "starring": -4, "studio album": -5, "single by": -5, "song by": -5,
+    "developed by": -3, "video game": -5, "role-playing game": -5, "television series": -4, "is a city": -5, "is a programming language": -5,
+    "was an english": -3, "was an american": -3, "is a british author": -4, "is an american author": -4,
+}
+
+DEFAULT_THRESHOLD = 1
+
+# Only the start of the summary is checked; the lead sentence is where the page says what it is
+SUMMARY_HINT_CHARS = 300
+
+
+# Maximum number of category names whose keyword matches are memoized
+CATEGORY_CACHE_SIZE = 50000
+
+
+def _trie_pattern(node):
+    """Regex source for a character trie (nested dicts, '' marks the end of a phrase)."""
+    alternatives = [re.escape(char) + _trie_pattern(child) for char, child in sorted(node.items()) if char]
+    if not alternatives:
+        return ""
+    body = alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+    # Greedy optional suffix: the longest phrase at a position wins
+    return "(?:" + body + ")?" if "" in node else body
+
+
+def _compile_alternation(phrases):
+    """
+    Compiles phrases into one regex shaped like a trie of the phrases, so shared
+    prefixes are only tested once. Matches start at word boundaries and the
+    longest phrase at a position wins.
+    """
+    trie = {}
+    for phrase in phrases:
+        node = trie
+        for char in phrase:
+            node = node.setdefault(char, {})
+        node[""] = True
+    return re.compile(r"\b" + _trie_pattern(trie))
+
+
+class BookClassifier:
+    """
+    Scores a page from its categories and summary. Each keyword or hint
+    contributes its weight once, however many categories contain it.
+    The page is classified as a book if the total reaches the threshold.
+    """
+
+    def __init__(self, category_weights=None, summary_hints=None, threshold=DEFAULT_THRESHOLD):
+        # None selects the built-in set; an empty dict turns that kind of evidence off
+        if category_weights is None:
+            category_weights = DEFAULT_CATEGORY_WEIGHTS
+        if summary_hints is None:
+            summary_hints = DEFAULT_SUMMARY_HINTS
+        self.category_weights = {k.lower(): v for k, v in category_weights.items()}
+        self.summary_hints = {k.lower(): v for k, v in summary_hints.items()}
+        self.threshold = threshold
+        self._category_re = _compile_alternation(self.category_weights) if self.category_weights else None
+        self._hint_re = _compile_alternation(self.summary_hints) if self.summary_hints else None
+        self._category_cache = {}  # category name -> keywords found in it
+
+    @classmethod
+    def from_config_file(cls, path):
+        """Creates a classifier from a JSON config file (see the module comment)."""
+        with open(path, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+        return cls(config.get("category_weights"), config.get("summary_hints"),
+                   config.get("threshold", DEFAULT_THRESHOLD))
+
+    def score(self, categories, summary=None):
+        """
+        Returns (score, matched_keywords, matched_hints); the last two map each
+        category keyword / summary hint found to its weight.
+        """
+        matched_keywords = {}
+        category_cache = self._category_cache
+        for category in categories if self._category_re else ():
+            keywords = category_cache.get(category)
+            if keywords is None:
+                keywords = tuple(self._category_re.findall(category.lower()))
+                if len(category_cache) >= CATEGORY_CACHE_SIZE:
+                    category_cache.clear()
+                category_cache[category] = keywords
+            for keyword in keywords:
+                matched_keywords[keyword] = self.category_weights[keyword]
+
+        matched_hints = {}
+        if summary and self._hint_re:
+            for match in self._hint_re.finditer(summary[:SUMMARY_HINT_CHARS].lower()):
+                hint = match.group(0)
+                matched_hints[hint] = self.summary_hints[hint]
+
+        return sum(matched_keywords.values()) + sum(matched_hints.values()), matched_keywords, matched_hints
+
+    def is_book(self, categories, summary=None):
+        """True if the page's categories (and summary, if given) indicate a book."""
+        return self.score(categories, summary)[0] >= self.threshold
+
+
+def load_default_classifier():
+    """Returns the classifier configured by BOOK_CLASSIFIER_CONFIG, or the built-in one."""
+    config_path = os.getenv("BOOK_CLASSIFIER_CONFIG")
+    if config_path:
+        try:
+            return BookClassifier.from_config_file(config_path)
+        except (OSError, ValueError) as e:
+            print(f"Warning: Could not load book classifier config '{config_path}': {e}. Using defaults.")
+    return BookClassifier()
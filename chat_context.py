@@ -0,0 +1,203 @@
+# chat_context.py
+# Builds the prompt for a general chat turn from the session's history within a token budget.
+# The most recent messages are included verbatim, newest first, until the recent-turns share of
+# the budget is used up; everything older is represented by a short running summary. The summary
+# is cached per session together with the sequence number of the last message it covers. When the
+# recent messages outgrow their budget, the oldest of them are folded into the summary (incremental
+# compaction) until they fill only half of it, so the following turns reuse the cached summary
+# and the prompt size stays bounded however long the conversation gets.
+#
+# Token counts are estimated from the text length (about four characters per token for
+# English), which is close enough for budgeting and needs no tokenizer or API call.
+
+import re
+import threading
+from collections import OrderedDict
+
+HTML_TAG_RE = re.compile(r'<[^>]+>')
+SENDER_PREFIXES = ("You: ", "JARVIS: ")
+
+
+def estimate_tokens(text):
+    """Approximate number of model tokens in text."""
+    return (len(text) + 3) // 4
+
+
+def clip_to_tokens(text, max_tokens):
+    """Shortens text to about max_tokens tokens, at a word boundary."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return text[:max_chars].rsplit(" ", 1)[0] + " ..."
+
+
+def message_text(message):
+    """A stored chat message as plain text, without its 'You: ' / 'JARVIS: ' prefix and HTML."""
+    text = message.get("text", "")
+    for prefix in SENDER_PREFIXES:
+        if text.startswith(prefix):
+            text = text[len(prefix):]
+            break
+    return " ".join(HTML_TAG_RE.sub(" ", text).split())
+
+
+def format_message(message, max_tokens):
+    speaker = "User" if message.get("sender") == "user" else "Assistant"
+    return f"{speaker}: {clip_to_tokens(message_text(message), max_tokens)}"
+
+
+def extractive_summary(previous_summary, messages, max_tokens):
+    """
+    Summarizer that needs no model call: appends the start of each new message
+    to the previous summary and drops the oldest lines once it is over max_tokens.
+    """
+    lines = previous_summary.splitlines() if previous_summary else []
+    for message in messages:
+        lines.append(format_message(message, 30))
+    while len(lines) > 1 and estimate_tokens("\n".join(lines)) > max_tokens:
+        lines.pop(0)
+    return clip_to_tokens("\n".join(lines), max_tokens)
+
+
+class ContextBuilder:
+    """
+    Builds token-budgeted prompts from chat histories (lists of stored messages,
+    oldest first). max_tokens bounds the context added to the user's message:
+    summary_tokens of it for the summary of older turns, the rest for recent
+    messages verbatim (each clipped to max_message_tokens).
+
+    summarize(previous_summary, new_messages, max_tokens) returns the updated
+    summary; if it raises, extractive_summary is used for that update instead.
+    """
+
+    # Share of the verbatim budget left to recent messages after folding older ones into the summary
+    COMPACTION_TARGET = 0.5
+
+    def __init__(self, max_tokens=1500, summary_tokens=250, max_message_tokens=300, summarize=None,
+                 max_sessions=10000):
+        self.max_tokens = max_tokens
+        self.summary_tokens = summary_tokens
+        self.max_message_tokens = max_message_tokens
+        self.summarize = summarize or extractive_summary
+        self.max_sessions = max_sessions
+        self._summaries = OrderedDict()  # session id -> (last summarized seq, summary text)
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.prompts = 0
+        self.prompt_tokens = 0
+        self.last_prompt_tokens = 0
+        self.summary_hits = 0
+        self.summary_updates = 0
+        self.summary_failures = 0
+
+    def _message_tokens(self, message):
+        return estimate_tokens(format_message(message, self.max_message_tokens)) + 1
+
+    def _split_recent(self, messages, budget):
+        """Splits messages into (older, newest messages that fit in budget tokens)."""
+        used = 0
+        start = len(messages)
+        while start > 0:
+            used += self._message_tokens(messages[start - 1])
+            if used > budget:
+                break
+            start -= 1
+        return messages[:start], messages[start:]
+
+    def _compact(self, session_id, history):
+        """
+        Returns (summary, recent messages) for a history. Messages newer than the
+        cached summary are kept verbatim while they fit; when they don't, older
+        ones are folded into the summary until the recent ones fill only
+        COMPACTION_TARGET of the verbatim budget, so the next turns can reuse it.
+        """
+        recent_budget = self.max_tokens - self.summary_tokens
+        last_seq = history[-1].get("seq", 0)
+        with self._lock:
+            summarized_seq, summary = self._summaries.get(session_id, (0, ""))
+            if session_id in self._summaries:
+                self._summaries.move_to_end(session_id)
+        if summarized_seq > last_seq:  # The history was cleared or restarted
+            summarized_seq, summary = 0, ""
+
+        pending = [message for message in history if message.get("seq", 0) > summarized_seq]
+        if sum(self._message_tokens(message) for message in pending) <= recent_budget:
+            if summary:
+                with self._lock:
+                    self.summary_hits += 1
+            return summary, pending
+
+        older, recent = self._split_recent(pending, int(recent_budget * self.COMPACTION_TARGET))
+        try:
+            summary = self.summarize(summary, older, self.summary_tokens)
+        except Exception as e:
+            print(f"Warning: Could not summarize chat history ({e}); using an extractive summary.")
+            with self._lock:
+                self.summary_failures += 1
+            summary = extractive_summary(summary, older, self.summary_tokens)
+        summary = clip_to_tokens(summary, self.summary_tokens)
+        with self._lock:
+            self.summary_updates += 1
+            self._summaries[session_id] = (older[-1].get("seq", 0), summary)
+            self._summaries.move_to_end(session_id)
+            while len(self._summaries) > self.max_sessions:
+                self._summaries.popitem(last=False)
+        return summary, recent
+
+    def build(self, session_id, history, user_input):
+        """
+        Returns (prompt, prompt_tokens) for user_input given the session's earlier
+        messages. Without earlier messages the prompt is user_input itself.
+        """
+        prompt = user_input
+        if history and self.max_tokens > 0:
+            summary, recent = self._compact(session_id, history)
+            sections = []
+            if summary:
+                sections.append(f"Summary of the earlier conversation:\n{summary}")
+            if recent:
+                sections.append("Recent conversation:\n" + "\n".join(
+                    format_message(message, self.max_message_tokens) for message in recent))
+            sections.append(f"Reply to the user's new message, using the conversation above for context.\n"
+                            f"User: {user_input}")
+            prompt = "\n\n".join(sections)
+        prompt_tokens = estimate_tokens(prompt)
+        with self._lock:
+            self.prompts += 1
+            self.prompt_tokens += prompt_tokens
+            self.last_prompt_tokens = prompt_tokens
+        return prompt, prompt_tokens
+
+    def get_stats(self):
+        """Returns context statistics as a JSON-serializable dict."""
+        with self._lock:
+            lookups = self.summary_hits + self.summary_updates
+            return {
+                "max_tokens": self.max_tokens,
+                "summary_tokens": self.summary_tokens,
+                "prompts": self.prompts,
+                "average_prompt_tokens": self.prompt_tokens / self.prompts if self.prompts else 0.0,
+                "last_prompt_tokens": self.last_prompt_tokens,
+                "cached_summaries": len(self._summaries),
+                "summary_hits": self.summary_hits,
+                "summary_updates": self.summary_updates,
+                "summary_failures": self.summary_failures,
+                "summary_hit_rate": self.summary_hits / lookups if lookups else 0.0,
+            }
+
+
+def llm_summarizer(generate):
+    """
+    Returns a summarize function for ContextBuilder that asks a model to fold
+    the new messages into the summary; generate(prompt) returns the model's reply.
+    """
+    def summarize(previous_summary, new_messages, max_tokens):
+        transcript = "\n".join(format_message(message, 300) for message in new_messages)
+        prompt = (f"Update the summary of a conversation between a user and an assistant with the new messages "
+                  f"below. Keep names, facts and open questions the user may refer back to. "
+                  f"Answer with the summary only, in at most {max_tokens * 3 // 4} words.\n\n"
+                  f"Current summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}")
+        return generate(prompt).strip()
+
+    return summarize
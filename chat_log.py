@@ -0,0 +1,183 @@
+# chat_log.py
+# Structured log of chat turns (one JSON object per line) for tuning the knowledge base offline
+# (see chat_log_replay.py). Request handlers only put the record on a bounded in-memory queue;
+# a background writer thread serializes and writes records in batches and rotates the file by
+# size. If the writer falls behind and the queue is full, new records are dropped (and counted)
+# instead of making the request wait.
+#
+# Under gevent monkey patching (serve.py), threading.Thread starts a greenlet, so a slow disk
+# write would block every request of the worker. The writer is therefore started with the
+# unpatched _thread functions and waits with the unpatched time.sleep: it is a real OS thread
+# either way. The queue is a deque rather than queue.Queue, whose (patched) locks only work
+# between greenlets of one thread.
+
+import collections
+import importlib
+import json
+import os
+import time
+
+
+def _original(module_name, name):
+    """module_name.name as it was before gevent monkey patching (the current one without gevent)."""
+    try:
+        from gevent import monkey
+    except ImportError:
+        return getattr(importlib.import_module(module_name), name)
+    return monkey.get_original(module_name, name)
+
+
+_start_new_thread = _original("_thread", "start_new_thread")
+_allocate_lock = _original("_thread", "allocate_lock")
+_sleep = _original("time", "sleep")
+
+
+class ChatLog:
+    """
+    Buffered JSONL log written by a background OS thread. The file is rotated
+    when it reaches max_bytes: chat_log.jsonl becomes chat_log.jsonl.1, the
+    previous .1 becomes .2, and so on up to backup_count files.
+    """
+
+    def __init__(self, filepath, max_bytes=50 * 1024 * 1024, backup_count=5, buffer_size=10000,
+                 flush_interval=1.0, batch_size=500):
+        self.filepath = filepath
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.buffer_size = buffer_size
+        self._queue = collections.deque()  # append() and popleft() are atomic
+        self._stop_requested = False
+        self._running = None  # Lock held by the writer thread while it runs
+        self._file = None
+
+        # Statistics
+        self.written = 0
+        self.dropped = 0
+        self.write_errors = 0
+        self.rotations = 0
+
+    def log(self, record):
+        """Queues record (a JSON-serializable dict) for writing; never blocks. Returns False if it was dropped."""
+        record["ts"] = time.time()
+        if len(self._queue) >= self.buffer_size:  # Unsynchronized: the bound may be overshot slightly
+            self.dropped += 1  # Likewise, an approximate count is enough
+            return False
+        self._queue.append(record)
+        return True
+
+    def start(self, filepath=None):
+        """Starts the writer thread (no-op if already running), optionally writing to another file."""
+        if self._running and self._running.locked():
+            return
+        if filepath:
+            self.filepath = filepath
+        self._stop_requested = False
+        self._running = _allocate_lock()
+        self._running.acquire()
+        _start_new_thread(self._run, ())  # Like a daemon thread: doesn't keep the process alive
+
+    def stop(self):
+        """
+        Writes the queued records and stops the writer thread. Waiting for it
+        blocks the whole process under gevent, which is fine at shutdown or
+        before a fork.
+        """
+        self._stop_requested = True
+        if self._running:
+            self._running.acquire()
+            self._running = None
+
+    def _run(self):
+        try:
+            self._write_loop()
+        finally:
+            self._running.release()
+
+    def _write_loop(self):
+        while True:
+            batch = []
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.popleft())
+                except IndexError:
+                    break
+            if batch:
+                self._write_batch(batch)
+            elif self._stop_requested:
+                break
+            else:
+                _sleep(self.flush_interval)
+        if self._file:
+            self._file.close()
+            self._file = None
+
+    def _write_batch(self, batch):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(json.dumps(record, ensure_ascii=False) + "\n")
+            except (TypeError, ValueError) as e:
+                print(f"Warning: Could not serialize chat log record: {e}")
+                self.write_errors += 1
+        try:
+            if self._file is None:
+                self._file = open(self.filepath, "a", encoding="utf-8")
+            self._file.write("".join(lines))
+            self._file.flush()
+            self.written += len(lines)
+            if self.max_bytes and self._file.tell() >= self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            print(f"Warning: Could not write chat log '{self.filepath}': {e}")
+            self.write_errors += len(lines)
+            if self._file:
+                self._file.close()
+                self._file = None
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        if self.backup_count > 0:
+            for index in range(self.backup_count - 1, 0, -1):
+                source = f"{self.filepath}.{index}"
+                if os.path.exists(source):
+                    os.replace(source, f"{self.filepath}.{index + 1}")
+            os.replace(self.filepath, f"{self.filepath}.1")
+        else:
+            os.remove(self.filepath)
+        self.rotations += 1
+
+    def get_stats(self):
+        """Returns log statistics as a JSON-serializable dict."""
+        return {
+            "file": self.filepath,
+            "queued": len(self._queue),
+            "written": self.written,
+            "dropped": self.dropped,
+            "write_errors": self.write_errors,
+            "rotations": self.rotations,
+        }
+
+
+def process_log_path(filepath, pid=None):
+    """The log file of one worker process: chat_log.jsonl -> chat_log.<pid>.jsonl."""
+    root, extension = os.path.splitext(filepath)
+    return f"{root}.{pid or os.getpid()}{extension}"
+
+
+def iter_log_records(filepaths):
+    """
+    Yields the records of the given log files in order (one at a time, so logs
+    of any size can be read). Lines that aren't valid JSON are skipped.
+    """
+    for filepath in filepaths:
+        with open(filepath, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # E.g. a line cut short by a crash
+                if isinstance(record, dict):
+                    yield record
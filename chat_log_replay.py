@@ -0,0 +1,185 @@
+# chat_log_replay.py
+# Offline replay of the chat log (see chat_log.py) against a knowledge base, typically an edited
+# one before it goes live. The log is streamed in batches through the batch matcher
+# (Chat_utils.get_responses) and the local-answer retriever, so large logs replay at full speed
+# in constant memory (apart from the intent-change and per-input counts). Reports:
+#   - intent coverage: how many logged inputs the KB matches, and for turns the KB answered
+#     when they were logged, how many now match the same intent, a different one or none
+#   - LLM calls the KB could have answered: general chat turns that went to the LLM but whose
+#     input is now similar enough to a KB pattern or Q&A entry to be answered locally
+#
+# Usage: python chat_log_replay.py [--kb knowledge_base.json] [--extra-sources a.json,shards]
+#            [--qa-sources knowledge_base.py,responses.json] [--threshold 0.8] [--no-fuzzy]
+#            [--top N] [--json] chat_log.jsonl [chat_log.jsonl.1 ...]
+
+import argparse
+import itertools
+import json
+import sys
+from collections import Counter
+
+from Chat_utils import get_responses, load_and_preprocess_knowledge_base, preprocess_input
+from chat_log import iter_log_records
+from kb_loader import load_knowledge_base_sources
+from local_retriever import LocalRetriever, knowledge_base_documents, read_qa_file
+
+# Routes where the logged intent is the knowledge base's answer
+KB_ROUTES = ("kb", "exit")
+
+
+class ReplayReport:
+    """Accumulates replay results batch by batch."""
+
+    def __init__(self):
+        self.turns = 0
+        self.routes = Counter()
+        self.matched = 0  # Inputs the KB matches now
+        self.kb_turns = 0  # Turns answered by the KB when logged
+        self.same_intent = 0
+        self.changed_intent = 0
+        self.newly_matched = 0
+        self.lost_match = 0
+        self.still_unmatched = 0
+        self.intent_changes = Counter()  # (old tag, new tag) -> turns
+        self.llm_turns = 0
+        self.llm_answerable = 0
+        self.llm_answerable_inputs = Counter()  # Preprocessed input -> turns
+        self.llm_answerable_intents = {}  # Preprocessed input -> KB intent it now matches
+
+    def add(self, record, result, similarity, threshold):
+        self.turns += 1
+        route = record.get("route")
+        self.routes[route] += 1
+        new_tag = result["tag"] if result["tag"] != "default" else None
+        if new_tag:
+            self.matched += 1
+
+        if route in KB_ROUTES:
+            self.kb_turns += 1
+            old_tag = record.get("intent")
+            if old_tag == new_tag:
+                if old_tag:
+                    self.same_intent += 1
+                else:
+                    self.still_unmatched += 1
+            elif not old_tag:
+                self.newly_matched += 1
+            elif not new_tag:
+                self.lost_match += 1
+            else:
+                self.changed_intent += 1
+            if old_tag != new_tag:
+                self.intent_changes[(old_tag, new_tag)] += 1
+
+        elif route == "llm" and record.get("outcome", "ok") == "ok":
+            self.llm_turns += 1
+            if similarity is not None and similarity >= threshold:
+                self.llm_answerable += 1
+                processed_input = preprocess_input(record.get("input", ""))
+                self.llm_answerable_inputs[processed_input] += 1
+                self.llm_answerable_intents[processed_input] = new_tag
+
+    def to_dict(self, top):
+        return {
+            "turns": self.turns,
+            "routes": {str(route): count for route, count in self.routes.items()},
+            "matched": self.matched,
+            "kb_turns": self.kb_turns,
+            "same_intent": self.same_intent,
+            "changed_intent": self.changed_intent,
+            "newly_matched": self.newly_matched,
+            "lost_match": self.lost_match,
+            "still_unmatched": self.still_unmatched,
+            "top_intent_changes": [{"old": old, "new": new, "turns": count}
+                                   for (old, new), count in self.intent_changes.most_common(top)],
+            "llm_turns": self.llm_turns,
+            "llm_answerable": self.llm_answerable,
+            "top_llm_answerable_inputs": [{"input": text, "intent": self.llm_answerable_intents[text], "turns": count}
+                                          for text, count in self.llm_answerable_inputs.most_common(top)],
+        }
+
+
+def percent(part, whole):
+    return f"{part / whole * 100:.1f}%" if whole else "-"
+
+
+def print_report(report, top):
+    data = report.to_dict(top)
+    print(f"Turns replayed: {data['turns']}")
+    print("By logged route: " + ", ".join(f"{route} {count}" for route, count in sorted(data["routes"].items())))
+    print(f"\nIntent coverage: the KB matches {data['matched']} inputs ({percent(data['matched'], data['turns'])})")
+    kb_turns = data["kb_turns"]
+    print(f"Of {kb_turns} turns the KB answered when logged:")
+    print(f"  same intent      {data['same_intent']:>8} ({percent(data['same_intent'], kb_turns)})")
+    print(f"  different intent {data['changed_intent']:>8} ({percent(data['changed_intent'], kb_turns)})")
+    print(f"  newly matched    {data['newly_matched']:>8} ({percent(data['newly_matched'], kb_turns)})")
+    print(f"  no longer match  {data['lost_match']:>8} ({percent(data['lost_match'], kb_turns)})")
+    print(f"  still no match   {data['still_unmatched']:>8} ({percent(data['still_unmatched'], kb_turns)})")
+    if data["top_intent_changes"]:
+        print(f"\n{'turns':>8}  logged intent -> intent now")
+        for change in data["top_intent_changes"]:
+            print(f"{change['turns']:>8}  {change['old'] or '(none)'} -> {change['new'] or '(none)'}")
+
+    llm_turns = data["llm_turns"]
+    print(f"\nLLM calls the KB could have answered: {data['llm_answerable']} of {llm_turns} "
+          f"({percent(data['llm_answerable'], llm_turns)})")
+    if data["top_llm_answerable_inputs"]:
+        print(f"{'turns':>8}  input (KB intent it matches)")
+        for item in data["top_llm_answerable_inputs"]:
+            print(f"{item['turns']:>8}  {item['input']} ({item['intent'] or 'no KB intent'})")
+
+
+def replay(log_paths, knowledge_base, retriever, threshold, fuzzy=True, batch_size=5000):
+    """Replays the logged turns against knowledge_base; returns a ReplayReport."""
+    report = ReplayReport()
+    records = (record for record in iter_log_records(log_paths) if isinstance(record.get("input"), str))
+    while True:
+        batch = list(itertools.islice(records, batch_size))
+        if not batch:
+            return report
+        results = get_responses([record["input"] for record in batch], knowledge_base, seed=0, fuzzy=fuzzy)
+        for record, result in zip(batch, results):
+            similarity = None
+            if record.get("route") == "llm":
+                match = retriever.best_match(preprocess_input(record["input"]))
+                similarity = match[0] if match else None
+            report.add(record, result, similarity, threshold)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay the chat log against a knowledge base.")
+    parser.add_argument("logs", nargs="+", help="Chat log files (rotated files too)")
+    parser.add_argument("--kb", default="knowledge_base.json", help="Knowledge base JSON file")
+    parser.add_argument("--extra-sources", default="", help="Comma-separated extra KB sources (see kb_loader.py)")
+    parser.add_argument("--qa-sources", default="knowledge_base.py,responses.json",
+                        help="Comma-separated Q&A files used for local answers besides the KB")
+    parser.add_argument("--threshold", type=float, default=0.8, help="Local answer similarity threshold")
+    parser.add_argument("--no-fuzzy", action="store_true", help="Skip the misspelling-tolerant retry")
+    parser.add_argument("--top", type=int, default=20, help="Rows in the top-N lists")
+    parser.add_argument("--json", action="store_true", help="Print the report as JSON")
+    args = parser.parse_args()
+
+    extra_sources = [path.strip() for path in args.extra_sources.split(",") if path.strip()]
+    if extra_sources:
+        knowledge_base = load_knowledge_base_sources([args.kb] + extra_sources)
+    else:
+        knowledge_base = load_and_preprocess_knowledge_base(args.kb)
+    if not knowledge_base:
+        print(f"Could not load the knowledge base from {args.kb}.")
+        return 1
+    documents = knowledge_base_documents(knowledge_base)
+    for path in args.qa_sources.split(","):
+        if path.strip():
+            documents.extend(read_qa_file(path.strip()))
+    retriever = LocalRetriever(documents, args.threshold)
+
+    report = replay(args.logs, knowledge_base, retriever, args.threshold, fuzzy=not args.no_fuzzy)
+    if args.json:
+        print(json.dumps(report.to_dict(args.top), indent=2))
+    else:
+        print_report(report, args.top)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
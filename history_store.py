@@ -0,0 +1,183 @@
+# history_store.py
+# Server-side chat history storage. Only a session id is kept in the Flask cookie;
+# the messages themselves live here, so request size no longer grows with the history.
+# Writes are append-only: each message is added on its own instead of rewriting the list.
+#
+# Backends:
+#   MemoryHistoryStore  - in-process, LRU-evicted by session (lost on restart, per worker)
+#   SQLiteHistoryStore  - on-disk SQLite file, shared by all workers on the machine; trimmed to the
+#                         last max_messages per session on write, idle sessions swept after session_ttl
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+
+class HistoryStore:
+    """
+    Interface for chat history backends. Messages are dicts with 'sender',
+    'text' and 'type' keys; stored messages also get a per-session 'seq' number.
+    """
+
+    def __init__(self, max_messages=200):
+        # Maximum number of messages returned (and kept, where the backend trims) per session
+        self.max_messages = max_messages
+
+    def append(self, session_id, message):
+        """Appends one message to a session's history and returns its sequence number."""
+        raise NotImplementedError
+
+    def get_history(self, session_id, since_seq=None):
+        """Returns the most recent max_messages messages of a session, oldest first,
+        optionally only those with seq greater than since_seq."""
+        raise NotImplementedError
+
+
+class MemoryHistoryStore(HistoryStore):
+    """In-process history store. Keeps up to max_sessions sessions, evicting the least recently used."""
+
+    def __init__(self, max_messages=200, max_sessions=10000):
+        super().__init__(max_messages)
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()  # session id -> (next seq, deque of messages)
+        self._lock = threading.Lock()
+
+    def append(self, session_id, message):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = [1, deque(maxlen=self.max_messages)]
+                self._sessions[session_id] = entry
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            else:
+                self._sessions.move_to_end(session_id)
+            seq = entry[0]
+            entry[0] += 1
+            entry[1].append(dict(message, seq=seq))
+            return seq
+
+    def get_history(self, session_id, since_seq=None):
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            self._sessions.move_to_end(session_id)
+            messages = list(entry[1])
+        if since_seq is not None:
+            messages = [message for message in messages if message["seq"] > since_seq]
+        return messages
+
+
+class SQLiteHistoryStore(HistoryStore):
+    """
+    On-disk history store backed by SQLite (WAL mode, so several worker processes
+    can read while one writes). Reads fetch the last max_messages rows of a
+    session through the (session_id, seq) primary key. Each append deletes the
+    session's messages older than the last max_messages, and at most every
+    sweep_interval seconds the sessions idle for more than session_ttl seconds
+    are deleted, so the file doesn't grow with every turn ever chatted.
+    """
+
+    def __init__(self, db_path="chat_history.db", max_messages=200, session_ttl=7 * 24 * 3600,
+                 sweep_interval=3600):
+        super().__init__(max_messages)
+        self.db_path = db_path
+        self.session_ttl = session_ttl
+        self.sweep_interval = sweep_interval
+        self._next_sweep = time.monotonic() + sweep_interval
+        self._local = threading.local()  # One connection per thread
+        connection = self._get_connection()
+        with connection:
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " session_id TEXT NOT NULL,"
+                " seq INTEGER NOT NULL,"
+                " sender TEXT NOT NULL,"
+                " text TEXT NOT NULL,"
+                " type TEXT NOT NULL,"
+                " PRIMARY KEY (session_id, seq)"
+                ") WITHOUT ROWID")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                " session_id TEXT PRIMARY KEY,"
+                " last_active REAL NOT NULL"
+                ") WITHOUT ROWID")
+            connection.execute("CREATE INDEX IF NOT EXISTS sessions_last_active ON sessions (last_active)")
+            # Sessions stored before the sessions table existed start their idle time now
+            connection.execute(
+                "INSERT OR IGNORE INTO sessions (session_id, last_active)"
+                " SELECT DISTINCT session_id, ? FROM messages", (time.time(),))
+
+    def _get_connection(self):
+        connection = getattr(self._local, "connection", None)
+        # A connection must not be used across fork(), so a forked worker opens its own
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.db_path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def append(self, session_id, message):
+        connection = self._get_connection()
+        # BEGIN IMMEDIATE takes the write lock first, so two workers can't pick the same seq
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            row = connection.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM messages WHERE session_id = ?", (session_id,)).fetchone()
+            seq = row[0]
+            connection.execute(
+                "INSERT INTO messages (session_id, seq, sender, text, type) VALUES (?, ?, ?, ?, ?)",
+                (session_id, seq, message.get("sender", ""), message.get("text", ""), message.get("type", "chat")))
+            if seq > self.max_messages:
+                connection.execute("DELETE FROM messages WHERE session_id = ? AND seq <= ?",
+                                   (session_id, seq - self.max_messages))
+            connection.execute(
+                "INSERT INTO sessions (session_id, last_active) VALUES (?, ?)"
+                " ON CONFLICT (session_id) DO UPDATE SET last_active = excluded.last_active",
+                (session_id, time.time()))
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        if self.session_ttl and time.monotonic() >= self._next_sweep:
+            self.sweep()
+        return seq
+
+    def sweep(self):
+        """Deletes the sessions idle for more than session_ttl seconds; returns how many."""
+        self._next_sweep = time.monotonic() + self.sweep_interval
+        connection = self._get_connection()
+        cutoff = time.time() - self.session_ttl
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            connection.execute(
+                "DELETE FROM messages WHERE session_id IN"
+                " (SELECT session_id FROM sessions WHERE last_active < ?)", (cutoff,))
+            deleted = connection.execute("DELETE FROM sessions WHERE last_active < ?", (cutoff,)).rowcount
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        return deleted
+
+    def get_history(self, session_id, since_seq=None):
+        rows = self._get_connection().execute(
+            "SELECT seq, sender, text, type FROM messages"
+            " WHERE session_id = ? AND seq > ? ORDER BY seq DESC LIMIT ?",
+            (session_id, since_seq or 0, self.max_messages)).fetchall()
+        return [{"seq": seq, "sender": sender, "text": text, "type": message_type}
+                for seq, sender, text, message_type in reversed(rows)]
+
+
+def create_history_store(backend="memory", max_messages=200, db_path="chat_history.db", session_ttl=7 * 24 * 3600):
+    """Creates a history store from configuration ('memory' or 'sqlite')."""
+    if backend == "sqlite":
+        return SQLiteHistoryStore(db_path, max_messages=max_messages, session_ttl=session_ttl)
+    if backend != "memory":
+        print(f"Warning: Unknown chat history backend '{backend}', using the in-memory store.")
+    return MemoryHistoryStore(max_messages=max_messages)
@@ -0,0 +1,247 @@
+# kb_compact.py
+# Compact storage for the intents and patterns of the processed knowledge base.
+# Instead of a dict per intent and a dict plus keyword set per pattern, every string
+# (pattern tokens, tags, responses) is stored once in a single string table and the
+# rest is integer ids in flat arrays:
+#   intents:  tag, range of patterns, range of responses
+#   patterns: range of token ids, owning intent, number of distinct tokens
+# Patterns are numbered globally in knowledge base order (intent order, then pattern order),
+# which is also the tie-break order used by Chat_utils when scoring.
+#
+# IntentTable is a sequence of read-only mapping views shaped like the old processed intents
+# ({"tag", "processed_patterns_data": [{"text", "keywords"}], "responses"}), so code that
+# reads the knowledge base that way keeps working.
+
+from array import array
+from collections.abc import Mapping, Sequence
+
+
+class IntentTableBuilder:
+    """
+    Accumulates intents and their (preprocessed) patterns and compiles them
+    into an IntentTable. Patterns may be added to any intent in any order.
+    """
+
+    def __init__(self):
+        self.strings = []  # The string table
+        self._string_ids = {}  # string -> id, only needed while building
+        self._intent_tags = array('i')  # string id, -1 for no tag
+        self._intent_responses = []  # intent id -> list of string ids
+        self._pattern_tokens = array('i')
+        self._pattern_token_offsets = array('q', [0])
+        self._pattern_intent = array('i')
+
+    def __len__(self):
+        return len(self._intent_tags)
+
+    def _intern(self, string):
+        string_id = self._string_ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self._string_ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+    def add_intent(self, tag, responses=()):
+        """Adds an intent and returns its id."""
+        self._intent_tags.append(-1 if tag is None else self._intern(tag))
+        self._intent_responses.append([self._intern(response) for response in responses])
+        return len(self._intent_tags) - 1
+
+    def add_response(self, intent_id, response):
+        """Appends a response to an intent."""
+        self._intent_responses[intent_id].append(self._intern(response))
+
+    def add_pattern(self, intent_id, processed_text):
+        """Appends a preprocessed pattern (see Chat_utils.preprocess_input) to an intent."""
+        self._pattern_tokens.extend(self._intern(token) for token in processed_text.split())
+        self._pattern_token_offsets.append(len(self._pattern_tokens))
+        self._pattern_intent.append(intent_id)
+
+    def build(self):
+        """
+        Returns the compiled IntentTable. Intents without patterns are dropped,
+        except the 'default' intent (the same rule as Chat_utils.preprocess_intent).
+        """
+        strings = self.strings
+        pattern_count = len(self._pattern_intent)
+        patterns_per_intent = [0] * len(self._intent_tags)
+        for intent_id in self._pattern_intent:
+            patterns_per_intent[intent_id] += 1
+
+        # Number the kept intents and lay their patterns out contiguously, in the order added
+        new_intent_ids = array('i', [-1]) * len(self._intent_tags)
+        intent_tag = array('i')
+        intent_pattern_offsets = array('i', [0])
+        intent_response_offsets = array('i', [0])
+        response_ids = array('i')
+        for intent_id, tag_id in enumerate(self._intent_tags):
+            if not patterns_per_intent[intent_id] and (tag_id < 0 or strings[tag_id] != "default"):
+                continue
+            new_intent_ids[intent_id] = len(intent_tag)
+            intent_tag.append(tag_id)
+            intent_pattern_offsets.append(intent_pattern_offsets[-1] + patterns_per_intent[intent_id])
+            response_ids.extend(self._intent_responses[intent_id])
+            intent_response_offsets.append(len(response_ids))
+
+        if all(self._pattern_intent[i] <= self._pattern_intent[i + 1] for i in range(pattern_count - 1)):
+            order = range(pattern_count)
+        else:
+            order = sorted(range(pattern_count), key=self._pattern_intent.__getitem__)  # Stable
+
+        old_offsets = self._pattern_token_offsets
+        pattern_tokens = array('i')
+        pattern_token_offsets = array('q', [0])
+        pattern_intent = array('i')
+        pattern_sizes = array('i')
+        for pattern_id in order:
+            tokens = self._pattern_tokens[old_offsets[pattern_id]:old_offsets[pattern_id + 1]]
+            pattern_tokens.extend(tokens)
+            pattern_token_offsets.append(len(pattern_tokens))
+            pattern_intent.append(new_intent_ids[self._pattern_intent[pattern_id]])
+            pattern_sizes.append(len(set(tokens)))
+
+        default_intent = next((new_id for intent_id, new_id in enumerate(new_intent_ids)
+                               if new_id >= 0 and self._intent_tags[intent_id] >= 0
+                               and strings[self._intent_tags[intent_id]] == "default"), -1)
+        return IntentTable(strings, intent_tag, intent_pattern_offsets, intent_response_offsets, response_ids,
+                           pattern_tokens, pattern_token_offsets, pattern_intent, pattern_sizes, default_intent)
+
+
+def build_intent_table(processed_intents):
+    """Compiles processed intents (see Chat_utils.preprocess_intent) into an IntentTable."""
+    builder = IntentTableBuilder()
+    for intent_data in processed_intents:
+        intent_id = builder.add_intent(intent_data.get("tag"), intent_data.get("responses", []))
+        for p_pattern_info in intent_data.get("processed_patterns_data", []):
+            builder.add_pattern(intent_id, p_pattern_info["text"])
+    return builder.build()
+
+
+class IntentTable(Sequence):
+    """
+    Read-only, array-backed intents and patterns. Indexing returns an
+    IntentView; the arrays are public for the scoring code.
+    """
+
+    def __init__(self, strings, intent_tag, intent_pattern_offsets, intent_response_offsets, response_ids,
+                 pattern_tokens, pattern_token_offsets, pattern_intent, pattern_sizes, default_intent):
+        self.strings = strings
+        self.intent_tag = intent_tag
+        self.intent_pattern_offsets = intent_pattern_offsets
+        self.intent_response_offsets = intent_response_offsets
+        self.response_ids = response_ids
+        self.pattern_tokens = pattern_tokens
+        self.pattern_token_offsets = pattern_token_offsets
+        self.pattern_intent = pattern_intent  # Pattern id -> intent index
+        self.pattern_sizes = pattern_sizes  # Pattern id -> number of distinct tokens
+        self.default_intent = default_intent  # Index of the 'default' intent, or -1
+
+    def __len__(self):
+        return len(self.intent_tag)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("intent index out of range")
+        return IntentView(self, index)
+
+    @property
+    def pattern_count(self):
+        return len(self.pattern_intent)
+
+    def tag(self, intent_index):
+        tag_id = self.intent_tag[intent_index]
+        return None if tag_id < 0 else self.strings[tag_id]
+
+    def responses(self, intent_index):
+        strings = self.strings
+        start, end = self.intent_response_offsets[intent_index], self.intent_response_offsets[intent_index + 1]
+        return tuple(strings[string_id] for string_id in self.response_ids[start:end])
+
+    def pattern_range(self, intent_index):
+        """Global ids of an intent's patterns."""
+        return range(self.intent_pattern_offsets[intent_index], self.intent_pattern_offsets[intent_index + 1])
+
+    def pattern_token_ids(self, pattern_id):
+        return self.pattern_tokens[self.pattern_token_offsets[pattern_id]:self.pattern_token_offsets[pattern_id + 1]]
+
+    def pattern_text(self, pattern_id):
+        """The preprocessed pattern text (its tokens joined by single spaces, as preprocess_input leaves it)."""
+        strings = self.strings
+        return " ".join(strings[token_id] for token_id in self.pattern_token_ids(pattern_id))
+
+    def pattern_keywords(self, pattern_id):
+        strings = self.strings
+        return frozenset(strings[token_id] for token_id in self.pattern_token_ids(pattern_id))
+
+
+class IntentView(Mapping):
+    """Read-only view of one intent, with the keys of a processed intent dict."""
+    __slots__ = ("_table", "_index")
+    _KEYS = ("tag", "processed_patterns_data", "responses")
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def __getitem__(self, key):
+        if key == "tag":
+            return self._table.tag(self._index)
+        if key == "responses":
+            return self._table.responses(self._index)
+        if key == "processed_patterns_data":
+            return PatternList(self._table, self._table.pattern_range(self._index))
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
+
+    def __repr__(self):
+        return f"IntentView(tag={self['tag']!r})"
+
+
+class PatternList(Sequence):
+    """Read-only sequence of an intent's patterns."""
+    __slots__ = ("_table", "_pattern_ids")
+
+    def __init__(self, table, pattern_ids):
+        self._table = table
+        self._pattern_ids = pattern_ids
+
+    def __len__(self):
+        return len(self._pattern_ids)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [PatternView(self._table, pattern_id) for pattern_id in self._pattern_ids[index]]
+        return PatternView(self._table, self._pattern_ids[index])
+
+
+class PatternView(Mapping):
+    """Read-only view of one pattern: its preprocessed 'text' and 'keywords' (a frozenset)."""
+    __slots__ = ("_table", "_pattern_id")
+    _KEYS = ("text", "keywords")
+
+    def __init__(self, table, pattern_id):
+        self._table = table
+        self._pattern_id = pattern_id
+
+    def __getitem__(self, key):
+        if key == "text":
+            return self._table.pattern_text(self._pattern_id)
+        if key == "keywords":
+            return self._table.pattern_keywords(self._pattern_id)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(self._KEYS)
+
+    def __len__(self):
+        return len(self._KEYS)
@@ -0,0 +1,327 @@
+# kb_loader.py
+# Loads one processed knowledge base from several sources:
+#   - intents files (knowledge_base.json, responses.json): {"intents": [{"tag", "patterns", "responses"}]}
+#   - Q&A documents (knowledge_base.py): {"questions_answers": [...], "products": [...]}
+#   - directories of shards: *.json files in either format, or *.jsonl files with one
+#     intent / question / product (or whole document) per line
+# Files are streamed: JSON documents are decoded one array item at a time and JSONL files
+# one line at a time, so memory use follows the size of the processed knowledge base, not
+# of the dumps (a single value over MAX_VALUE_CHARS is an error). A pattern is kept only the
+# first time it appears, whether in an earlier source or earlier in the same one: matching would
+# always pick the earlier copy anyway, since ties go to the pattern first in the knowledge base.
+# Intents with the same tag are merged.
+#
+# Usage: python kb_loader.py <file_or_directory> [...]
+
+import json
+import os
+import sys
+import time
+
+from Chat_utils import preprocess_input, preprocess_intent, build_processed_knowledge_base
+from kb_compact import IntentTableBuilder
+
+# Top-level arrays of a document that hold knowledge base records
+RECORD_SECTIONS = ("intents", "questions_answers", "products")
+SHARD_EXTENSIONS = (".json", ".jsonl")
+READ_CHUNK_SIZE = 1024 * 1024
+# Largest single JSON value (one record, or a skipped top-level value) decoded, in characters
+MAX_VALUE_CHARS = 64 * 1024 * 1024
+# A decode error this close to the end of the buffer may just be a value cut off by the chunk
+# boundary (e.g. "fals" of false, or a half-read \uXXXX escape)
+_TRUNCATION_WINDOW = 6
+
+
+class _JSONStream:
+    """Incremental reader over a JSON document in a text file, for decoding it one value at a time."""
+
+    def __init__(self, f, chunk_size=READ_CHUNK_SIZE, max_value_chars=MAX_VALUE_CHARS):
+        self._file = f
+        self._chunk_size = chunk_size
+        self._max_value_chars = max_value_chars
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._pos = 0
+        self._eof = False
+
+    def _fill(self):
+        """Reads the next chunk into the buffer; returns False at end of file."""
+        if self._eof:
+            return False
+        if self._pos > self._chunk_size:
+            # Drop what has been consumed so the buffer doesn't grow with the file
+            self._buffer = self._buffer[self._pos:]
+            self._pos = 0
+        chunk = self._file.read(self._chunk_size)
+        if not chunk:
+            self._eof = True
+            return False
+        self._buffer += chunk
+        return True
+
+    def peek(self):
+        """Returns the next non-whitespace character without consuming it ('' at end of file)."""
+        while True:
+            while self._pos < len(self._buffer) and self._buffer[self._pos] in " \t\r\n":
+                self._pos += 1
+            if self._pos < len(self._buffer):
+                return self._buffer[self._pos]
+            if not self._fill():
+                return ""
+
+    def expect(self, chars):
+        """Consumes the next non-whitespace character, which must be one of chars, and returns it."""
+        char = self.peek()
+        if not char or char not in chars:
+            raise ValueError(f"Expected one of {chars!r} but found {char or 'end of file'!r}")
+        self._pos += 1
+        return char
+
+    def _fill_value(self):
+        """Reads another chunk for a value that runs past the buffer; False at end of file."""
+        if len(self._buffer) - self._pos > self._max_value_chars:
+            raise ValueError(f"JSON value larger than {self._max_value_chars} characters")
+        return self._fill()
+
+    def decode(self):
+        """
+        Decodes and returns the next complete JSON value. More of the file is
+        only read while the value may be cut off by the end of the buffer, so a
+        syntax error doesn't pull the rest of the file into memory.
+        """
+        self.peek()
+        while True:
+            try:
+                value, end = self._decoder.raw_decode(self._buffer, self._pos)
+            except json.JSONDecodeError as e:
+                # An unterminated string runs to the end of the buffer (its error points at its start)
+                truncated = (e.pos >= len(self._buffer) - _TRUNCATION_WINDOW
+                             or e.msg.startswith("Unterminated string"))
+                if truncated and self._fill_value():
+                    continue
+                raise
+            # A number at the end of the buffer may continue in the next chunk
+            if end == len(self._buffer) and self._fill_value():
+                continue
+            self._pos = end
+            return value
+
+    def iter_array(self):
+        """Yields the items of the array starting at the current position."""
+        self.expect("[")
+        if self.peek() == "]":
+            self._pos += 1
+            return
+        while True:
+            yield self.decode()
+            if self.expect(",]") == "]":
+                return
+
+
+def iter_json_records(f):
+    """
+    Streams (section, record) pairs from a JSON document: the items of its
+    top-level RECORD_SECTIONS arrays, or of the document itself if it is an
+    array (section None). Other top-level keys are skipped.
+    """
+    stream = _JSONStream(f)
+    if stream.peek() == "[":
+        for record in stream.iter_array():
+            yield None, record
+        return
+
+    stream.expect("{")
+    if stream.peek() == "}":
+        return
+    while True:
+        key = stream.decode()
+        stream.expect(":")
+        if key in RECORD_SECTIONS and stream.peek() == "[":
+            for record in stream.iter_array():
+                yield key, record
+        else:
+            stream.decode()  # Not knowledge base data
+        if stream.expect(",}") == "}":
+            return
+
+
+def iter_jsonl_records(f):
+    """Streams (section, record) pairs from a JSONL file (see iter_json_records)."""
+    for line_number, line in enumerate(f, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError as e:
+            print(f"Warning: Skipping invalid JSON on line {line_number} of '{f.name}': {e}")
+            continue
+        if isinstance(record, dict) and any(section in record for section in RECORD_SECTIONS):
+            # A whole document on one line
+            for section in RECORD_SECTIONS:
+                for item in record.get(section) or []:
+                    yield section, item
+        else:
+            yield None, record
+
+
+def iter_source_files(path):
+    """Yields the files of a source: the path itself, or the shard files under a directory, in name order."""
+    if not os.path.isdir(path):
+        yield path
+        return
+    for directory, subdirectories, filenames in os.walk(path):
+        subdirectories.sort()
+        for filename in sorted(filenames):
+            if filename.endswith(SHARD_EXTENSIONS):
+                yield os.path.join(directory, filename)
+
+
+def iter_file_records(filepath):
+    """Streams the (section, record) pairs of one JSON or JSONL file."""
+    with open(filepath, 'r', encoding='utf-8') as f:
+        records = iter_jsonl_records(f) if filepath.endswith(".jsonl") else iter_json_records(f)
+        yield from records
+
+
+def record_to_intent(section, record):
+    """
+    Converts a record from any supported format to a raw intent
+    ({"tag", "patterns", "responses"}), or returns None if it isn't one.
+    """
+    if not isinstance(record, dict):
+        return None
+    if section == "intents" or "patterns" in record:
+        return {"tag": record.get("tag"), "patterns": record.get("patterns") or [],
+                "responses": record.get("responses") or []}
+    if section == "questions_answers" or "question" in record:
+        if not record.get("question") or not record.get("answer"):
+            return None
+        return {"tag": f"qa_{record.get('id') or preprocess_input(record['question'])}",
+                "patterns": [record["question"]], "responses": [record["answer"]]}
+    if section == "products" or ("name" in record and "description" in record):
+        if not record.get("name") or not record.get("description"):
+            return None
+        response = f"{record['name']}: {record['description']}"
+        if record.get("price") is not None:
+            response += f" Price: {record['price']}"
+        return {"tag": f"product_{record.get('id') or preprocess_input(record['name'])}",
+                "patterns": [record["name"]], "responses": [response]}
+    return None
+
+
+class KnowledgeBaseMerger:
+    """
+    Accumulates raw intents from several sources into one knowledge base.
+    Each preprocessed pattern is kept only for the first intent that has it,
+    in any source (including repeats within one source, which could never win
+    a match), and intents sharing a tag are merged (patterns and responses,
+    without repeats).
+    """
+
+    def __init__(self):
+        self._builder = IntentTableBuilder()  # Patterns go straight into the compact intent table
+        self._intent_ids = {}  # tag -> intent id in the builder
+        self._responses_seen = {}  # tag -> set of responses already in the intent
+        self._patterns_seen = set()
+        self.records = 0
+        self.skipped_records = 0
+        self.duplicate_patterns = 0
+
+    def add(self, raw_intent):
+        """Adds one raw intent (see record_to_intent); None counts as a skipped record."""
+        self.records += 1
+        if raw_intent is None:
+            self.skipped_records += 1
+            return
+        processed_intent = preprocess_intent(raw_intent)
+        if processed_intent is None:
+            self.skipped_records += 1
+            return
+
+        tag = processed_intent["tag"]
+        intent_id = self._intent_ids.get(tag)
+        if intent_id is None:
+            intent_id = self._intent_ids[tag] = self._builder.add_intent(tag)
+            self._responses_seen[tag] = set()
+
+        for p_pattern_info in processed_intent["processed_patterns_data"]:
+            if p_pattern_info["text"] in self._patterns_seen:
+                self.duplicate_patterns += 1
+                continue
+            self._patterns_seen.add(p_pattern_info["text"])
+            self._builder.add_pattern(intent_id, p_pattern_info["text"])
+
+        responses_seen = self._responses_seen[tag]
+        for response in processed_intent["responses"]:
+            if response not in responses_seen:
+                responses_seen.add(response)
+                self._builder.add_response(intent_id, response)
+
+    def add_file(self, filepath):
+        """Streams every record of one JSON or JSONL file into the knowledge base."""
+        for section, record in iter_file_records(filepath):
+            self.add(record_to_intent(section, record))
+
+    def build(self):
+        """Returns the processed knowledge base (see Chat_utils.build_processed_knowledge_base)."""
+        # An intent whose patterns were all duplicates is dropped by the builder
+        return build_processed_knowledge_base(self._builder.build())
+
+    def get_stats(self):
+        """Returns merge statistics as a JSON-serializable dict."""
+        return {
+            "records": self.records,
+            "skipped_records": self.skipped_records,
+            "intents": len(self._intent_ids),
+            "patterns": len(self._patterns_seen),
+            "duplicate_patterns": self.duplicate_patterns,
+        }
+
+
+def load_knowledge_base_sources(paths, merger=None):
+    """
+    Loads and merges knowledge base files and shard directories, in order.
+    Returns the processed knowledge base, or None if a source can't be read
+    or no intents were found. Pass a KnowledgeBaseMerger to inspect its statistics.
+    """
+    merger = merger or KnowledgeBaseMerger()
+    for path in paths:
+        for filepath in iter_source_files(path):
+            try:
+                merger.add_file(filepath)
+            except (OSError, ValueError) as e:
+                print(f"Error: Could not load knowledge base source '{filepath}': {e}")
+                return None
+
+    knowledge_base = merger.build()
+    if not knowledge_base["intents"]:
+        print("Error: No intents found in the knowledge base sources.")
+        return None
+    return knowledge_base
+
+
+def main(argv):
+    if len(argv) < 2:
+        print("Usage: python kb_loader.py <file_or_directory> [...]")
+        return 1
+    merger = KnowledgeBaseMerger()
+    start_time = time.perf_counter()
+    knowledge_base = load_knowledge_base_sources(argv[1:], merger)
+    if knowledge_base is None:
+        return 1
+    stats = merger.get_stats()
+    print(f"Loaded {stats['intents']} intents with {stats['patterns']} patterns from {stats['records']} records "
+          f"in {time.perf_counter() - start_time:.2f}s "
+          f"({stats['duplicate_patterns']} duplicate patterns, {stats['skipped_records']} records skipped).")
+    try:
+        import resource
+        # ru_maxrss is in kilobytes on Linux
+        print(f"Peak memory: {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.1f} MiB")
+    except ImportError:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
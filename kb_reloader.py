@@ -0,0 +1,182 @@
+# kb_reloader.py
+# Watches the knowledge base JSON file and rebuilds the processed knowledge base
+# in a background thread when it changes, so the Flask app picks up KB edits
+# without a restart.
+# Intents whose raw JSON did not change reuse their previously preprocessed
+# patterns; only the compact intent table and match indexes are rebuilt. The new knowledge base is swapped
+# in with a single reference assignment, so readers always see a complete structure.
+# With extra sources (other files or shard directories, see kb_loader.py), a change to
+# any of them triggers a full merged rebuild instead.
+
+import json
+import os
+import threading
+import time
+
+from Chat_utils import read_knowledge_base_file, preprocess_intent, build_processed_knowledge_base
+from kb_compact import IntentTableBuilder
+from kb_loader import iter_source_files, load_knowledge_base_sources
+
+
+class KnowledgeBaseReloader:
+    """
+    Holds the current processed knowledge base and reloads it when the source
+    file's (or an extra source's) modification time or size changes (polled
+    every poll_interval seconds).
+    """
+
+    def __init__(self, filepath, knowledge_base=None, poll_interval=2.0, extra_sources=()):
+        self.filepath = filepath
+        self.poll_interval = poll_interval
+        self.extra_sources = list(extra_sources)
+        self._knowledge_base = knowledge_base
+        self._intent_cache = {}  # raw intent JSON -> (tag, pattern texts, responses) or None
+        self._file_signature = self._get_file_signature()
+        self._lock = threading.Lock()  # Serializes rebuilds (poll thread vs. manual reload)
+        self._stop_event = threading.Event()
+        self._thread = None
+
+        # Reload statistics
+        self.reload_count = 0
+        self.failed_reload_count = 0
+        self.last_build_seconds = None
+        self.last_reload_time = None
+        self.last_intents_reused = 0
+        self.last_intents_rebuilt = 0
+
+    @property
+    def knowledge_base(self):
+        """The current processed knowledge base (never a half-built one)."""
+        return self._knowledge_base
+
+    def _get_file_signature(self):
+        try:
+            stat = os.stat(self.filepath)
+        except OSError:
+            return None
+        if not self.extra_sources:
+            return stat.st_mtime_ns, stat.st_size
+        signature = [(self.filepath, stat.st_mtime_ns, stat.st_size)]
+        for source in self.extra_sources:
+            for filepath in iter_source_files(source):
+                try:
+                    source_stat = os.stat(filepath)
+                except OSError:
+                    continue  # Missing sources are reported by the reload itself
+                signature.append((filepath, source_stat.st_mtime_ns, source_stat.st_size))
+        return tuple(signature)
+
+    def _rebuild_incrementally(self):
+        """
+        Rebuilds the knowledge base from the source file, reusing intents that didn't change.
+        Returns (knowledge_base, intent_cache, reused, rebuilt); knowledge_base is None on failure.
+        """
+        raw_knowledge_base = read_knowledge_base_file(self.filepath)
+        if raw_knowledge_base is None:
+            return None, self._intent_cache, 0, 0
+
+        new_intent_cache = {}
+        builder = IntentTableBuilder()
+        reused = rebuilt = 0
+        for intent_data in raw_knowledge_base["intents"]:
+            intent_key = json.dumps(intent_data, sort_keys=True)
+            if intent_key in new_intent_cache:
+                cached_intent = new_intent_cache[intent_key]
+                reused += 1
+            elif intent_key in self._intent_cache:
+                cached_intent = self._intent_cache[intent_key]
+                reused += 1
+            else:
+                processed_intent = preprocess_intent(intent_data)
+                # Only what the intent table needs is kept, not the per-pattern dicts
+                cached_intent = processed_intent and (
+                    processed_intent["tag"],
+                    tuple(p_pattern_info["text"] for p_pattern_info in processed_intent["processed_patterns_data"]),
+                    tuple(processed_intent["responses"]))
+                rebuilt += 1
+            new_intent_cache[intent_key] = cached_intent
+            if cached_intent:
+                tag, pattern_texts, responses = cached_intent
+                intent_id = builder.add_intent(tag, responses)
+                for pattern_text in pattern_texts:
+                    builder.add_pattern(intent_id, pattern_text)
+
+        return build_processed_knowledge_base(builder.build()), new_intent_cache, reused, rebuilt
+
+    def reload(self):
+        """
+        Rebuilds the knowledge base from the source file(s) and swaps it in.
+        Returns True on success; on failure the current knowledge base is kept.
+        """
+        with self._lock:
+            self._file_signature = self._get_file_signature()
+            start_time = time.perf_counter()
+
+            if self.extra_sources:
+                new_knowledge_base = load_knowledge_base_sources([self.filepath] + self.extra_sources)
+                new_intent_cache, reused = {}, 0
+                rebuilt = len(new_knowledge_base["intents"]) if new_knowledge_base else 0
+            else:
+                new_knowledge_base, new_intent_cache, reused, rebuilt = self._rebuild_incrementally()
+            if new_knowledge_base is None:
+                self.failed_reload_count += 1
+                print("JARVIS Backend: Knowledge base reload failed, keeping the current version.")
+                return False
+
+            if not new_knowledge_base.get("intents"):
+                self.failed_reload_count += 1
+                print("JARVIS Backend: Reloaded knowledge base has no intents, keeping the current version.")
+                return False
+
+            # Atomic swap: readers see either the old or the new knowledge base
+            self._knowledge_base = new_knowledge_base
+            self._intent_cache = new_intent_cache
+
+            self.reload_count += 1
+            self.last_build_seconds = time.perf_counter() - start_time
+            self.last_reload_time = time.time()
+            self.last_intents_reused = reused
+            self.last_intents_rebuilt = rebuilt
+            print(f"JARVIS Backend: Knowledge base reloaded in {self.last_build_seconds * 1000:.1f} ms "
+                  f"({rebuilt} intents rebuilt, {reused} reused).")
+            return True
+
+    def check_for_changes(self):
+        """Reloads the knowledge base if the source file changed since the last build."""
+        signature = self._get_file_signature()
+        if signature is not None and signature != self._file_signature:
+            return self.reload()
+        return False
+
+    def _watch(self):
+        while not self._stop_event.wait(self.poll_interval):
+            try:
+                self.check_for_changes()
+            except Exception as e:
+                print(f"JARVIS Backend: Error while checking the knowledge base for changes: {e}")
+
+    def start(self):
+        """Starts the background watcher thread (no-op if already running)."""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._watch, name="kb-reloader", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background watcher thread."""
+        self._stop_event.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
+
+    def get_stats(self):
+        """Returns reload statistics as a JSON-serializable dict."""
+        return {
+            "reload_count": self.reload_count,
+            "failed_reload_count": self.failed_reload_count,
+            "last_build_seconds": self.last_build_seconds,
+            "last_reload_time": self.last_reload_time,
+            "last_intents_reused": self.last_intents_reused,
+            "last_intents_rebuilt": self.last_intents_rebuilt,
+        }
@@ -0,0 +1,227 @@
+# kb_snapshot.py
+# Compiled binary snapshot of the processed knowledge base.
+# The snapshot stores the output of load_and_preprocess_knowledge_base (compact intent
+# table, keyword index, phrase automaton, fuzzy index and, if NumPy is available, the
+# batch token-incidence arrays) so a process can skip re-parsing and re-preprocessing
+# the JSON on start. It is keyed by a SHA-256 of the source JSON and is ignored when stale.
+#
+# File layout (all integers little-endian):
+#   header:  magic (8 bytes) | format version (uint32) | source sha256 (32 bytes)
+#            | buffer count (uint32) | pickle offset (uint64) | pickle length (uint64)
+#   table:   (offset uint64, length uint64) for each out-of-band buffer
+#   data:    out-of-band buffers (64-byte aligned), then the pickle payload
+#
+# The arrays everything above is made of (array.array, and NumPy arrays) are pickled
+# out-of-band (protocol 5) and handed back as views into a read-only memory map: an
+# array.array comes back as a memoryview cast to its type code, which supports the same
+# indexing, slicing and bisect. Forked workers loading the same snapshot share those
+# pages through the OS page cache instead of copying them. The keyword index is written
+# as one postings array (PackedKeywordIndex) rather than an array per keyword. Only the
+# strings (intent table, fuzzy vocabulary) and the object structure stay in the pickle.
+#
+# Usage: python kb_snapshot.py [knowledge_base.json] [snapshot_path]
+
+import hashlib
+import io
+import mmap
+import os
+import pickle
+import struct
+import sys
+from array import array
+from collections.abc import Mapping
+
+SNAPSHOT_MAGIC = b"JVKBSNAP"
+SNAPSHOT_VERSION = 4  # Bump whenever the processed KB structure or preprocessing changes
+SNAPSHOT_EXTENSION = ".kbsnap"
+_HEADER = struct.Struct("<8sI32sIQQ")
+_BUFFER_ENTRY = struct.Struct("<QQ")
+_ALIGNMENT = 64
+# Type codes of the arrays written out-of-band (memoryview.cast supports these)
+_SHARED_TYPECODES = frozenset("bBhHiIlLqQfd")
+
+
+def default_snapshot_path(kb_filepath):
+    """Returns the snapshot path used for a knowledge base file (same name, .kbsnap extension)."""
+    return os.path.splitext(kb_filepath)[0] + SNAPSHOT_EXTENSION
+
+
+def hash_source_file(kb_filepath):
+    """Returns the SHA-256 digest of the knowledge base source file."""
+    digest = hashlib.sha256()
+    with open(kb_filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def _align(position):
+    return (position + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _typed_view(buffer, typecode):
+    """Unpickles an out-of-band array: a read-only view of its buffer, with the array's type code."""
+    return memoryview(buffer).cast(typecode)
+
+
+class _SnapshotPickler(pickle.Pickler):
+    """Pickler that writes array.array objects (and typed views of loaded ones) out-of-band."""
+
+    def reducer_override(self, obj):
+        if type(obj) is array and obj.typecode in _SHARED_TYPECODES:
+            return _typed_view, (pickle.PickleBuffer(obj), obj.typecode)
+        if type(obj) is memoryview and obj.format in _SHARED_TYPECODES and obj.ndim == 1 and obj.contiguous:
+            return _typed_view, (pickle.PickleBuffer(obj), obj.format)
+        return NotImplemented
+
+
+class PackedKeywordIndex(Mapping):
+    """
+    The keyword index (token -> pattern ids, see Chat_utils.build_keyword_index)
+    with the postings of all tokens in one array, which is how snapshots store it.
+    Lookups return slices of that array.
+    """
+
+    def __init__(self, tokens, offsets, postings):
+        self._tokens = tokens
+        self._slots = {token: slot for slot, token in enumerate(tokens)}
+        self._offsets = offsets  # Postings of token i are postings[offsets[i]:offsets[i + 1]]
+        self._postings = postings
+
+    @classmethod
+    def from_dict(cls, keyword_index):
+        offsets = array('q', [0])
+        postings = array('i')
+        for pattern_ids in keyword_index.values():
+            postings.extend(pattern_ids)
+            offsets.append(len(postings))
+        return cls(list(keyword_index), offsets, postings)
+
+    def __reduce__(self):
+        return PackedKeywordIndex, (self._tokens, self._offsets, self._postings)
+
+    def __getitem__(self, token):
+        slot = self._slots[token]
+        return self._postings[self._offsets[slot]:self._offsets[slot + 1]]
+
+    def get(self, token, default=None):
+        slot = self._slots.get(token)
+        if slot is None:
+            return default
+        return self._postings[self._offsets[slot]:self._offsets[slot + 1]]
+
+    def __contains__(self, token):
+        return token in self._slots
+
+    def __iter__(self):
+        return iter(self._tokens)
+
+    def __len__(self):
+        return len(self._tokens)
+
+
+def write_snapshot(knowledge_base, source_hash, snapshot_path):
+    """
+    Writes a processed knowledge base to snapshot_path. The file is written to
+    a temporary name first and then renamed, so readers never see a partial file.
+    """
+    if isinstance(knowledge_base.get("keyword_index"), dict):
+        keyword_index = PackedKeywordIndex.from_dict(knowledge_base["keyword_index"])
+        knowledge_base = dict(knowledge_base, keyword_index=keyword_index)
+    buffers = []
+    with io.BytesIO() as stream:
+        _SnapshotPickler(stream, protocol=5, buffer_callback=buffers.append).dump(knowledge_base)
+        payload = stream.getvalue()
+    raw_buffers = [buffer.raw() for buffer in buffers]
+
+    position = _HEADER.size + _BUFFER_ENTRY.size * len(raw_buffers)
+    buffer_table = []
+    for raw in raw_buffers:
+        position = _align(position)
+        buffer_table.append((position, raw.nbytes))
+        position += raw.nbytes
+    pickle_offset = _align(position)
+
+    temp_path = f"{snapshot_path}.tmp{os.getpid()}"
+    with open(temp_path, 'wb') as f:
+        f.write(_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, source_hash,
+                             len(raw_buffers), pickle_offset, len(payload)))
+        for offset, length in buffer_table:
+            f.write(_BUFFER_ENTRY.pack(offset, length))
+        for (offset, _), raw in zip(buffer_table, raw_buffers):
+            f.seek(offset)
+            f.write(raw)
+        f.seek(pickle_offset)
+        f.write(payload)
+    os.replace(temp_path, snapshot_path)
+
+
+def compile_snapshot(kb_filepath="knowledge_base.json", snapshot_path=None):
+    """
+    Loads and preprocesses the JSON knowledge base and writes its snapshot.
+    Returns the snapshot path, or None if the knowledge base could not be loaded.
+    """
+    from Chat_utils import load_and_preprocess_knowledge_base
+    import batch_scoring
+
+    snapshot_path = snapshot_path or default_snapshot_path(kb_filepath)
+    source_hash = hash_source_file(kb_filepath)
+    knowledge_base = load_and_preprocess_knowledge_base(kb_filepath)
+    if not knowledge_base:
+        return None
+
+    # Precompute the batch scoring arrays too, so they are shared from the snapshot
+    if batch_scoring.np is not None:
+        knowledge_base["token_incidence"] = batch_scoring.build_token_incidence(knowledge_base)
+
+    write_snapshot(knowledge_base, source_hash, snapshot_path)
+    return snapshot_path
+
+
+def load_snapshot(kb_filepath="knowledge_base.json", snapshot_path=None):
+    """
+    Loads the processed knowledge base from its snapshot by memory-mapping it
+    read-only. Returns None if the snapshot is missing, was built by a different
+    snapshot version, or was built from a different version of kb_filepath
+    (the caller should then fall back to load_and_preprocess_knowledge_base).
+    """
+    snapshot_path = snapshot_path or default_snapshot_path(kb_filepath)
+    if not os.path.exists(snapshot_path):
+        return None
+
+    try:
+        source_hash = hash_source_file(kb_filepath)
+        with open(snapshot_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not open knowledge base snapshot '{snapshot_path}': {e}")
+        return None
+
+    try:
+        magic, version, snapshot_hash, buffer_count, pickle_offset, pickle_length = \
+            _HEADER.unpack_from(mapped, 0)
+        if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION or snapshot_hash != source_hash:
+            mapped.close()
+            return None
+
+        view = memoryview(mapped)
+        buffers = []
+        for index in range(buffer_count):
+            offset, length = _BUFFER_ENTRY.unpack_from(mapped, _HEADER.size + index * _BUFFER_ENTRY.size)
+            buffers.append(view[offset:offset + length])
+        # The buffer views keep the memory map alive for as long as the KB uses them
+        return pickle.loads(view[pickle_offset:pickle_offset + pickle_length], buffers=buffers)
+    except Exception as e:
+        print(f"Warning: Could not read knowledge base snapshot '{snapshot_path}': {e}")
+        return None
+
+
+if __name__ == '__main__':
+    source = sys.argv[1] if len(sys.argv) > 1 else "knowledge_base.json"
+    target = sys.argv[2] if len(sys.argv) > 2 else None
+    written = compile_snapshot(source, target)
+    if written:
+        print(f"Knowledge base snapshot written to {written}")
+    else:
+        print(f"Error: Could not compile a snapshot from {source}.")
+        sys.exit(1)
@@ -0,0 +1,249 @@
+# llm_backend.py
+# Language model backends for general chat. Main.py only talks to the LLMBackend interface,
+# so the model behind it can be swapped through configuration (LLM_BACKEND).
+#
+# Backends:
+#   GeminiBackend  - Google Gemini through google.generativeai (imported on first use)
+#   FakeBackend    - local, deterministic stand-in with configurable latency distribution,
+#                    token rate, error rate and response size, for load tests and
+#                    benchmarks without network access or API spend
+
+import asyncio
+import hashlib
+import math
+import random
+import threading
+import time
+
+
+class LLMBackendError(Exception):
+    """Raised by a backend when a generation fails."""
+
+
+class LLMBackend:
+    """
+    Interface for language model backends. generate() returns a whole reply,
+    stream() yields it in text chunks as they are produced, and agenerate() is
+    the asyncio version of generate(). timeout is in seconds (None: no limit).
+    """
+
+    name = "llm"  # Configuration name (LLM_BACKEND)
+    label = "a language model"  # How the chat page refers to it
+    model_name = ""  # Part of the reply cache key
+
+    def load(self):
+        """Prepares the backend (imports, clients) if needed; returns True if it can serve requests."""
+        return True
+
+    def available(self):
+        """Cheap check, without loading: False if the backend is known not to work (e.g. load() failed)."""
+        return True
+
+    def generate(self, prompt, timeout=None):
+        """Returns the reply to prompt."""
+        raise NotImplementedError
+
+    def stream(self, prompt, timeout=None):
+        """Yields the reply to prompt in chunks. By default the whole reply is one chunk."""
+        yield self.generate(prompt, timeout)
+
+    async def agenerate(self, prompt, timeout=None):
+        """Returns the reply to prompt without blocking the event loop."""
+        return await asyncio.to_thread(self.generate, prompt, timeout)
+
+    def get_stats(self):
+        """Returns backend statistics as a JSON-serializable dict."""
+        return {"backend": self.name, "model": self.model_name}
+
+
+class GeminiBackend(LLMBackend):
+    """
+    Google Gemini. The client library (with grpc and protobuf) takes about a
+    second to import, so it is loaded by the first load() call rather than here.
+    If initialization fails the backend stays unavailable.
+    """
+
+    name = "gemini"
+    label = "Gemini"
+
+    def __init__(self, api_key, model_name="gemini-1.5-flash-latest", transport=None):
+        self.api_key = api_key
+        self.model_name = model_name
+        self.transport = transport  # 'grpc' (the library default) or 'rest'
+        self._model = None
+        self._failed = not api_key
+        self._lock = threading.Lock()
+
+    def load(self):
+        if self._model is not None or self._failed:
+            return self._model is not None
+        with self._lock:
+            if self._model is None and not self._failed:
+                try:
+                    import google.generativeai as genai # Import the Google Generative AI library
+                    genai.configure(api_key=self.api_key, transport=self.transport)
+                    # You can choose a different model like 'gemini-1.5-flash-latest' or 'gemini-1.5-pro-latest'
+                    # based on your needs and availability.
+                    self._model = genai.GenerativeModel(self.model_name)
+                    print("JARVIS Backend: Gemini model initialized.")
+                except Exception as e:
+                    print(f"Error configuring or initializing Gemini model: {e}")
+                    print("Gemini chat functionality will be unavailable.")
+                    self._failed = True
+        return self._model is not None
+
+    def available(self):
+        return not self._failed
+
+    def _get_model(self):
+        if not self.load():
+            raise LLMBackendError("Gemini is not available")
+        return self._model
+
+    @staticmethod
+    def _request_options(timeout):
+        return {"timeout": timeout} if timeout is not None else {}
+
+    def generate(self, prompt, timeout=None):
+        response = self._get_model().generate_content(prompt, request_options=self._request_options(timeout))
+        return response.text
+
+    def stream(self, prompt, timeout=None):
+        for chunk in self._get_model().generate_content(prompt, stream=True,
+                                                        request_options=self._request_options(timeout)):
+            if chunk.text:
+                yield chunk.text
+
+    async def agenerate(self, prompt, timeout=None):
+        response = await self._get_model().generate_content_async(
+            prompt, request_options=self._request_options(timeout))
+        return response.text
+
+
+class FakeBackend(LLMBackend):
+    """
+    Local stand-in for a hosted model. Each call waits for a time to first token
+    drawn from a log-normal distribution (median latency_ms, spread latency_sigma),
+    then produces response_tokens words at tokens_per_second, in chunks of
+    chunk_tokens. A call fails with LLMBackendError with probability error_rate.
+
+    The reply text depends only on the prompt; latencies and failures come from a
+    generator seeded with seed, so a run is reproducible for a given call order.
+    Waiting uses time.sleep (cooperative under gevent) or asyncio.sleep.
+    """
+
+    name = "fake"
+    label = "a local stand-in model"
+    model_name = "fake"
+
+    WORDS = ("the", "a", "study", "answer", "python", "list", "value", "function", "book", "chapter",
+             "example", "because", "which", "returns", "each", "simple", "data", "loop", "note", "result")
+
+    def __init__(self, latency_ms=500.0, latency_sigma=0.5, tokens_per_second=50.0, error_rate=0.0,
+                 response_tokens=100, chunk_tokens=8, seed=0):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.error_rate = error_rate
+        self.response_tokens = int(response_tokens)
+        self.chunk_tokens = max(1, int(chunk_tokens))
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.errors = 0
+
+    def _plan(self):
+        """Draws one call's time to first token (seconds) and whether it fails."""
+        with self._lock:
+            self.calls += 1
+            first_token_delay = self.latency_ms / 1000 * math.exp(self._rng.gauss(0, self.latency_sigma))
+            fails = self._rng.random() < self.error_rate
+            if fails:
+                self.errors += 1
+        return first_token_delay, fails
+
+    def _chunks(self, prompt):
+        """The reply's text chunks, derived from the prompt."""
+        text_rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).digest())
+        words = [text_rng.choice(self.WORDS) for _ in range(self.response_tokens)]
+        for start in range(0, len(words), self.chunk_tokens):
+            chunk = " ".join(words[start:start + self.chunk_tokens])
+            yield chunk if start == 0 else " " + chunk
+
+    def _chunk_delay(self):
+        return self.chunk_tokens / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _check_deadline(self, delay, deadline):
+        """Raises TimeoutError (after sleeping until the deadline) if delay would overrun it."""
+        if deadline is not None and time.monotonic() + delay > deadline:
+            time.sleep(max(0.0, deadline - time.monotonic()))
+            raise TimeoutError("fake backend call did not finish within its timeout")
+
+    def stream(self, prompt, timeout=None):
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        first_token_delay, fails = self._plan()
+        self._check_deadline(first_token_delay, deadline)
+        time.sleep(first_token_delay)
+        if fails:
+            raise LLMBackendError("fake backend error")
+        for index, chunk in enumerate(self._chunks(prompt)):
+            if index:
+                self._check_deadline(self._chunk_delay(), deadline)
+                time.sleep(self._chunk_delay())
+            yield chunk
+
+    def generate(self, prompt, timeout=None):
+        return "".join(self.stream(prompt, timeout))
+
+    async def agenerate(self, prompt, timeout=None):
+        first_token_delay, fails = self._plan()
+        chunks = list(self._chunks(prompt))
+        total_delay = first_token_delay + self._chunk_delay() * (len(chunks) - 1)
+        if timeout is not None and total_delay > timeout:
+            await asyncio.sleep(timeout)
+            raise TimeoutError("fake backend call did not finish within its timeout")
+        await asyncio.sleep(first_token_delay)
+        if fails:
+            raise LLMBackendError("fake backend error")
+        await asyncio.sleep(total_delay - first_token_delay)
+        return "".join(chunks)
+
+    def get_stats(self):
+        with self._lock:
+            return dict(super().get_stats(), calls=self.calls, errors=self.errors,
+                        latency_ms=self.latency_ms, latency_sigma=self.latency_sigma,
+                        tokens_per_second=self.tokens_per_second, error_rate=self.error_rate,
+                        response_tokens=self.response_tokens)
+
+
+def parse_backend_options(text):
+    """Parses 'key=value,key=value' backend options (e.g. FAKE_LLM_OPTIONS) into a dict of numbers."""
+    options = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        key, separator, value = item.partition("=")
+        if not separator:
+            raise ValueError(f"Invalid backend option '{item.strip()}' (expected key=value)")
+        options[key.strip()] = float(value)
+    return options
+
+
+def create_llm_backend(backend="gemini", gemini_api_key=None, gemini_model_name="gemini-1.5-flash-latest",
+                       gemini_transport=None, fake_options=""):
+    """
+    Creates an LLM backend from configuration ('gemini' or 'fake'). fake_options
+    holds FakeBackend keyword arguments as 'key=value,...'. Returns None if the
+    backend can't be used (no Gemini API key).
+    """
+    if backend == "fake":
+        try:
+            return FakeBackend(**parse_backend_options(fake_options))
+        except (TypeError, ValueError) as e:
+            print(f"Warning: Invalid fake LLM options '{fake_options}' ({e}); using the defaults.")
+            return FakeBackend()
+    if backend != "gemini":
+        print(f"Warning: Unknown LLM backend '{backend}', using Gemini.")
+    if not gemini_api_key:
+        return None
+    return GeminiBackend(gemini_api_key, gemini_model_name, gemini_transport)
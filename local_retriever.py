@@ -0,0 +1,151 @@
+# local_retriever.py
+# Cheap first-pass answer retrieval that runs before a general chat message is sent to Gemini.
+# Every knowledge base pattern and every question (or product name) from the Q&A files becomes a
+# document; the files are read with kb_loader, so they can be in any format it merges.
+# Documents are TF-IDF vectors with BM25-style term frequency saturation, normalized to unit length
+# and stored as a sparse term -> (document ids, weights) matrix, so a query only touches
+# the columns of its own terms. A query is answered locally when its cosine similarity to
+# the best document reaches the confidence threshold; otherwise it goes upstream.
+
+import math
+import random
+import threading
+
+from Chat_utils import preprocess_input
+from kb_loader import iter_file_records, iter_source_files, record_to_intent
+
+# BM25 term frequency saturation: repeating a word in a document adds less and less weight
+BM25_K1 = 1.2
+
+
+def read_qa_file(filepath):
+    """
+    Reads (question, answers) pairs from a knowledge base source in any format
+    kb_loader merges (intents, questions_answers and products; JSON, JSONL or a
+    shard directory), one pair per pattern. The 'default' intent is skipped.
+    Returns an empty list (with a warning) if the source can't be used.
+    """
+    pairs = []
+    try:
+        for source_file in iter_source_files(filepath):
+            for section, record in iter_file_records(source_file):
+                raw_intent = record_to_intent(section, record)
+                if not raw_intent or raw_intent["tag"] == "default" or not raw_intent["responses"]:
+                    continue
+                pairs.extend((pattern_text, raw_intent["responses"]) for pattern_text in raw_intent["patterns"])
+    except (OSError, ValueError) as e:
+        print(f"Warning: Could not read local answer source '{filepath}': {e}")
+        return []
+    return pairs
+
+
+def knowledge_base_documents(knowledge_base):
+    """Returns (pattern_text, responses) pairs for a processed knowledge base."""
+    pairs = []
+    for intent_data in knowledge_base.get("intents", []):
+        if intent_data.get("tag") == "default" or not intent_data.get("responses"):
+            continue
+        for p_pattern_info in intent_data.get("processed_patterns_data", []):
+            pairs.append((p_pattern_info["text"], intent_data["responses"]))
+    return pairs
+
+
+def _term_weights(terms, idf, unseen_idf):
+    """
+    Unit-length TF-IDF weights for a list of terms. Terms missing from idf get
+    unseen_idf: a query word no document contains still counts against the match.
+    """
+    counts = {}
+    for term in terms:
+        counts[term] = counts.get(term, 0) + 1
+    weights = {term: (count * (BM25_K1 + 1) / (count + BM25_K1)) * idf.get(term, unseen_idf)
+               for term, count in counts.items()}
+    norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+    if not norm:
+        return {}
+    return {term: weight / norm for term, weight in weights.items()}
+
+
+class LocalRetriever:
+    """
+    Finds the document most similar to a message and returns one of its
+    answers when the similarity reaches threshold (0 disables local answers).
+    Keeps hit / miss counts so the share of traffic answered locally can be reported.
+    """
+
+    def __init__(self, documents, threshold=0.8):
+        """documents is a list of (text, responses) pairs."""
+        self.threshold = threshold
+        self.responses = []
+        document_terms = []
+        for text, responses in documents:
+            terms = preprocess_input(text).split()
+            if terms:
+                document_terms.append(terms)
+                self.responses.append(responses)
+
+        # Smoothed inverse document frequency
+        document_frequency = {}
+        for terms in document_terms:
+            for term in set(terms):
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        document_count = len(document_terms)
+        self.idf = {term: math.log(1 + (document_count - frequency + 0.5) / (frequency + 0.5))
+                    for term, frequency in document_frequency.items()}
+        self.unseen_idf = math.log(1 + (document_count + 0.5) / 0.5)
+
+        # Sparse matrix, one column per term
+        self._columns = {}
+        for document_id, terms in enumerate(document_terms):
+            for term, weight in _term_weights(terms, self.idf, self.unseen_idf).items():
+                column = self._columns.setdefault(term, ([], []))
+                column[0].append(document_id)
+                column[1].append(weight)
+
+        self._stats_lock = threading.Lock()
+        self.queries = 0
+        self.hits = 0
+
+    def best_match(self, processed_text):
+        """
+        Returns (similarity, document_id) for the most similar document to the
+        (preprocessed) text, or None if it shares no terms with any document.
+        Ties go to the document added first.
+        """
+        scores = {}
+        for term, query_weight in _term_weights(processed_text.split(), self.idf, self.unseen_idf).items():
+            document_ids, weights = self._columns.get(term, ((), ()))
+            for document_id, weight in zip(document_ids, weights):
+                scores[document_id] = scores.get(document_id, 0.0) + query_weight * weight
+        if not scores:
+            return None
+        document_id = min(scores, key=lambda d: (-scores[d], d))
+        return scores[document_id], document_id
+
+    def answer(self, user_input, rng=random):
+        """
+        Returns a local answer to user_input if the best document is similar
+        enough, or None if the message should go upstream.
+        """
+        if self.threshold <= 0:
+            return None
+        match = self.best_match(preprocess_input(user_input))
+        is_hit = match is not None and match[0] >= self.threshold
+        with self._stats_lock:
+            self.queries += 1
+            if is_hit:
+                self.hits += 1
+        if not is_hit:
+            return None
+        return rng.choice(self.responses[match[1]])
+
+    def get_stats(self):
+        """Returns retrieval statistics as a JSON-serializable dict."""
+        with self._stats_lock:
+            return {
+                "documents": len(self.responses),
+                "threshold": self.threshold,
+                "queries": self.queries,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.queries if self.queries else 0.0,
+            }
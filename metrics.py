@@ -0,0 +1,219 @@
+# metrics.py
+# In-process latency histograms for the chat pipeline, exposed in the Prometheus text format.
+# Code marks the steps it wants timed with spans (with metrics.span("get_response"): ...); each
+# span name gets a histogram with fixed buckets, so recording is a bisect and a few additions.
+# The optional WSGI middleware also collects the spans of each request into a Server-Timing
+# response header. When metrics are disabled, span() returns a shared no-op object.
+#
+# Histograms are per process: under serve.py each worker reports its own.
+
+import threading
+from bisect import bisect_left
+from time import perf_counter
+
+# Upper bounds (seconds) of the latency buckets; the last bucket (+Inf) is implicit
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+# Upper bounds of the buckets for counts (e.g. patterns scanned per match)
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000, 100000)
+
+
+class Histogram:
+    """Fixed-bucket histogram (cumulative counts are computed when rendering)."""
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)  # First bucket with value <= upper bound
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        """Returns (cumulative bucket counts, sum, count)."""
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative = []
+        running = 0
+        for bucket_count in counts:
+            running += bucket_count
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+class _NullSpan:
+    """Span used when metrics are disabled."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span:
+    __slots__ = ("_metrics", "_name", "_start")
+
+    def __init__(self, metrics, name):
+        self._metrics = metrics
+        self._name = name
+
+    def __enter__(self):
+        self._start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._metrics.observe(self._name, perf_counter() - self._start)
+        return False
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in labels.items()) + "}"
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if bound != int(bound) else f"{int(bound)}.0"
+
+
+def format_metric(name, help_text, metric_type, samples):
+    """Formats one metric family; samples is a list of (labels dict, value)."""
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {metric_type}"]
+    for labels, value in samples:
+        lines.append(f"{name}{format_labels(labels)} {value}")
+    return "\n".join(lines) + "\n"
+
+
+class Metrics:
+    """
+    Registry of span latency histograms and count histograms. With
+    server_timing, spans finished while a request is being handled by the
+    middleware (see wsgi_middleware) are also reported in its Server-Timing header.
+    """
+
+    def __init__(self, enabled=True, server_timing=False, prefix="jarvis"):
+        self.enabled = enabled
+        self.server_timing = enabled and server_timing
+        self.prefix = prefix
+        self._spans = {}  # span name -> Histogram of seconds
+        self._counts = {}  # name -> (help text, Histogram)
+        self._lock = threading.Lock()
+        self._local = threading.local()  # .timings: list of (span name, seconds) for the current request
+
+    def _histogram(self, registry, name, buckets):
+        histogram = registry.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = registry.setdefault(name, Histogram(buckets))
+        return histogram
+
+    def span(self, name):
+        """Returns a context manager that records the time spent inside it under name."""
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name)
+
+    def observe(self, name, seconds):
+        """Records a duration for span name."""
+        if not self.enabled:
+            return
+        histogram = self._spans.get(name) or self._histogram(self._spans, name, LATENCY_BUCKETS)
+        histogram.observe(seconds)
+        if self.server_timing:
+            timings = getattr(self._local, "timings", None)
+            if timings is not None:
+                timings.append((name, seconds))
+
+    def observe_count(self, name, value, help_text=""):
+        """Records a count (e.g. patterns scanned) in the count histogram name."""
+        if not self.enabled:
+            return
+        histogram = self._counts.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._counts.setdefault(name, (help_text, Histogram(COUNT_BUCKETS)))
+        histogram[1].observe(value)
+
+    @staticmethod
+    def format_server_timing(timings):
+        """Formats (name, seconds) pairs as a Server-Timing header value, summing repeated names."""
+        totals = {}
+        for name, seconds in timings:
+            totals[name] = totals.get(name, 0.0) + seconds
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in totals.items())
+
+    def wsgi_middleware(self, wsgi_app, name="request"):
+        """
+        Wraps a WSGI app to record each request's time to response headers under
+        span name and, with server_timing, add a Server-Timing header listing the
+        spans recorded while the request was handled.
+        """
+        if not self.enabled:
+            return wsgi_app
+
+        def instrumented_app(environ, start_response):
+            start_time = perf_counter()
+            self._local.timings = [] if self.server_timing else None
+
+            def timed_start_response(status, headers, exc_info=None):
+                duration = perf_counter() - start_time
+                timings = self._local.timings
+                self._local.timings = None
+                self._histogram(self._spans, name, LATENCY_BUCKETS).observe(duration)
+                if timings is not None:
+                    timings.append(("total", duration))
+                    headers = list(headers) + [("Server-Timing", self.format_server_timing(timings))]
+                return start_response(status, headers, exc_info)
+
+            try:
+                return wsgi_app(environ, timed_start_response)
+            finally:
+                self._local.timings = None
+
+        return instrumented_app
+
+    def render(self):
+        """Returns every histogram in the Prometheus text exposition format."""
+        with self._lock:
+            spans = sorted(self._spans.items())
+            counts = sorted(self._counts.items())
+
+        output = []
+        if spans:
+            name = f"{self.prefix}_span_seconds"
+            output.append(f"# HELP {name} Time spent in each instrumented step of request handling.\n"
+                          f"# TYPE {name} histogram\n")
+            for span_name, histogram in spans:
+                output.append(self._format_histogram(name, {"span": span_name}, histogram))
+        for count_name, (help_text, histogram) in counts:
+            name = f"{self.prefix}_{count_name}"
+            output.append(f"# HELP {name} {help_text or count_name}\n# TYPE {name} histogram\n")
+            output.append(self._format_histogram(name, {}, histogram))
+        return "".join(output)
+
+    @staticmethod
+    def _format_histogram(name, labels, histogram):
+        cumulative, total, count = histogram.snapshot()
+        lines = []
+        for bound, bucket_count in zip(histogram.buckets + ("+Inf",), cumulative):
+            le = bound if bound == "+Inf" else _format_bound(bound)
+            lines.append(f"{name}_bucket{format_labels(dict(labels, le=le))} {bucket_count}")
+        lines.append(f"{name}_sum{format_labels(labels)} {total}")
+        lines.append(f"{name}_count{format_labels(labels)} {count}")
+        return "\n".join(lines) + "\n"
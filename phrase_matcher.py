@@ -0,0 +1,177 @@
+# phrase_matcher.py
+# Aho-Corasick automaton used by Chat_utils for the "exact phrase" pass of get_response.
+# It finds every pattern occurring as a substring of the input in a single pass,
+# so the per-message cost does not grow with the number of patterns in the knowledge base.
+#
+# The trie is stored in flat arrays rather than a dict per node, which keeps it to a few
+# bytes per character of pattern text. It is built level by level from the sorted phrases,
+# so the children of a node have consecutive ids, sorted by character, and a transition
+# is a binary search over that range.
+
+from array import array
+from bisect import bisect_left
+
+
+class PhraseAutomaton:
+    """
+    Multi-pattern substring matcher (Aho-Corasick).
+
+    Phrases are added with add(), the automaton is compiled with build(), and
+    find() returns the payloads of every phrase that occurs anywhere in a text,
+    including occurrences inside a word (the same semantics as `phrase in text`).
+    No phrases can be added once the automaton is built.
+    """
+
+    def __init__(self):
+        self._phrase_ids = {}  # phrase text -> phrase id, only needed until build()
+        self._phrase_payloads = []  # phrase id -> list of payloads added for that text
+        self._lengths = array('i')  # phrase id -> length of the phrase
+        self._built = False
+
+    def __len__(self):
+        return len(self._lengths)
+
+    def add(self, phrase: str, payload):
+        """Adds a phrase with an associated payload. Duplicate phrases share one entry."""
+        if self._built:
+            raise RuntimeError("Phrases can't be added to a built PhraseAutomaton")
+        if not phrase:
+            return
+        phrase_id = self._phrase_ids.get(phrase)
+        if phrase_id is None:
+            phrase_id = len(self._lengths)
+            self._phrase_ids[phrase] = phrase_id
+            self._phrase_payloads.append([])
+            self._lengths.append(len(phrase))
+        self._phrase_payloads[phrase_id].append(payload)
+
+    def build(self):
+        """Compiles the trie, failure links and output links."""
+        if self._built:
+            return self
+        phrases = sorted(self._phrase_ids)
+
+        # Trie, one level (depth) at a time. Node 0 is the root. For each node we keep
+        # the character leading to it, the range of its children and the phrase ending there.
+        node_char = array('I', [0])
+        first_child = array('i', [0])
+        child_count = array('i', [0])
+        node_phrase = array('i', [-1])
+        phrase_node = array('i', [0]) * len(phrases)  # Node reached by each phrase so far
+        active = list(range(len(phrases)))
+        depth = 0
+        while active:
+            next_active = []
+            previous = None
+            node = 0
+            for i in active:
+                phrase = phrases[i]
+                parent = phrase_node[i]
+                char = ord(phrase[depth])
+                if (parent, char) != previous:
+                    node = len(node_char)
+                    node_char.append(char)
+                    first_child.append(0)
+                    child_count.append(0)
+                    node_phrase.append(-1)
+                    if not child_count[parent]:
+                        first_child[parent] = node
+                    child_count[parent] += 1
+                    previous = (parent, char)
+                phrase_node[i] = node
+                if len(phrase) == depth + 1:
+                    node_phrase[node] = self._phrase_ids[phrase]
+                else:
+                    next_active.append(i)
+            active = next_active
+            depth += 1
+
+        # Failure links (longest proper suffix that is also a trie path) and output links
+        # (nearest suffix node ending a phrase). Node ids are in breadth-first order, so a
+        # parent's links are always computed before its children's.
+        node_count = len(node_char)
+        fail = array('i', [0]) * node_count
+        output_link = array('i', [0]) * node_count
+        for parent in range(node_count):
+            for child in range(first_child[parent], first_child[parent] + child_count[parent]):
+                char = node_char[child]
+                fail_node = fail[parent]
+                while True:
+                    start = first_child[fail_node]
+                    end = start + child_count[fail_node]
+                    target = bisect_left(node_char, char, start, end)
+                    if target < end and node_char[target] == char:
+                        break
+                    target = 0
+                    if not fail_node:
+                        break
+                    fail_node = fail[fail_node]
+                fail[child] = target if target != child else 0
+                target = fail[child]
+                output_link[child] = target if node_phrase[target] >= 0 else output_link[target]
+
+        # Payloads of each phrase, flattened
+        payload_offsets = array('i', [0])
+        payloads = []
+        for phrase_payloads in self._phrase_payloads:
+            payloads.extend(phrase_payloads)
+            payload_offsets.append(len(payloads))
+        try:
+            payloads = array('q', payloads)  # Integer payloads (e.g. pattern ids) are stored packed
+        except (TypeError, OverflowError):
+            pass
+
+        self._node_char = node_char
+        self._first_child = first_child
+        self._child_count = child_count
+        self._node_phrase = node_phrase
+        self._fail = fail
+        self._output_link = output_link
+        self._payload_offsets = payload_offsets
+        self._payloads = payloads
+        self._phrase_ids = None
+        self._phrase_payloads = None
+        self._built = True
+        return self
+
+    def find(self, text: str):
+        """
+        Returns a list of (phrase_length, payload) tuples, one per payload of
+        every distinct phrase that occurs in text.
+        """
+        if not self._built:
+            self.build()
+
+        node_char = self._node_char
+        first_child = self._first_child
+        child_count = self._child_count
+        node_phrase = self._node_phrase
+        fail = self._fail
+        output_link = self._output_link
+
+        found_ids = set()
+        node = 0
+        for char in text:
+            char = ord(char)
+            while True:
+                start = first_child[node]
+                end = start + child_count[node]
+                child = bisect_left(node_char, char, start, end)
+                if child < end and node_char[child] == char:
+                    node = child
+                    break
+                if not node:
+                    break
+                node = fail[node]
+
+            match_node = node if node_phrase[node] >= 0 else output_link[node]
+            while match_node:
+                found_ids.add(node_phrase[match_node])
+                match_node = output_link[match_node]
+
+        lengths = self._lengths
+        payload_offsets = self._payload_offsets
+        payloads = self._payloads
+        return [(lengths[phrase_id], payloads[i])
+                for phrase_id in found_ids
+                for i in range(payload_offsets[phrase_id], payload_offsets[phrase_id + 1])]
@@ -0,0 +1,226 @@
+# rate_limiter.py
+# Token-bucket admission control for chat turns. Each route class (kb: any chat turn,
+# llm: a call to the language model, book: Wikipedia lookups) has a bucket per client
+# (chat session, or IP address for clients without one), optionally a looser bucket per IP
+# address shared by all sessions from it (so collecting fresh session cookies doesn't buy a
+# fresh budget), and optionally one global bucket shared by all clients, which protects the
+# upstream quota. A bucket holds up to burst tokens and refills at rate tokens per second; a
+# request takes one token from each of its buckets, and gets them back if any of them is empty.
+#
+# Bucket stores:
+#   MemoryBucketStore        - per process, LRU-bounded number of buckets
+#   SharedMemoryBucketStore  - fixed-size hash table in an anonymous shared memory mapping,
+#                              created before serve.py forks, so limits hold across workers
+
+import hashlib
+import math
+import mmap
+import struct
+import threading
+import time
+from collections import OrderedDict
+
+
+def parse_rate_limits(text):
+    """
+    Parses limits written as 'class=rate/burst,...' (rate in requests per
+    second, e.g. "kb=5/20,llm=0.5/10") into {class: (rate, burst)}.
+    """
+    limits = {}
+    for item in text.split(","):
+        if not item.strip():
+            continue
+        route_class, separator, value = item.partition("=")
+        rate, slash, burst = value.partition("/")
+        if not separator or not slash:
+            raise ValueError(f"Invalid rate limit '{item.strip()}' (expected class=rate/burst)")
+        limits[route_class.strip()] = (float(rate), float(burst))
+    return limits
+
+
+def _refill(tokens, last_update, rate, burst, now):
+    if tokens is None:  # New bucket: starts full
+        return burst
+    return min(burst, tokens + max(0.0, now - last_update) * rate)
+
+
+def _wait_time(tokens, cost, rate):
+    return (cost - tokens) / rate if rate > 0 else math.inf
+
+
+class MemoryBucketStore:
+    """Token buckets in a dict of this process, keeping the max_buckets most recently used."""
+
+    def __init__(self, max_buckets=100000):
+        self.max_buckets = max_buckets
+        self._buckets = OrderedDict()  # key -> (tokens, last update)
+        self._lock = threading.Lock()
+
+    def take(self, key, rate, burst, cost=1.0):
+        """Takes cost tokens from the bucket key; returns 0 on success, else the seconds until it could."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last_update = self._buckets.get(key, (None, None))
+            tokens = _refill(tokens, last_update, rate, burst, now)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = _wait_time(tokens, cost, rate)
+            self._buckets[key] = (tokens, now)
+            self._buckets.move_to_end(key)
+            while len(self._buckets) > self.max_buckets:
+                self._buckets.popitem(last=False)
+        return wait
+
+    def refund(self, key, burst, cost=1.0):
+        """Returns tokens taken by a request that was turned away elsewhere."""
+        with self._lock:
+            if key in self._buckets:
+                tokens, last_update = self._buckets[key]
+                self._buckets[key] = (min(burst, tokens + cost), last_update)
+
+
+class SharedMemoryBucketStore:
+    """
+    Token buckets in shared memory, visible to every process forked after it
+    was created. Buckets live in a fixed table of slots (key hash, tokens, last
+    update) found by linear probing; when all probed slots are taken by other
+    keys, the bucket idle the longest is reused. A cross-process lock guards the
+    table; if it can't be taken within lock_timeout (e.g. a worker died holding
+    it), requests are admitted rather than blocked.
+    """
+
+    SLOT = struct.Struct("<Qdd")  # key hash (0: empty), tokens, last update (time.monotonic)
+
+    def __init__(self, slots=65536, probes=8, lock_timeout=0.5):
+        import multiprocessing  # Only needed for this store
+
+        self.slots = slots
+        self.probes = probes
+        self.lock_timeout = lock_timeout
+        self._table = mmap.mmap(-1, slots * self.SLOT.size)  # Anonymous and shared with forked children
+        self._lock = multiprocessing.Lock()
+
+    @staticmethod
+    def _hash(key):
+        # Stable across processes, unlike hash(); 0 marks empty slots
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little") or 1
+
+    def _find(self, key_hash):
+        """Returns (slot offset, tokens, last update) for key_hash; tokens is None for a new bucket."""
+        first = key_hash % self.slots
+        oldest_offset, oldest_update = None, math.inf
+        for probe in range(self.probes):
+            offset = (first + probe) % self.slots * self.SLOT.size
+            slot_hash, tokens, last_update = self.SLOT.unpack_from(self._table, offset)
+            if slot_hash == key_hash:
+                return offset, tokens, last_update
+            if slot_hash == 0:
+                return offset, None, None
+            if last_update < oldest_update:
+                oldest_offset, oldest_update = offset, last_update
+        return oldest_offset, None, None
+
+    def take(self, key, rate, burst, cost=1.0):
+        key_hash = self._hash(key)
+        if not self._lock.acquire(timeout=self.lock_timeout):
+            return 0.0
+        try:
+            now = time.monotonic()
+            offset, tokens, last_update = self._find(key_hash)
+            tokens = _refill(tokens, last_update, rate, burst, now)
+            wait = 0.0
+            if tokens >= cost:
+                tokens -= cost
+            else:
+                wait = _wait_time(tokens, cost, rate)
+            self.SLOT.pack_into(self._table, offset, key_hash, tokens, now)
+        finally:
+            self._lock.release()
+        return wait
+
+    def refund(self, key, burst, cost=1.0):
+        key_hash = self._hash(key)
+        if not self._lock.acquire(timeout=self.lock_timeout):
+            return
+        try:
+            offset, tokens, last_update = self._find(key_hash)
+            if tokens is not None:
+                self.SLOT.pack_into(self._table, offset, key_hash, min(burst, tokens + cost), last_update)
+        finally:
+            self._lock.release()
+
+
+class RateLimiter:
+    """
+    Admission control over a bucket store. client_limits, global_limits and
+    ip_limits map route classes to (rate, burst); classes without a limit are
+    not limited.
+    """
+
+    def __init__(self, client_limits, global_limits=None, store=None, ip_limits=None):
+        self.client_limits = client_limits
+        self.global_limits = global_limits or {}
+        self.ip_limits = ip_limits or {}
+        self.store = store or MemoryBucketStore()
+        self._stats_lock = threading.Lock()
+        self._stats = {}  # (route class, scope, result) -> count
+
+    def _count(self, route_class, scope, result):
+        key = (route_class, scope, result)
+        with self._stats_lock:
+            self._stats[key] = self._stats.get(key, 0) + 1
+
+    def acquire(self, client_key, route_class, ip_key=None):
+        """
+        Admits one request of route_class from client_key, which also counts
+        against the ip limit of ip_key (an IP address) if given. Returns 0 if
+        it is admitted, otherwise the seconds after which it would be.
+        """
+        buckets = [("client", f"{route_class}:{client_key}", self.client_limits.get(route_class))]
+        if ip_key is not None:
+            buckets.append(("ip", f"{route_class}:per-ip:{ip_key}", self.ip_limits.get(route_class)))
+        buckets.append(("global", f"{route_class}:*", self.global_limits.get(route_class)))
+        taken = []
+        for scope, key, limit in buckets:
+            if not limit:
+                continue
+            wait = self.store.take(key, *limit)
+            if wait > 0:
+                for taken_key, taken_burst in taken:  # Those budgets weren't the problem
+                    self.store.refund(taken_key, taken_burst)
+                self._count(route_class, scope, "limited")
+                return wait
+            taken.append((key, limit[1]))
+        self._count(route_class, "all", "admitted")
+        return 0.0
+
+    def get_stats(self):
+        """Returns admission counts as a JSON-serializable dict: {class: {'admitted': n, 'limited_client': n, ...}}."""
+        route_classes = set(self.client_limits) | set(self.global_limits) | set(self.ip_limits)
+        stats = {route_class: {} for route_class in route_classes}
+        with self._stats_lock:
+            for (route_class, scope, result), count in self._stats.items():
+                name = result if scope == "all" else f"{result}_{scope}"
+                stats.setdefault(route_class, {})[name] = count
+        return stats
+
+
+def create_rate_limiter(client_limits="", global_limits="", backend="memory", slots=65536, ip_limits=""):
+    """
+    Creates a RateLimiter from limit strings (see parse_rate_limits) and a store
+    backend ('memory' or 'shared'). Returns None if no limits are configured.
+    """
+    client_limits = parse_rate_limits(client_limits)
+    global_limits = parse_rate_limits(global_limits)
+    ip_limits = parse_rate_limits(ip_limits)
+    if not client_limits and not global_limits and not ip_limits:
+        return None
+    if backend == "shared":
+        store = SharedMemoryBucketStore(slots)
+    else:
+        if backend != "memory":
+            print(f"Warning: Unknown rate limit backend '{backend}', using memory.")
+        store = MemoryBucketStore()
+    return RateLimiter(client_limits, global_limits, store, ip_limits)
@@ -0,0 +1,234 @@
+# response_cache.py
+# Cache for upstream text responses (e.g. Gemini completions), keyed by a string.
+# Tier 1 is an in-memory LRU bounded by total size in bytes, with a TTL per entry.
+# Tier 2 is an optional SQLite file that survives restarts and is shared by workers. Writes
+# periodically delete its expired rows and, beyond disk_max_rows, those closest to expiring.
+# get_or_compute() coalesces concurrent misses for the same key (single-flight):
+# only one caller runs the upstream call, the others wait for its result.
+
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResponseCache:
+    """
+    Two-tier TTL cache for text responses with single-flight request coalescing.
+    Failed computations are never cached; their exception is re-raised to every
+    caller that was waiting on them.
+    """
+
+    def __init__(self, max_bytes=16 * 1024 * 1024, ttl=3600.0, disk_path=None, disk_max_rows=100000,
+                 disk_sweep_interval=300.0):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.disk_path = disk_path
+        self.disk_max_rows = disk_max_rows
+        self.disk_sweep_interval = disk_sweep_interval
+        self._next_disk_sweep = time.monotonic() + disk_sweep_interval
+        self._entries = OrderedDict()  # key -> (expires_at, value, size)
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+        self._pending = {}  # key -> _PendingCall, for single-flight
+        self._local = threading.local()  # Per-thread SQLite connection
+
+        # Counters
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.disk_evictions = 0
+
+        if disk_path:
+            connection = self._get_connection()
+            with connection:
+                connection.execute(
+                    "CREATE TABLE IF NOT EXISTS responses ("
+                    " key TEXT PRIMARY KEY,"
+                    " value TEXT NOT NULL,"
+                    " expires_at REAL NOT NULL"
+                    ")")
+                connection.execute("CREATE INDEX IF NOT EXISTS responses_expires_at ON responses (expires_at)")
+
+    def _get_connection(self):
+        connection = getattr(self._local, "connection", None)
+        # A connection must not be used across fork(), so a forked worker opens its own
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.disk_path, timeout=10, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    @staticmethod
+    def _entry_size(key, value):
+        return len(key.encode('utf-8')) + len(value.encode('utf-8'))
+
+    def _store_in_memory(self, key, value, expires_at):
+        size = self._entry_size(key, value)
+        if size > self.max_bytes:
+            return  # Larger than the whole cache; don't evict everything for it
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old:
+                self._current_bytes -= old[2]
+            self._entries[key] = (expires_at, value, size)
+            self._current_bytes += size
+            while self._current_bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self._current_bytes -= evicted_size
+                self.evictions += 1
+
+    def get(self, key):
+        """Returns the cached value for key, or None on a miss (memory, then disk)."""
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._entries[key]
+                self._current_bytes -= entry[2]
+
+        if self.disk_path:
+            try:
+                row = self._get_connection().execute(
+                    "SELECT value, expires_at FROM responses WHERE key = ? AND expires_at > ?",
+                    (key, now)).fetchone()
+            except sqlite3.Error as e:
+                print(f"Warning: Response cache disk lookup failed: {e}")
+                row = None
+            if row:
+                value, expires_at = row
+                self._store_in_memory(key, value, expires_at)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value, ttl=None):
+        """Stores a value in both tiers, for ttl seconds (default: the cache's ttl)."""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        self._store_in_memory(key, value, expires_at)
+        if self.disk_path:
+            try:
+                self._get_connection().execute(
+                    "INSERT OR REPLACE INTO responses (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, value, expires_at))
+                if time.monotonic() >= self._next_disk_sweep:
+                    self.sweep_disk()
+            except sqlite3.Error as e:
+                print(f"Warning: Response cache disk write failed: {e}")
+
+    def sweep_disk(self):
+        """
+        Deletes the disk tier's expired rows, then the rows closest to expiring
+        beyond disk_max_rows. Returns the number of rows deleted.
+        """
+        self._next_disk_sweep = time.monotonic() + self.disk_sweep_interval
+        connection = self._get_connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            deleted = connection.execute("DELETE FROM responses WHERE expires_at <= ?", (time.time(),)).rowcount
+            excess = connection.execute("SELECT COUNT(*) FROM responses").fetchone()[0] - self.disk_max_rows
+            if self.disk_max_rows and excess > 0:
+                deleted += connection.execute(
+                    "DELETE FROM responses WHERE key IN"
+                    " (SELECT key FROM responses ORDER BY expires_at LIMIT ?)", (excess,)).rowcount
+            connection.execute("COMMIT")
+        except Exception:
+            connection.execute("ROLLBACK")
+            raise
+        with self._lock:
+            self.disk_evictions += deleted
+        return deleted
+
+    def get_or_compute(self, key, compute, ttl=None):
+        """
+        Returns the cached value for key, or calls compute() to produce it.
+        Concurrent callers missing on the same key share one compute() call.
+        ttl may be a number of seconds or a function of the computed value
+        (e.g. to keep negative results for a shorter time).
+        """
+        value = self.get(key)
+        if value is not None:
+            return value
+
+        with self._lock:
+            # A concurrent leader may have stored the value since our lookup
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.time():
+                return entry[1]
+            pending = self._pending.get(key)
+            is_leader = pending is None
+            if is_leader:
+                pending = _PendingCall()
+                self._pending[key] = pending
+            else:
+                self.coalesced += 1
+
+        if not is_leader:
+            return pending.wait()
+
+        try:
+            value = compute()
+            if value is not None:
+                self.put(key, value, ttl(value) if callable(ttl) else ttl)
+            pending.set_result(value)
+            return value
+        except BaseException as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+    def get_stats(self):
+        """Returns cache statistics as a JSON-serializable dict."""
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._current_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "coalesced": self.coalesced,
+                "evictions": self.evictions,
+                "disk_evictions": self.disk_evictions,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            }
+
+
+class _PendingCall:
+    """Result slot shared between the caller computing a value and those waiting for it."""
+
+    def __init__(self):
+        self._done = threading.Event()
+        self._result = None
+        self._exception = None
+
+    def set_result(self, result):
+        self._result = result
+        self._done.set()
+
+    def set_exception(self, exception):
+        self._exception = exception
+        self._done.set()
+
+    def wait(self):
+        self._done.wait()
+        if self._exception is not None:
+            raise self._exception
+        return self._result
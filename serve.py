@@ -0,0 +1,146 @@
+# serve.py
+# Production server for the JARVIS backend (Main.py's app.run is the single-process dev server).
+# A master process imports the app once - knowledge base, match indexes, Gemini client - and
+# then forks worker processes that share those pages copy-on-write. Each worker serves its
+# connections with gevent's cooperative I/O, so a request waiting on Gemini or Wikipedia
+# doesn't hold an OS thread, and the workers together use every core.
+# The master restarts workers that exit and stops them all on SIGTERM / Ctrl+C.
+#
+# Usage: python serve.py [--host HOST] [--port PORT] [--workers N] [--connections N]
+# The defaults come from SERVE_HOST, SERVE_PORT, SERVE_WORKERS (default: number of CPUs)
+# and SERVE_CONNECTIONS (concurrent connections per worker). SERVE_ACCESS_LOG=1 logs requests.
+# WARM_UP=0 skips loading the Gemini and Wikipedia clients in the master; each worker then
+# loads them on its first request that needs them.
+# RATE_LIMIT_BACKEND=shared keeps the rate limits (see Main.py) in memory shared by all workers.
+# A session's requests can reach any worker, so chat history must be in a store all workers share:
+# CHAT_HISTORY_BACKEND defaults to sqlite here, and 'memory' is refused with more than one worker.
+
+from gevent import monkey
+monkey.patch_all()  # Before anything imports socket, ssl or threading
+
+import argparse  # noqa: E402
+import contextlib  # noqa: E402
+import gc  # noqa: E402
+import os  # noqa: E402
+import signal  # noqa: E402
+import socket  # noqa: E402
+import sys  # noqa: E402
+import time  # noqa: E402
+import traceback  # noqa: E402
+
+import gevent  # noqa: E402
+from gevent.pool import Pool  # noqa: E402
+from gevent.pywsgi import WSGIServer  # noqa: E402
+
+# gRPC channels don't survive fork() and block the gevent hub; the REST transport does neither
+os.environ.setdefault("GEMINI_TRANSPORT", "rest")
+# Per-process in-memory histories would scatter a session's messages across the workers
+os.environ.setdefault("CHAT_HISTORY_BACKEND", "sqlite")
+
+import Main  # noqa: E402
+
+app = Main.app
+
+SERVE_HOST = os.getenv("SERVE_HOST", "127.0.0.1")
+SERVE_PORT = int(os.getenv("SERVE_PORT", "8000"))
+SERVE_WORKERS = int(os.getenv("SERVE_WORKERS", "0")) or os.cpu_count() or 1
+SERVE_CONNECTIONS = int(os.getenv("SERVE_CONNECTIONS", "1000"))
+SERVE_ACCESS_LOG = os.getenv("SERVE_ACCESS_LOG", "") == "1"
+LISTEN_BACKLOG = 2048
+SHUTDOWN_TIMEOUT = 10.0  # Seconds a stopping worker waits for open requests
+RESTART_DELAY = 1.0  # Seconds between restarts of a crashed worker
+
+
+def create_listener(host, port, backlog=LISTEN_BACKLOG):
+    """Opens the listening socket the workers accept connections on."""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(backlog)
+    return listener
+
+
+def run_worker(listener, connections):
+    """Serves requests in a forked worker until it receives SIGTERM."""
+    Main.after_fork()
+    server = WSGIServer(listener, app, spawn=Pool(connections), log=sys.stderr if SERVE_ACCESS_LOG else None)
+    signal.signal(signal.SIGINT, signal.SIG_IGN)  # Ctrl+C reaches the whole group; the master decides
+    gevent.signal_handler(signal.SIGTERM, lambda: gevent.spawn(server.stop, SHUTDOWN_TIMEOUT))
+    server.serve_forever()
+
+
+def spawn_worker(listener, connections, master_handlers):
+    """Forks one worker process and returns its pid."""
+    pid = os.fork()  # gevent's fork: the child gets a fresh event loop
+    if pid:
+        return pid
+    exit_code = 0
+    try:
+        for handler in master_handlers:
+            handler.cancel()
+        run_worker(listener, connections)
+    except BaseException:
+        traceback.print_exc()
+        exit_code = 1
+    finally:
+        os._exit(exit_code)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the JARVIS backend with preforked gevent workers.")
+    parser.add_argument("--host", default=SERVE_HOST)
+    parser.add_argument("--port", type=int, default=SERVE_PORT)
+    parser.add_argument("--workers", type=int, default=SERVE_WORKERS, help="Worker processes")
+    parser.add_argument("--connections", type=int, default=SERVE_CONNECTIONS,
+                        help="Concurrent connections per worker")
+    args = parser.parse_args(argv)
+    if Main.CHAT_HISTORY_BACKEND != "sqlite" and args.workers > 1:
+        parser.error(f"CHAT_HISTORY_BACKEND={Main.CHAT_HISTORY_BACKEND} keeps each worker's chat history "
+                     f"separately; use CHAT_HISTORY_BACKEND=sqlite or --workers 1.")
+
+    listener = create_listener(args.host, args.port)
+    if Main.WARM_UP:
+        # In the master, so the workers share the loaded clients instead of each importing them
+        Main.warm_up()
+    Main.before_fork()
+    # Move everything loaded so far out of the garbage collector's reach: collections in
+    # the workers would otherwise write to those objects' pages and un-share them.
+    gc.collect()
+    gc.freeze()
+
+    workers = set()
+    master_handlers = []
+    stopping = False
+
+    def stop():
+        nonlocal stopping
+        stopping = True
+        for worker_pid in workers:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(worker_pid, signal.SIGTERM)
+
+    master_handlers.append(gevent.signal_handler(signal.SIGTERM, stop))
+    master_handlers.append(gevent.signal_handler(signal.SIGINT, stop))
+
+    for _ in range(args.workers):
+        workers.add(spawn_worker(listener, args.connections, master_handlers))
+    print(f"JARVIS Backend: Serving on http://{args.host}:{args.port} with {args.workers} workers "
+          f"({args.connections} connections each).")
+
+    while workers:
+        for worker_pid in list(workers):
+            exited_pid, status = os.waitpid(worker_pid, os.WNOHANG)
+            if not exited_pid:
+                continue
+            workers.discard(worker_pid)
+            if not stopping:
+                print(f"JARVIS Backend: Worker {worker_pid} exited with status {status}; restarting it.")
+                time.sleep(RESTART_DELAY)
+                workers.add(spawn_worker(listener, args.connections, master_handlers))
+        gevent.sleep(0.5)
+    print("JARVIS Backend: All workers stopped.")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,11 @@
+import os
+import sys
+
+# The modules under test live in the repository root, next to Main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Keep imported modules (Main, wek) off the network and away from the working directory's files
+os.environ.update(LLM_BACKEND="fake", FAKE_LLM_OPTIONS="latency_ms=0,latency_sigma=0,tokens_per_second=0",
+                  WIKIPEDIA_CACHE_DB="", CHAT_LOG_FILE="", CHAT_HISTORY_BACKEND="memory", GEMINI_CACHE_TTL="0",
+                  KB_RELOAD_INTERVAL="0", WARM_UP="0", RATE_LIMITS="", IP_RATE_LIMITS="",
+                  GLOBAL_RATE_LIMITS="")
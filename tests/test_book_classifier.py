@@ -0,0 +1,17 @@
+from book_classifier import BookClassifier
+
+
+def test_none_selects_the_defaults_and_empty_turns_evidence_off():
+    categories, summary = ["1949 British novels"], "Nineteen Eighty-Four is a novel by George Orwell."
+    default = BookClassifier()
+    assert default.score(categories, summary) == BookClassifier(None, None).score(categories, summary)
+    assert BookClassifier({}, None).score(categories, summary)[1] == {}
+    assert BookClassifier(None, {}).score(categories, summary)[2] == {}
+    assert BookClassifier({}, {}).score(categories, summary) == (0, {}, {})
+
+
+def test_negative_evidence_outweighs_a_stray_fiction_category():
+    classifier = BookClassifier()
+    assert classifier.is_book(["1937 children's books", "British fantasy novels"])
+    assert not classifier.is_book(["Science fiction films", "Films based on novels"],
+                                  "Dune is a 2021 film directed by Denis Villeneuve.")
@@ -0,0 +1,114 @@
+# Book review lookups against a local stub of the wikipedia module.
+
+import os
+import subprocess
+import sys
+import time
+import types
+from pathlib import Path
+
+import pytest
+
+import wek
+from response_cache import ResponseCache
+
+
+class PageError(Exception):
+    pass
+
+
+class DisambiguationError(Exception):
+    def __init__(self, options):
+        super().__init__(options)
+        self.options = options
+
+
+class StubPage:
+    def __init__(self, title, delay):
+        self.title = title
+        self.delay = delay
+
+    @property
+    def categories(self):
+        time.sleep(self.delay)
+        return ["2001 novels", "English-language novels"]
+
+    @property
+    def summary(self):
+        time.sleep(self.delay)
+        return f"{self.title} is a novel.\nIt has two lines."
+
+
+def stub_wikipedia(delays):
+    """A wikipedia module whose pages take delays[title] seconds per property; other titles aren't found."""
+    def page(title, auto_suggest=True):
+        if title not in delays:
+            raise PageError(title)
+        return StubPage(title, delays[title])
+
+    return types.SimpleNamespace(page=page, exceptions=types.SimpleNamespace(
+        PageError=PageError, DisambiguationError=DisambiguationError))
+
+
+@pytest.fixture
+def use_stub(monkeypatch):
+    def install(delays):
+        monkeypatch.setattr(wek, "_wikipedia", stub_wikipedia(delays))
+        monkeypatch.setattr(wek, "book_cache", ResponseCache())
+
+    return install
+
+
+def test_page_categories_and_summary_are_fetched_in_parallel(use_stub):
+    use_stub({"Dune": 0.2})
+    start_time = time.perf_counter()
+    assert wek.lookup_book("Dune") == {"status": "book", "summary": "Dune is a novel.\nIt has two lines."}
+    assert time.perf_counter() - start_time < 0.35
+
+
+def test_batch_yields_each_title_as_it_finishes(use_stub):
+    use_stub({"Slow": 0.3, "Fast": 0.05, "Medium": 0.15})
+    start_time = time.perf_counter()
+    finished = []
+    for title, details in wek.fetch_book_details_batch(["Slow", "Fast", "Medium"], timeout=5):
+        finished.append((title, round(time.perf_counter() - start_time, 1)))
+        assert details.startswith(title)
+    assert [title for title, _ in finished] == ["Fast", "Medium", "Slow"]
+    assert finished[-1][1] < 0.5  # Concurrent: about the slowest title, not the sum
+
+
+def test_batch_times_out_pending_titles(use_stub):
+    use_stub({"Slow": 1.0, "Fast": 0.0})
+    results = dict(wek.fetch_book_details_batch(["Slow", "Fast"], timeout=0.3))
+    assert results["Fast"].startswith("Fast")
+    assert "took too long" in results["Slow"]
+
+
+@pytest.mark.parametrize("user_input", ["Book review <img src=x onerror=alert(1)>",
+                                        "Book review Dune; <img src=x onerror=alert(1)>"])
+def test_book_review_html_escapes_the_title_and_details(use_stub, user_input):
+    import Main
+
+    use_stub({"Dune": 0.0})
+    client = Main.app.test_client()
+    client.post("/process_input", data={"user_input": user_input}, headers={"Accept": "application/json"})
+    reply = client.get("/messages?since=0").get_json()["messages"][-1]
+    assert "<img" not in reply["text"]
+    assert "&lt;img src=x onerror=alert(1)&gt;" in reply["text"]
+
+
+def test_titles_are_looked_up_under_their_cache_key(use_stub):
+    use_stub({"Dune": 0, "The Left Hand of Darkness": 0})
+    assert wek.get_book_record("dune")["status"] == "book"
+    assert wek.get_book_record("the_Left  Hand of Darkness ")["status"] == "book"
+    # Beyond the first letter titles are case-sensitive, so a miscased title can't poison the right one
+    assert wek.get_book_record("DUNE")["status"] == "not_found"
+    assert wek.get_book_record("Dune")["status"] == "book"
+
+
+def test_importing_wek_does_not_create_the_cache_file(tmp_path):
+    repo_root = str(Path(__file__).resolve().parent.parent)
+    env = dict(os.environ, WIKIPEDIA_CACHE_DB="wikipedia_cache.db")
+    subprocess.run([sys.executable, "-c", f"import sys; sys.path.insert(0, {repo_root!r}); import wek"],
+                   cwd=tmp_path, env=env, check=True, timeout=60)
+    assert not (tmp_path / "wikipedia_cache.db").exists()
@@ -0,0 +1,66 @@
+import json
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+from chat_log import ChatLog, iter_log_records
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+
+def test_records_are_written_and_rotated(tmp_path):
+    path = tmp_path / "chat_log.jsonl"
+    log = ChatLog(str(path), max_bytes=200, backup_count=2, flush_interval=0.01)
+    log.start()
+    for turn in range(20):
+        assert log.log({"turn": turn})
+    log.stop()
+    files = [str(path) + ".2", str(path) + ".1", str(path)]
+    turns = [record["turn"] for record in iter_log_records(f for f in files if Path(f).exists())]
+    assert turns == list(range(20))[-len(turns):]
+    assert log.get_stats()["written"] == 20 and log.get_stats()["rotations"] > 0
+
+
+def test_full_buffer_drops_records(tmp_path):
+    log = ChatLog(str(tmp_path / "chat_log.jsonl"), buffer_size=2)
+    assert [log.log({"turn": turn}) for turn in range(3)] == [True, True, False]
+    assert log.get_stats()["dropped"] == 1
+
+
+def test_writer_is_an_os_thread_under_gevent(tmp_path):
+    # A slow write must not block the hub, as it would if the writer were a greenlet
+    script = textwrap.dedent(f"""
+        from gevent import monkey
+        monkey.patch_all()
+        import json, sys, time
+        import gevent
+        sys.path.insert(0, {str(REPO_ROOT)!r})
+        from chat_log import ChatLog
+
+        real_sleep = monkey.get_original("time", "sleep")
+        real_get_ident = monkey.get_original("_thread", "get_ident")
+        writer_idents = []
+
+        class SlowLog(ChatLog):
+            def _write_batch(self, batch):
+                writer_idents.append(real_get_ident())
+                real_sleep(0.5)
+                super()._write_batch(batch)
+
+        log = SlowLog({str(tmp_path / "chat_log.jsonl")!r}, flush_interval=0.01)
+        log.start()
+        log.log({{"turn": 0}})
+        real_sleep(0.1)  # Let the writer pick the record up
+        start = time.perf_counter()
+        gevent.sleep(0.05)
+        hub_delay = time.perf_counter() - start
+        log.stop()
+        print(json.dumps({{"hub_delay": hub_delay, "os_thread": writer_idents[0] != real_get_ident(),
+                           "written": log.written}}))
+    """)
+    result = json.loads(subprocess.run([sys.executable, "-c", script], capture_output=True, text=True,
+                                       check=True, timeout=30).stdout.splitlines()[-1])
+    assert result["os_thread"]
+    assert result["hub_delay"] < 0.3
+    assert result["written"] == 1
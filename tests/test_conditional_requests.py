@@ -0,0 +1,45 @@
+import Main
+
+
+def post(client, user_input):
+    client.post("/process_input", data={"user_input": user_input}, headers={"Accept": "application/json"})
+
+
+def test_page_is_not_modified_until_a_message_is_added():
+    client = Main.app.test_client()
+    page = client.get("/")
+    etag = page.headers["ETag"]
+    assert page.status_code == 200 and "your friendly AI assistant" in page.get_data(as_text=True)
+
+    unchanged = client.get("/", headers={"If-None-Match": etag})
+    assert unchanged.status_code == 304 and unchanged.get_data() == b""
+
+    post(client, "hello")
+    changed = client.get("/", headers={"If-None-Match": etag})
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert "You: hello" in changed.get_data(as_text=True)
+
+
+def test_messages_since_returns_only_newer_messages():
+    client = Main.app.test_client()
+    client.get("/")
+    post(client, "hello")
+    everything = client.get("/messages?since=0").get_json()
+    seen = everything["last_seq"]
+
+    post(client, "what is python")
+    newer = client.get(f"/messages?since={seen}")
+    body = newer.get_json()
+    assert [message["text"] for message in body["messages"]][0] == "You: what is python"
+    assert len(body["messages"]) == 2 and all(message["seq"] > seen for message in body["messages"])
+    assert body["last_seq"] == body["messages"][-1]["seq"]
+
+    # Nothing new since then: an empty list, then 304 for a client that has it
+    latest = client.get(f"/messages?since={body['last_seq']}")
+    assert latest.get_json() == {"messages": [], "last_seq": body["last_seq"]}
+    assert client.get(f"/messages?since={body['last_seq']}",
+                      headers={"If-None-Match": latest.headers["ETag"]}).status_code == 304
+
+    post(client, "bye")
+    assert client.get(f"/messages?since={body['last_seq']}",
+                      headers={"If-None-Match": latest.headers["ETag"]}).status_code == 200
@@ -0,0 +1,97 @@
+import os
+import random
+
+import pytest
+
+from Chat_utils import get_response, load_and_preprocess_knowledge_base
+import fuzzy_matcher
+from fuzzy_matcher import DeletionIndex, bounded_edit_distance, max_edits_for
+
+KB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge_base.json")
+
+
+@pytest.fixture(scope="module")
+def knowledge_base():
+    return load_and_preprocess_knowledge_base(KB_PATH)
+
+
+@pytest.fixture(scope="module")
+def index(knowledge_base):
+    return knowledge_base["fuzzy_index"]
+
+
+@pytest.mark.parametrize("typo, term", [
+    ("pyhton", "python"), ("tpyes", "types"), ("lsit", "list"),  # Transposition
+    ("pythn", "python"), ("lst", None),  # Deletion (three letters get no edits)
+    ("pythonn", "python"), ("typess", "types"),  # Insertion
+    ("pythom", "python"), ("tyres", "types"),  # Substitution
+])
+def test_nearest_corrects_single_edit_typos(index, typo, term):
+    assert index.nearest(typo) == term
+
+
+def test_correct_fixes_each_misspelled_word(index):
+    assert index.correct("pyhton data tpyes") == "python data types"
+
+
+def test_weak_exact_matches_are_retried_with_corrections(knowledge_base):
+    # "data" alone is a weak keyword match; the corrected input matches the whole pattern
+    stats = {}
+    get_response("pyhton data tpyes", knowledge_base, stats=stats)
+    assert stats["intent"] == "python_data_types"
+    assert stats["score"] == get_response_score("python data types", knowledge_base)
+
+
+def get_response_score(text, knowledge_base):
+    stats = {}
+    get_response(text, knowledge_base, fuzzy=False, stats=stats)
+    return stats["score"]
+
+
+def brute_force_nearest(terms, token):
+    max_distance = max_edits_for(token)
+    if token in terms:
+        return token
+    if not max_distance:
+        return None
+    matches = [(bounded_edit_distance(token, term, max_distance), term) for term in terms]
+    matches = [match for match in matches if match[0] <= max_distance]
+    return min(matches)[1] if matches else None
+
+
+def random_terms(rng, letters, count):
+    return sorted({"".join(rng.choice(letters) for _ in range(rng.randint(1, 11))) for _ in range(count)})
+
+
+@pytest.mark.skipif(fuzzy_matcher.np is None, reason="NumPy is not installed")
+def test_numpy_and_python_builds_are_identical():
+    terms = random_terms(random.Random(1), "abcdefgh\u00e9\u4e2d", 2000)
+    vectorized, pure = DeletionIndex(terms), DeletionIndex(terms, use_numpy=False)
+    assert vectorized._hashes == pure._hashes
+    assert vectorized._entries == pure._entries
+
+
+@pytest.mark.parametrize("use_numpy", [True, False])
+def test_nearest_agrees_with_a_brute_force_search(use_numpy):
+    rng = random.Random(0)
+    letters = "abcdefgh"
+    terms = random_terms(rng, letters, 1000)
+    index = DeletionIndex(terms, use_numpy=use_numpy)
+
+    def typo(term):
+        position = rng.randrange(len(term))
+        kind = rng.choice(("transpose", "delete", "insert", "substitute"))
+        if kind == "transpose" and position + 1 < len(term):
+            return term[:position] + term[position + 1] + term[position] + term[position + 2:]
+        if kind == "delete":
+            return term[:position] + term[position + 1:]
+        if kind == "insert":
+            return term[:position] + rng.choice(letters) + term[position:]
+        return term[:position] + rng.choice(letters) + term[position + 1:]
+
+    # Typos of one and two edits, and words that may be near nothing
+    tokens = [typo(term) for term in rng.sample(terms, 150)]
+    tokens += [typo(typo(term)) for term in rng.sample(terms, 150) if len(term) > 2]
+    tokens += random_terms(rng, letters, 150)
+    for token in tokens:
+        assert index.nearest(token) == brute_force_nearest(terms, token), token
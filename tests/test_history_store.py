@@ -0,0 +1,33 @@
+import time
+
+from history_store import MemoryHistoryStore, SQLiteHistoryStore
+
+
+def test_sqlite_store_keeps_only_the_last_max_messages(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"), max_messages=3)
+    for index in range(10):
+        store.append("a", {"sender": "user", "text": f"m{index}"})
+    store.append("b", {"sender": "user", "text": "other"})
+    assert [message["text"] for message in store.get_history("a")] == ["m7", "m8", "m9"]
+    rows = store._get_connection().execute("SELECT COUNT(*) FROM messages WHERE session_id = 'a'").fetchone()[0]
+    assert rows == 3
+    assert store.append("a", {"sender": "bot", "text": "m10"}) == 11  # Sequence numbers keep counting
+
+
+def test_sqlite_store_sweeps_idle_sessions(tmp_path):
+    store = SQLiteHistoryStore(str(tmp_path / "history.db"), session_ttl=60)
+    store.append("idle", {"sender": "user", "text": "old"})
+    store.append("active", {"sender": "user", "text": "new"})
+    store._get_connection().execute("UPDATE sessions SET last_active = ? WHERE session_id = 'idle'",
+                                    (time.time() - 120,))
+    assert store.sweep() == 1
+    assert store.get_history("idle") == []
+    assert [message["text"] for message in store.get_history("active")] == ["new"]
+
+
+def test_memory_store_evicts_least_recently_used_sessions():
+    store = MemoryHistoryStore(max_messages=2, max_sessions=2)
+    for session_id in ("a", "b", "c"):
+        store.append(session_id, {"sender": "user", "text": session_id})
+    assert store.get_history("a") == []
+    assert [message["seq"] for message in store.get_history("c")] == [1]
@@ -0,0 +1,61 @@
+import io
+import json
+
+import pytest
+
+from kb_loader import KnowledgeBaseMerger, _JSONStream
+
+
+class CountingReader(io.StringIO):
+    """StringIO that records how many characters were read."""
+
+    def __init__(self, text):
+        super().__init__(text)
+        self.chars_read = 0
+
+    def read(self, size=-1):
+        chunk = super().read(size)
+        self.chars_read += len(chunk)
+        return chunk
+
+
+def intents_document(count):
+    return json.dumps({"intents": [{"tag": f"t{index}", "patterns": [f"pattern number {index}"],
+                                    "responses": [f"response {index} " + "x" * 50]} for index in range(count)]})
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 4096])
+def test_records_are_decoded_across_chunk_boundaries(chunk_size):
+    document = json.dumps({"intents": [{"tag": "a", "patterns": ["hi \\u00e9", "x"], "responses": ["r"]},
+                                       {"tag": "b", "patterns": [], "responses": [], "n": 12345, "f": False}],
+                           "other": {"skipped": [1.5, None, True]}})
+    stream = _JSONStream(io.StringIO(document), chunk_size=chunk_size)
+    assert stream.decode() == json.loads(document)
+
+
+def test_syntax_error_does_not_read_the_rest_of_the_file():
+    broken = '{"intents": [{"tag": "a", "patterns" ["oops"]}, ' + intents_document(2000)[len('{"intents": ['):]
+    reader = CountingReader(broken)
+    stream = _JSONStream(reader, chunk_size=1024)
+    stream.expect("{")
+    assert stream.decode() == "intents"
+    stream.expect(":")
+    with pytest.raises(ValueError):
+        list(stream.iter_array())
+    assert reader.chars_read <= 2 * 1024 < len(broken)
+
+
+def test_oversized_value_is_an_error():
+    stream = _JSONStream(io.StringIO('["' + "x" * 5000), chunk_size=100, max_value_chars=1000)
+    stream.expect("[")
+    with pytest.raises(ValueError, match="larger than"):
+        stream.decode()
+
+
+def test_repeated_patterns_are_kept_once():
+    merger = KnowledgeBaseMerger()
+    merger.add({"tag": "a", "patterns": ["Hello there", "hi"], "responses": ["A"]})
+    merger.add({"tag": "b", "patterns": ["hello there!", "bye"], "responses": ["B"]})
+    merger.add({"tag": "a", "patterns": ["hi", "hey"], "responses": ["A", "A2"]})
+    stats = merger.get_stats()
+    assert stats["patterns"] == 4 and stats["duplicate_patterns"] == 2
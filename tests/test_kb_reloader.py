@@ -0,0 +1,47 @@
+import json
+import os
+
+from Chat_utils import get_response
+from kb_reloader import KnowledgeBaseReloader
+
+GREETING = {"tag": "greeting", "patterns": ["hello there"], "responses": ["Hi!"]}
+FAREWELL = {"tag": "farewell", "patterns": ["see you later"], "responses": ["Bye!"]}
+
+
+def write_kb(path, intents, mtime_ns=None):
+    path.write_text(json.dumps({"intents": intents}), encoding="utf-8")
+    if mtime_ns is not None:
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+
+def test_changed_file_is_rebuilt_and_swapped_in(tmp_path):
+    path = tmp_path / "knowledge_base.json"
+    write_kb(path, [GREETING], mtime_ns=1_000_000_000)
+    reloader = KnowledgeBaseReloader(str(path), poll_interval=0)
+    assert reloader.reload()
+    old_knowledge_base = reloader.knowledge_base
+    assert not reloader.check_for_changes()  # Nothing changed
+
+    write_kb(path, [GREETING, FAREWELL], mtime_ns=2_000_000_000)
+    assert reloader.check_for_changes()
+    assert reloader.knowledge_base is not old_knowledge_base
+    assert get_response("see you later", reloader.knowledge_base) == "Bye!"
+    assert get_response("see you later", old_knowledge_base) != "Bye!"  # Readers of the old one are unaffected
+    stats = reloader.get_stats()
+    assert stats["reload_count"] == 2
+    assert (stats["last_intents_reused"], stats["last_intents_rebuilt"]) == (1, 1)
+
+
+def test_broken_file_keeps_the_current_knowledge_base(tmp_path):
+    path = tmp_path / "knowledge_base.json"
+    write_kb(path, [GREETING], mtime_ns=1_000_000_000)
+    reloader = KnowledgeBaseReloader(str(path), poll_interval=0)
+    reloader.reload()
+    knowledge_base = reloader.knowledge_base
+
+    path.write_text('{"intents": [', encoding="utf-8")
+    os.utime(path, ns=(2_000_000_000, 2_000_000_000))
+    assert not reloader.check_for_changes()
+    assert reloader.knowledge_base is knowledge_base
+    assert reloader.get_stats()["failed_reload_count"] == 1
+    assert not reloader.check_for_changes()  # The same broken version isn't retried
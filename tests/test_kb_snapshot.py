@@ -0,0 +1,62 @@
+import os
+import random
+import shutil
+
+import pytest
+
+from Chat_utils import get_responses, load_and_preprocess_knowledge_base
+from kb_snapshot import PackedKeywordIndex, compile_snapshot, load_snapshot
+
+KB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge_base.json")
+
+
+@pytest.fixture
+def kb_copy(tmp_path):
+    path = tmp_path / "knowledge_base.json"
+    shutil.copyfile(KB_PATH, path)
+    return str(path)
+
+
+def sample_inputs(knowledge_base, count=300, seed=0):
+    """Patterns, patterns with a typo and random words from the knowledge base vocabulary."""
+    rng = random.Random(seed)
+    patterns = [pattern["text"] for intent_data in knowledge_base["intents"]
+                for pattern in intent_data["processed_patterns_data"]]
+    vocabulary = list(knowledge_base["keyword_index"])
+    inputs = list(patterns)
+    for _ in range(count):
+        words = rng.sample(vocabulary, rng.randint(1, 4))
+        if len(words[0]) > 4:
+            words[0] = words[0][1] + words[0][0] + words[0][2:]
+        inputs.append(" ".join(words))
+    return inputs + ["", "nothing like this is in the knowledge base"]
+
+
+def test_snapshot_answers_like_the_json_knowledge_base(kb_copy):
+    assert compile_snapshot(kb_copy)
+    loaded = load_snapshot(kb_copy)
+    fresh = load_and_preprocess_knowledge_base(kb_copy)
+    inputs = sample_inputs(fresh)
+    for use_numpy in (True, False):
+        assert get_responses(inputs, loaded, seed=0, use_numpy=use_numpy) == \
+            get_responses(inputs, fresh, seed=0, use_numpy=use_numpy)
+
+
+def test_snapshot_arrays_are_views_of_the_memory_map(kb_copy):
+    compile_snapshot(kb_copy)
+    loaded = load_snapshot(kb_copy)
+    intents, automaton, fuzzy_index = loaded["intents"], loaded["phrase_automaton"], loaded["fuzzy_index"]
+    assert isinstance(loaded["keyword_index"], PackedKeywordIndex)
+    for values in (intents.pattern_tokens, intents.pattern_token_offsets, intents.pattern_intent,
+                   automaton._node_char, automaton._fail, automaton._payloads,
+                   fuzzy_index._hashes, fuzzy_index._entries, loaded["keyword_index"]["python"]):
+        assert isinstance(values, memoryview) and values.readonly
+
+
+def test_stale_snapshot_is_ignored(kb_copy):
+    compile_snapshot(kb_copy)
+    with open(kb_copy, 'a', encoding='utf-8') as f:
+        f.write("\n")  # Same intents, different source hash
+    assert load_snapshot(kb_copy) is None
+    assert compile_snapshot(kb_copy)
+    assert load_snapshot(kb_copy) is not None
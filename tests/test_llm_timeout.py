@@ -0,0 +1,50 @@
+import pytest
+
+import Main
+from llm_backend import GeminiBackend
+
+PROMPT = "Tell me about the history of the printing press in Venice"
+TIMEOUT_REPLY = "Sorry, the AI model took too long to respond. Please try again."
+
+
+@pytest.fixture
+def slow_backend(monkeypatch):
+    # The fake backend misses its own deadline and raises the builtin TimeoutError
+    monkeypatch.setattr(Main.llm_backend, "latency_ms", 1000.0)
+    monkeypatch.setattr(Main, "GEMINI_TIMEOUT", 0.05)
+    if Main.gemini_cache:
+        monkeypatch.setattr(Main, "gemini_cache", None)
+
+
+def last_message(client):
+    return client.get("/messages?since=0").get_json()["messages"][-1]
+
+
+def test_backend_timeout_gets_the_timeout_reply(slow_backend):
+    client = Main.app.test_client()
+    client.post("/process_input", data={"user_input": PROMPT}, headers={"Accept": "application/json"})
+    assert last_message(client)["text"].endswith(TIMEOUT_REPLY)
+
+
+def test_streamed_backend_timeout_gets_the_timeout_reply(slow_backend):
+    client = Main.app.test_client()
+    body = client.post("/stream", data={"user_input": PROMPT}).get_data(as_text=True)
+    assert TIMEOUT_REPLY in body
+    assert "error trying to use the AI model" not in body
+    assert last_message(client)["text"].endswith(TIMEOUT_REPLY)
+
+
+def test_greeting_names_an_available_backend_without_loading_it(monkeypatch):
+    backend = GeminiBackend("key")
+    monkeypatch.setattr(backend, "load", lambda: pytest.fail("the page view loaded the backend"))
+    monkeypatch.setattr(Main, "llm_backend", backend)
+    page = Main.app.test_client().get("/").get_data(as_text=True)
+    assert "I can answer general questions using Gemini" in page
+
+
+def test_greeting_leaves_out_a_backend_that_failed_to_load(monkeypatch):
+    backend = GeminiBackend("key")
+    backend._failed = True  # As after a failed load()
+    monkeypatch.setattr(Main, "llm_backend", backend)
+    page = Main.app.test_client().get("/").get_data(as_text=True)
+    assert "I can answer general questions using" not in page
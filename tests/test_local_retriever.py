@@ -0,0 +1,67 @@
+import json
+import random
+
+from local_retriever import LocalRetriever, read_qa_file
+
+DOCUMENTS = [
+    ("what are your opening hours", ["We open at nine."]),
+    ("how do i reset my password", ["Use the reset link."]),
+    ("how do i change my email address", ["Go to your profile."]),
+    ("where is your office", ["On Main Street."]),
+    ("how do i do it", ["Like this."]),
+]
+
+
+def test_query_ranks_the_document_sharing_its_rare_words_first():
+    retriever = LocalRetriever(DOCUMENTS)
+    # "how do i" is in three documents, "password" in one: the rare word decides
+    similarity, document_id = retriever.best_match("how do i recover my password")
+    assert document_id == 1
+    assert 0 < similarity < 1
+    assert retriever.best_match("opening hours")[1] == 0
+    assert retriever.best_match("something else entirely") is None
+
+
+def test_repeated_words_saturate():
+    retriever = LocalRetriever([("office office office office hours", ["A"]), ("office hours", ["B"])])
+    # Term frequency saturates (BM25), so four "office"s don't drown out "hours"
+    assert retriever.best_match("office hours")[1] == 1
+    assert retriever.best_match("office")[1] == 0
+
+
+def test_exact_question_is_answered_locally_and_unrelated_ones_are_not():
+    retriever = LocalRetriever(DOCUMENTS, threshold=0.8)
+    assert retriever.answer("Where is your office?", rng=random.Random(0)) == "On Main Street."
+    assert retriever.answer("where is the nearest train station") is None
+    stats = retriever.get_stats()
+    assert (stats["documents"], stats["queries"], stats["hits"], stats["hit_rate"]) == (5, 2, 1, 0.5)
+    assert LocalRetriever(DOCUMENTS, threshold=0).answer("where is your office") is None
+
+
+def test_ties_go_to_the_first_document():
+    retriever = LocalRetriever([("red apple", ["first"]), ("red apple", ["second"])])
+    assert retriever.best_match("red apple")[1] == 0
+
+
+def test_qa_files_are_read_in_every_knowledge_base_format(tmp_path):
+    path = tmp_path / "answers.json"
+    path.write_text(json.dumps({
+        "questions_answers": [{"id": "q1", "question": "Opening hours?", "answer": "Nine to five."},
+                              {"question": "No answer"}],
+        "products": [{"name": "Widget", "description": "A widget.", "price": 5}],
+        "intents": [{"tag": "greeting", "patterns": ["hi", "hello"], "responses": ["Hey!"]},
+                    {"tag": "default", "patterns": ["anything"], "responses": ["Pardon?"]},
+                    {"tag": "silent", "patterns": ["shh"], "responses": []}],
+    }), encoding="utf-8")
+    assert read_qa_file(str(path)) == [("Opening hours?", ["Nine to five."]),
+                                       ("Widget", ["Widget: A widget. Price: 5"]),
+                                       ("hi", ["Hey!"]), ("hello", ["Hey!"])]
+
+    shards = tmp_path / "shards"
+    shards.mkdir()
+    (shards / "a.jsonl").write_text(json.dumps({"question": "Where?", "answer": "Here."}) + "\n", encoding="utf-8")
+    assert read_qa_file(str(shards)) == [("Where?", ["Here."])]
+
+    path.write_text('{"intents": [', encoding="utf-8")
+    assert read_qa_file(str(path)) == []
+    assert read_qa_file(str(tmp_path / "missing.json")) == []
@@ -0,0 +1,131 @@
+# Parity of find_best_match (keyword index + phrase automaton) with the linear scan it replaced,
+# and of the NumPy batch path (get_responses) with find_best_match.
+
+import json
+import os
+import random
+
+import pytest
+
+import batch_scoring
+from Chat_utils import find_best_match, get_responses, load_and_preprocess_knowledge_base, preprocess_input
+
+KB_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "knowledge_base.json")
+
+
+def reference_patterns(knowledge_base):
+    """(tag, pattern text, pattern keywords) of every non-default pattern, in KB order, as plain Python objects."""
+    return [(intent_data.get("tag"), pattern["text"], set(pattern["keywords"]))
+            for intent_data in knowledge_base["intents"] if intent_data.get("tag") != "default"
+            for pattern in intent_data.get("processed_patterns_data", [])]
+
+
+def linear_scan(processed_user_input, scan_patterns):
+    """Reference: the original get_response scan over every pattern; returns (tag, score) or None."""
+    user_input_keywords = set(processed_user_input.split())
+    possible_matches = []
+    for tag, processed_pattern_text, pattern_keywords in scan_patterns:
+        if processed_pattern_text in processed_user_input:
+            possible_matches.append((tag, 100 + len(processed_pattern_text)))
+            continue
+        if not pattern_keywords:
+            continue
+        common_keywords = pattern_keywords.intersection(user_input_keywords)
+        if common_keywords:
+            score = len(common_keywords) * 5
+            if common_keywords == pattern_keywords:
+                score += 20 + len(pattern_keywords)
+            elif (len(common_keywords) / len(pattern_keywords)) > 0.6:
+                score += 10
+            possible_matches.append((tag, score))
+    if not possible_matches:
+        return None
+    possible_matches.sort(key=lambda match: match[1], reverse=True)  # Stable: earliest pattern wins ties
+    return possible_matches[0]
+
+
+@pytest.fixture(scope="module")
+def knowledge_base():
+    return load_and_preprocess_knowledge_base(KB_PATH)
+
+
+def patterns(knowledge_base):
+    return [pattern["text"] for intent in knowledge_base["intents"]
+            for pattern in intent.get("processed_patterns_data", [])]
+
+
+def random_inputs(knowledge_base, count, seed=0):
+    """Inputs of 1-8 words drawn from the KB vocabulary plus some words it doesn't have."""
+    rng = random.Random(seed)
+    vocabulary = sorted({word for text in patterns(knowledge_base) for word in text.split()})
+    vocabulary += ["zebra", "quantum", "xyzzy", "what's"]
+    return [" ".join(rng.choice(vocabulary) for _ in range(rng.randint(1, 8))) for _ in range(count)]
+
+
+def assert_parity(texts, knowledge_base):
+    scan_patterns = reference_patterns(knowledge_base)
+    for text in texts:
+        processed = preprocess_input(text)
+        match = find_best_match(processed, knowledge_base)
+        assert (match and (match[0]["tag"], match[1])) == linear_scan(processed, scan_patterns), text
+
+
+def test_every_pattern_matches_like_the_linear_scan(knowledge_base):
+    assert_parity(patterns(knowledge_base), knowledge_base)
+
+
+def test_random_inputs_match_like_the_linear_scan(knowledge_base):
+    assert_parity(random_inputs(knowledge_base, 5000), knowledge_base)
+
+
+def tie_heavy_kb(tmp_path, seed):
+    """A synthetic KB and inputs where many patterns share keywords, scores tie and patterns nest."""
+    # Short words over a five-letter alphabet
+    rng = random.Random(seed)
+    letters = "abcde "
+    intents = [{"tag": f"t{i}", "responses": [f"r{i}"],
+                "patterns": ["".join(rng.choice(letters) for _ in range(rng.randint(1, 12)))
+                             for _ in range(rng.randint(1, 6))]} for i in range(300)]
+    intents.insert(5, {"tag": "default", "patterns": ["ab"], "responses": ["d"]})
+    kb_path = tmp_path / "knowledge_base.json"
+    kb_path.write_text(json.dumps({"intents": intents}), encoding="utf-8")
+    knowledge_base = load_and_preprocess_knowledge_base(str(kb_path))
+    texts = ["".join(rng.choice(letters) for _ in range(rng.randint(0, 40))) for _ in range(2000)]
+    return knowledge_base, texts
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_tie_heavy_synthetic_kb_matches_like_the_linear_scan(tmp_path, seed):
+    knowledge_base, texts = tie_heavy_kb(tmp_path, seed)
+    assert_parity(texts, knowledge_base)
+
+
+def test_no_match(knowledge_base):
+    assert find_best_match("xyzzy", knowledge_base) is None
+
+
+def assert_batch_parity(texts, knowledge_base):
+    results = get_responses(texts, knowledge_base, seed=0, fuzzy=False)
+    for text, result in zip(texts, results):
+        processed = preprocess_input(text)
+        match = find_best_match(processed, knowledge_base) if processed else None
+        assert (result["tag"], result["score"]) == ((match[0]["tag"], match[1]) if match else (None, 0)), text
+
+
+@pytest.mark.skipif(batch_scoring.np is None, reason="the batch path needs NumPy")
+def test_batch_scoring_picks_the_scalar_winners(knowledge_base):
+    assert_batch_parity(patterns(knowledge_base) + random_inputs(knowledge_base, 2000, seed=1), knowledge_base)
+
+
+@pytest.mark.skipif(batch_scoring.np is None, reason="the batch path needs NumPy")
+@pytest.mark.parametrize("seed", range(3))
+def test_batch_scoring_breaks_ties_like_the_scalar_path(tmp_path, seed):
+    knowledge_base, texts = tie_heavy_kb(tmp_path, seed)
+    assert_batch_parity(texts, knowledge_base)
+
+
+def test_batch_scoring_leaves_the_knowledge_base_alone():
+    knowledge_base = load_and_preprocess_knowledge_base(KB_PATH)
+    keys = set(knowledge_base)
+    get_responses(["what is a python list"], knowledge_base)
+    assert set(knowledge_base) == keys
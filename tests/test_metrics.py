@@ -0,0 +1,76 @@
+import re
+
+from werkzeug.test import Client
+from werkzeug.wrappers import Response
+
+import Main
+from metrics import Metrics
+
+
+def sample(text, name):
+    """The value of the sample line name (with its labels) in Prometheus text, or 0 if it is absent."""
+    match = re.search(rf"^{re.escape(name)} (\S+)$", text, re.MULTILINE)
+    return float(match.group(1)) if match else 0.0
+
+
+def instrumented_client(metrics):
+    def app(environ, start_response):
+        with metrics.span("step"):
+            pass
+        metrics.observe("step", 0.002)
+        metrics.observe_count("scanned", 7, "Things scanned.")
+        return Response("ok")(environ, start_response)
+
+    return Client(metrics.wsgi_middleware(app))
+
+
+def test_spans_and_counts_are_recorded_and_rendered():
+    metrics = Metrics()
+    client = instrumented_client(metrics)
+    for _ in range(3):
+        assert "Server-Timing" not in client.get("/").headers
+    text = metrics.render()
+    assert sample(text, 'jarvis_span_seconds_count{span="step"}') == 6
+    assert sample(text, 'jarvis_span_seconds_count{span="request"}') == 3
+    assert sample(text, 'jarvis_span_seconds_bucket{span="step",le="0.0025"}') == 6
+    assert sample(text, 'jarvis_span_seconds_bucket{span="step",le="0.001"}') == 3
+    assert "# HELP jarvis_scanned Things scanned." in text
+    assert sample(text, 'jarvis_scanned_bucket{le="5.0"}') == 0
+    assert sample(text, 'jarvis_scanned_bucket{le="10.0"}') == 3
+    assert sample(text, "jarvis_scanned_sum") == 21
+
+
+def test_server_timing_header_sums_each_requests_spans():
+    client = instrumented_client(Metrics(server_timing=True))
+    header = client.get("/").headers["Server-Timing"]
+    names = [entry.split(";")[0] for entry in header.split(", ")]
+    assert names == ["step", "total"]  # The two "step" spans are reported once, summed
+    assert float(re.search(r"step;dur=([\d.]+)", header).group(1)) >= 2.0
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = Metrics(enabled=False, server_timing=True)
+    client = instrumented_client(metrics)
+    assert "Server-Timing" not in client.get("/").headers
+    assert metrics.render() == ""
+
+
+def test_metrics_endpoint_counts_chat_turns():
+    client = Main.app.test_client()
+    before = client.get("/metrics").get_data(as_text=True)
+    for user_input in ("bye", "Tell me about the history of the printing press in Venice"):  # KB, then LLM
+        client.post("/process_input", data={"user_input": user_input}, headers={"Accept": "application/json"})
+    after = client.get("/metrics").get_data(as_text=True)
+    for name in ('jarvis_span_seconds_count{span="get_response"}', "jarvis_scanned_patterns_count",
+                 'jarvis_span_seconds_count{span="llm_generate"}', 'jarvis_upstream_completed_total{pool="gemini"}'):
+        assert sample(after, name) - sample(before, name) == 1, name
+    assert sample(after, 'jarvis_span_seconds_count{span="request"}') - \
+        sample(before, 'jarvis_span_seconds_count{span="request"}') == 3  # The two posts and the first /metrics
+
+
+def test_chat_turn_reports_its_steps_in_server_timing(monkeypatch):
+    monkeypatch.setattr(Main.metrics, "server_timing", True)
+    response = Main.app.test_client().post("/process_input", data={"user_input": "bye"},
+                                           headers={"Accept": "application/json"})
+    names = {entry.split(";")[0] for entry in response.headers["Server-Timing"].split(", ")}
+    assert {"get_response", "preprocess_input", "total"} <= names
@@ -0,0 +1,58 @@
+from rate_limiter import MemoryBucketStore, RateLimiter, parse_rate_limits
+
+
+def make_limiter(client="kb=0/3", ip="kb=0/5", global_="", store=None):
+    # Zero refill rates keep the budgets fixed for the test
+    return RateLimiter(parse_rate_limits(client), parse_rate_limits(global_), store or MemoryBucketStore(),
+                       parse_rate_limits(ip))
+
+
+def test_fresh_sessions_from_one_ip_are_capped_by_the_ip_limit():
+    limiter = make_limiter()
+    admitted = sum(limiter.acquire(f"session:{n}", "kb", "10.0.0.1") == 0 for n in range(20))
+    assert admitted == 5
+    assert limiter.acquire("session:other", "kb", "10.0.0.2") == 0
+    assert limiter.get_stats()["kb"] == {"admitted": 6, "limited_ip": 15}
+
+
+def test_session_limit_applies_within_the_ip_limit():
+    limiter = make_limiter()
+    results = [limiter.acquire("session:a", "kb", "10.0.0.1") == 0 for _ in range(4)]
+    assert results == [True, True, True, False]
+    assert limiter.get_stats()["kb"]["limited_client"] == 1
+
+
+def test_rejected_requests_are_refunded_to_the_earlier_buckets():
+    store = MemoryBucketStore()
+    limiter = make_limiter(client="kb=0/10", ip="kb=0/10", global_="kb=0/2", store=store)
+    for _ in range(5):
+        limiter.acquire("session:a", "kb", "10.0.0.1")
+    # Only the two admitted requests were charged to the session and the IP address
+    assert store.take("kb:session:a", 0, 10, cost=8) == 0
+    assert store.take("kb:per-ip:10.0.0.1", 0, 10, cost=8) == 0
+
+
+def test_ip_limit_is_refunded_when_the_session_is_over_its_limit():
+    store = MemoryBucketStore()
+    limiter = make_limiter(client="kb=0/1", ip="kb=0/5", store=store)
+    for _ in range(4):
+        limiter.acquire("session:a", "kb", "10.0.0.1")
+    assert store.take("kb:per-ip:10.0.0.1", 0, 5, cost=4) == 0
+
+
+def test_clients_without_a_session_use_only_the_client_limit():
+    limiter = make_limiter(client="kb=0/2")
+    assert [limiter.acquire("ip:10.0.0.1", "kb") == 0 for _ in range(3)] == [True, True, False]
+
+
+def test_main_charges_fresh_session_cookies_to_their_ip_address(monkeypatch):
+    import Main
+
+    monkeypatch.setattr(Main, "rate_limiter", make_limiter(client="kb=0.001/100", ip="kb=0.001/3"))
+    statuses = []
+    for _ in range(5):
+        client = Main.app.test_client()  # A new cookie jar, so a new chat session
+        client.get("/")
+        statuses.append(client.post("/process_input", data={"user_input": "hello"},
+                                    headers={"Accept": "application/json"}).status_code)
+    assert statuses == [204, 204, 204, 429, 429]
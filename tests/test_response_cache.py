@@ -0,0 +1,116 @@
+import threading
+import time
+
+from response_cache import ResponseCache
+
+
+def count_rows(cache):
+    return cache._get_connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+def test_disk_sweep_deletes_expired_rows(tmp_path):
+    cache = ResponseCache(disk_path=str(tmp_path / "cache.db"))
+    cache.put("old", "value", ttl=-1)
+    cache.put("new", "value")
+    assert cache.sweep_disk() == 1
+    assert count_rows(cache) == 1
+    assert cache.get("new") == "value"
+
+
+def test_disk_tier_is_capped_on_write(tmp_path):
+    cache = ResponseCache(disk_path=str(tmp_path / "cache.db"), disk_max_rows=5, disk_sweep_interval=0)
+    for index in range(20):
+        cache.put(f"key{index}", "value", ttl=100 + index)
+    assert count_rows(cache) == 5
+    # The rows closest to expiring went first
+    assert ResponseCache(disk_path=cache.disk_path).get("key19") == "value"
+    assert ResponseCache(disk_path=cache.disk_path).get("key0") is None
+
+
+def run_concurrently(cache, callers, compute):
+    """Calls cache.get_or_compute("k", compute) from callers threads at once; returns their results or errors."""
+    barrier = threading.Barrier(callers)
+    results = [None] * callers
+
+    def call(index):
+        barrier.wait()
+        try:
+            results[index] = cache.get_or_compute("k", compute)
+        except Exception as e:
+            results[index] = e
+
+    threads = [threading.Thread(target=call, args=(index,)) for index in range(callers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+    return results
+
+
+def blocking_compute(cache, callers, outcome):
+    """A compute() that records its calls and returns (or raises) outcome once every other caller is waiting."""
+    calls = []
+
+    def compute():
+        calls.append(1)
+        deadline = time.monotonic() + 5
+        while cache.coalesced < callers - 1 and time.monotonic() < deadline:
+            time.sleep(0.005)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return outcome
+
+    return compute, calls
+
+
+def test_single_flight_shares_one_computation():
+    cache = ResponseCache()
+    compute, calls = blocking_compute(cache, 8, "v")
+    results = run_concurrently(cache, 8, compute)
+    assert len(calls) == 1
+    assert results == ["v"] * 8
+    assert cache.coalesced == 7
+    assert cache.get("k") == "v"
+
+
+def test_single_flight_shares_the_error():
+    cache = ResponseCache()
+    error = RuntimeError("upstream failed")
+    compute, calls = blocking_compute(cache, 4, error)
+    assert run_concurrently(cache, 4, compute) == [error] * 4
+    assert len(calls) == 1
+    assert cache.get("k") is None
+
+
+def test_only_replies_without_conversation_context_are_cached(monkeypatch):
+    import Main
+
+    prompts = []
+    original_stream = Main.llm_backend.stream
+
+    def counting_stream(prompt, timeout=None):
+        prompts.append(prompt)
+        return original_stream(prompt, timeout)
+
+    monkeypatch.setattr(Main.llm_backend, "stream", counting_stream)
+    monkeypatch.setattr(Main, "gemini_cache", ResponseCache())
+    question = "Tell me about the history of the printing press in Venice"
+
+    def ask(client, route):
+        if route == "/stream":
+            client.post(route, data={"user_input": question}).get_data()
+        else:
+            client.post(route, data={"user_input": question}, headers={"Accept": "application/json"})
+
+    first = Main.app.test_client()
+    ask(first, "/process_input")
+    # A new session's first message is the same prompt, whichever route it takes
+    ask(Main.app.test_client(), "/process_input")
+    ask(Main.app.test_client(), "/stream")
+    assert prompts == [question]
+
+    # The follow-up carries the first exchange, so it gets its own reply and isn't cached
+    for route in ("/process_input", "/stream"):
+        ask(first, route)
+    assert len(prompts) == 3 and all(prompt != question and question in prompt for prompt in prompts[1:])
+    assert len(Main.gemini_cache._entries) == 1
@@ -0,0 +1,62 @@
+import json
+
+import Main
+from response_cache import ResponseCache
+from rate_limiter import MemoryBucketStore, RateLimiter, parse_rate_limits
+
+PROMPT = "Tell me about the history of the printing press in Venice"
+
+
+def stream_events(client, user_input):
+    """POSTs to /stream and returns its Server-Sent Events as (event, data) pairs."""
+    body = client.post("/stream", data={"user_input": user_input}).get_data(as_text=True)
+    events = []
+    for block in body.split("\n\n"):
+        if block:
+            event_line, data_line = block.split("\n")
+            events.append((event_line[len("event: "):], json.loads(data_line[len("data: "):])))
+    return events
+
+
+def reply_text(events):
+    return "".join(data["text"] for name, data in events if name == "chunk")
+
+
+def history(client):
+    return client.get("/messages?since=0").get_json()["messages"]
+
+
+def test_stream_sends_chunks_then_done_and_saves_the_reply():
+    client = Main.app.test_client()
+    events = stream_events(client, PROMPT)
+    names = [name for name, _ in events]
+    assert names[-1] == "done" and set(names[:-1]) == {"chunk"} and len(names) > 2  # The reply came in pieces
+
+    text = reply_text(events)
+    done = events[-1][1]
+    messages = history(client)
+    assert [message["text"] for message in messages[-2:]] == [f"You: {PROMPT}", f"JARVIS: {text}"]
+    assert done["seq"] == messages[-1]["seq"] and done["type"] == "chat"
+    assert done["ttft_ms"] is not None
+
+
+def test_cached_replies_are_not_charged_to_the_llm_limit(monkeypatch):
+    monkeypatch.setattr(Main, "gemini_cache", ResponseCache())
+    # One LLM call for everyone together (a zero refill rate keeps it spent)
+    monkeypatch.setattr(Main, "rate_limiter", RateLimiter({}, parse_rate_limits("llm=0/1"), MemoryBucketStore()))
+    calls = Main.llm_backend.calls
+
+    first = stream_events(Main.app.test_client(), PROMPT)
+    second = stream_events(Main.app.test_client(), PROMPT)  # Answered from the cache, though the budget is spent
+    third = Main.app.test_client()
+    third.post("/process_input", data={"user_input": PROMPT}, headers={"Accept": "application/json"})
+    assert Main.llm_backend.calls == calls + 1
+    assert reply_text(second) == reply_text(first)
+    assert history(third)[-1]["text"] == f"JARVIS: {reply_text(first)}"
+    assert Main.rate_limiter.get_stats()["llm"] == {"admitted": 1}
+
+    # A message the cache can't answer is over the limit and gets the knowledge base's reply
+    client = Main.app.test_client()
+    stream_events(client, "Explain how tides work")
+    assert Main.llm_backend.calls == calls + 1
+    assert Main.rate_limiter.get_stats()["llm"] == {"admitted": 1, "limited_global": 1}
@@ -0,0 +1,91 @@
+import threading
+import time
+
+import pytest
+
+import Main
+from upstream_pool import UpstreamBusyError, UpstreamPool, UpstreamTimeoutError
+
+PROMPT = "Tell me about the history of the printing press in Venice"
+
+
+def occupy(pool, calls):
+    """Starts calls pool.call()s that block until the returned event is set; waits until they all hold a slot."""
+    release = threading.Event()
+    threads = [threading.Thread(target=pool.call, args=(release.wait,), kwargs={"timeout": 5}) for _ in range(calls)]
+    for thread in threads:
+        thread.start()
+    while pool.get_stats()["in_flight"] < calls:
+        time.sleep(0.001)
+    return release, threads
+
+
+def test_full_pool_rejects_calls_without_waiting():
+    pool = UpstreamPool("test", max_workers=1, max_in_flight=2)
+    release, threads = occupy(pool, 2)  # One running, one queued
+    start_time = time.perf_counter()
+    with pytest.raises(UpstreamBusyError):
+        pool.call(lambda: "never runs")
+    with pytest.raises(UpstreamBusyError):
+        with pool.slot():
+            pass
+    assert time.perf_counter() - start_time < 0.5
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert pool.call(lambda: "ran") == "ran"
+    stats = pool.get_stats()
+    assert (stats["in_flight"], stats["completed"], stats["rejected"]) == (0, 3, 2)
+
+
+def test_timed_out_call_keeps_its_slot_until_it_returns():
+    pool = UpstreamPool("test", max_workers=1, max_in_flight=1)
+    release = threading.Event()
+    with pytest.raises(UpstreamTimeoutError):
+        pool.call(release.wait, timeout=0.05)
+    assert pool.get_stats()["timed_out"] == 1
+    with pytest.raises(UpstreamBusyError):  # The stuck call still counts against the limit
+        pool.call(lambda: "never runs")
+    release.set()
+    while pool.get_stats()["in_flight"]:
+        time.sleep(0.001)
+    assert pool.call(lambda: "ran") == "ran"
+
+
+def last_message(client):
+    return client.get("/messages?since=0").get_json()["messages"][-1]["text"]
+
+
+@pytest.fixture
+def saturated_gemini_pool(monkeypatch):
+    pool = UpstreamPool("gemini", max_workers=1, max_in_flight=1)
+    monkeypatch.setattr(Main, "gemini_pool", pool)
+    monkeypatch.setattr(Main, "gemini_cache", None)
+    release, threads = occupy(pool, 1)
+    yield pool
+    release.set()
+    for thread in threads:
+        thread.join()
+
+
+@pytest.mark.parametrize("route", ["/process_input", "/stream"])
+def test_saturated_llm_pool_gets_the_busy_reply(saturated_gemini_pool, route):
+    client = Main.app.test_client()
+    client.post(route, data={"user_input": PROMPT}, headers={"Accept": "application/json"}).get_data()
+    assert last_message(client) == f"JARVIS: {Main.BUSY_RESPONSE}"
+    assert saturated_gemini_pool.get_stats()["rejected"] == 1
+
+
+def test_llm_call_past_the_pool_deadline_gets_the_timeout_reply(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(Main, "gemini_pool", UpstreamPool("gemini", max_workers=1, timeout=0.05))
+    monkeypatch.setattr(Main, "gemini_cache", None)
+    # A backend that ignores its own timeout, so only the pool's deadline ends the wait
+    monkeypatch.setattr(Main.llm_backend, "generate", lambda prompt, timeout=None: release.wait() and "late")
+    client = Main.app.test_client()
+    try:
+        client.post("/process_input", data={"user_input": PROMPT}, headers={"Accept": "application/json"})
+    finally:
+        release.set()
+    assert last_message(client).endswith("took too long to respond. Please try again.")
+    assert Main.gemini_pool.get_stats()["timed_out"] == 1
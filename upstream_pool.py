@@ -0,0 +1,109 @@
+# upstream_pool.py
+# Bounded execution of slow outbound calls (Gemini, Wikipedia).
+# Each upstream gets its own pool so one slow service can't starve the other.
+# A pool runs calls on a fixed number of worker threads, enforces a per-call
+# deadline and a maximum number of calls in flight (running + queued). When the
+# pool is full, calls are rejected immediately instead of piling up on the
+# request threads.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from contextlib import contextmanager
+
+
+class UpstreamBusyError(Exception):
+    """Raised when an upstream pool already has max_in_flight calls outstanding."""
+
+
+class UpstreamTimeoutError(Exception):
+    """Raised when an upstream call does not finish within its deadline."""
+
+
+class UpstreamPool:
+    """
+    Thread pool with admission control for calls to one upstream service.
+
+    max_workers calls run at a time; up to max_in_flight calls may be
+    outstanding in total. A call that times out keeps its slot until the
+    underlying call really returns, so stuck upstream calls count against
+    the limit and the pool sheds load instead of queueing without bound.
+    """
+
+    def __init__(self, name, max_workers=8, max_in_flight=None, timeout=30.0):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_in_flight = max_in_flight or max_workers * 2
+        self.timeout = timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._slots = threading.BoundedSemaphore(self.max_in_flight)
+        self._stats_lock = threading.Lock()
+        self.in_flight = 0
+        self.completed = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _acquire_slot(self):
+        if not self._slots.acquire(blocking=False):
+            with self._stats_lock:
+                self.rejected += 1
+            raise UpstreamBusyError(f"{self.name} pool is at its limit of {self.max_in_flight} calls in flight")
+        with self._stats_lock:
+            self.in_flight += 1
+
+    def _release_slot(self):
+        with self._stats_lock:
+            self.in_flight -= 1
+            self.completed += 1
+        self._slots.release()
+
+    def _run(self, fn, args, kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release_slot()
+
+    def call(self, fn, *args, timeout=None, **kwargs):
+        """
+        Runs fn(*args, **kwargs) on the pool and waits for its result.
+        Raises UpstreamBusyError if the pool is full and UpstreamTimeoutError
+        if the call takes longer than timeout (default: the pool's timeout).
+        Exceptions raised by fn are re-raised.
+        """
+        self._acquire_slot()
+        try:
+            future = self._executor.submit(self._run, fn, args, kwargs)
+        except Exception:
+            self._release_slot()
+            raise
+
+        try:
+            return future.result(timeout=timeout if timeout is not None else self.timeout)
+        except FuturesTimeoutError:
+            with self._stats_lock:
+                self.timed_out += 1
+            raise UpstreamTimeoutError(f"{self.name} call did not finish within {timeout or self.timeout}s")
+
+    @contextmanager
+    def slot(self):
+        """
+        Holds one in-flight slot for work done on the calling thread (e.g. consuming
+        a streaming response). Raises UpstreamBusyError if the pool is full.
+        """
+        self._acquire_slot()
+        try:
+            yield
+        finally:
+            self._release_slot()
+
+    def get_stats(self):
+        """Returns pool statistics as a JSON-serializable dict."""
+        with self._stats_lock:
+            return {
+                "max_workers": self.max_workers,
+                "max_in_flight": self.max_in_flight,
+                "timeout": self.timeout,
+                "in_flight": self.in_flight,
+                "completed": self.completed,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
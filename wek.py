@@ -1,9 +1,130 @@
-import wikipedia
+import json
+import os
+import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeoutError
+
+from book_classifier import load_default_classifier
+from response_cache import ResponseCache
+
+# The wikipedia library (with requests and BeautifulSoup) is imported on the first lookup,
+# not with this module, so processes that never look a book up don't pay for it.
+_wikipedia = None
+_wikipedia_lock = threading.Lock()
+
+
+def get_wikipedia():
+    """Returns the wikipedia module, importing and configuring it on first use."""
+    global _wikipedia
+    if _wikipedia is None:
+        with _wikipedia_lock:
+            if _wikipedia is None:
+                import wikipedia
+                # Set language to English once (default is usually English, but good to be explicit)
+                wikipedia.set_lang("en")
+                _wikipedia = wikipedia
+    return _wikipedia
+
+
+# --- Lookup Cache ---
+# Resolved lookups (summary, is-book verdict, disambiguation options) are cached in memory
+# and, unless WIKIPEDIA_CACHE_DB is set to an empty string, in an SQLite file.
+# Negative results (page not found, not a book) expire sooner than positive ones.
+# The cache (and its file) is opened on the first lookup, not when this module is imported.
+WIKIPEDIA_CACHE_TTL = float(os.getenv("WIKIPEDIA_CACHE_TTL", str(7 * 24 * 3600)))
+WIKIPEDIA_NEGATIVE_CACHE_TTL = float(os.getenv("WIKIPEDIA_NEGATIVE_CACHE_TTL", "3600"))
+WIKIPEDIA_CACHE_DB = os.getenv("WIKIPEDIA_CACHE_DB", "wikipedia_cache.db")
+WIKIPEDIA_CACHE_MAX_BYTES = int(os.getenv("WIKIPEDIA_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+
+book_cache = None
+_book_cache_lock = threading.Lock()
+
+TITLE_SPACE_RE = re.compile(r'[\s_]+')
+
+# Compiled once; configurable through BOOK_CLASSIFIER_CONFIG (see book_classifier.py)
+book_classifier = load_default_classifier()
+
+# --- Concurrency ---
+# A page's categories and summary are separate Wikipedia requests; they are fetched in
+# parallel on this pool. Batch lookups resolve titles on their own, separate pool so
+# a title never waits on a worker that is itself waiting for page details.
+WIKIPEDIA_PAGE_FETCH_WORKERS = int(os.getenv("WIKIPEDIA_PAGE_FETCH_WORKERS", "8"))
+WIKIPEDIA_BATCH_WORKERS = int(os.getenv("WIKIPEDIA_BATCH_WORKERS", "4"))
+
+_page_fetch_executor = ThreadPoolExecutor(max_workers=WIKIPEDIA_PAGE_FETCH_WORKERS,
+                                          thread_name_prefix="wikipedia-page")
+_batch_executor = ThreadPoolExecutor(max_workers=WIKIPEDIA_BATCH_WORKERS, thread_name_prefix="wikipedia-batch")
+
+
+def get_book_cache():
+    """Returns the lookup cache, opening it on first use."""
+    global book_cache
+    if book_cache is None:
+        with _book_cache_lock:
+            if book_cache is None:
+                book_cache = ResponseCache(WIKIPEDIA_CACHE_MAX_BYTES, WIKIPEDIA_CACHE_TTL, WIKIPEDIA_CACHE_DB or None)
+    return book_cache
+
+
+def normalize_title(book_title):
+    """
+    Normalizes a title the way MediaWiki does: underscores and runs of
+    whitespace become single spaces and the first letter is upper-cased; the
+    rest of the title is case-sensitive. The result is both the cache key and
+    the title that is looked up, so every spelling sharing a key gets the same page.
+    """
+    title = TITLE_SPACE_RE.sub(' ', book_title).strip()
+    return title[:1].upper() + title[1:]
+
+
+def lookup_book(book_title):
+    """
+    Looks a title up on Wikipedia and returns a JSON-serializable record:
+    {"status": "book", "summary": ...}, {"status": "not_book"},
+    {"status": "not_found"} or {"status": "disambiguation", "options": [...]}.
+    Unexpected errors are raised (and therefore never cached).
+    """
+    wikipedia = get_wikipedia()
+    try:
+        # Get the Wikipedia page for the book title
+        # auto_suggest=False is used to try and get an exact match
+        page = wikipedia.page(book_title, auto_suggest=False)
+    except wikipedia.exceptions.PageError:
+        return {"status": "not_found"}
+    except wikipedia.exceptions.DisambiguationError as e:
+        return {"status": "disambiguation", "options": list(e.options)}
+
+    # Both properties are fetched lazily from the network; request them in parallel.
+    categories_future = _page_fetch_executor.submit(lambda: page.categories)
+    summary_future = _page_fetch_executor.submit(lambda: page.summary)
+
+    # --- Book Verification (Heuristic) ---
+    # Score the page's categories and the opening of its summary (see book_classifier.py)
+    summary = summary_future.result()
+    if book_classifier.is_book(categories_future.result(), summary):
+        return {"status": "book", "summary": summary}
+    return {"status": "not_book"}
+
+
+def _record_ttl(record_json):
+    """Cache lifetime of a lookup record: negative results expire sooner."""
+    status = json.loads(record_json)["status"]
+    return WIKIPEDIA_CACHE_TTL if status in ("book", "disambiguation") else WIKIPEDIA_NEGATIVE_CACHE_TTL
+
+
+def get_book_record(book_title):
+    """Returns the lookup record for a title, from the cache when possible."""
+    title = normalize_title(book_title)
+    record_json = get_book_cache().get_or_compute(title, lambda: json.dumps(lookup_book(title)), ttl=_record_ttl)
+    return json.loads(record_json)
+
 
 def fetch_book_details_from_wikipedia(book_title):
     """
     Fetches a summary of a specific book from Wikipedia,
     attempting to verify if the page is indeed about a book.
+    Lookups are cached (see get_book_record), so repeat titles don't hit the network.
 
     Args:
         book_title: The exact title of the book to search for on Wikipedia.
@@ -18,45 +139,67 @@ def fetch_book_details_from_wikipedia(book_title):
         - Another error occurs.
     """
     try:
-        # Set language to English (default is usually English, but good to be explicit)
-        wikipedia.set_lang("en")
+        record = get_book_record(book_title)
+    except Exception as e:
+        return f"An error occurred: {e}"
 
-        # Get the Wikipedia page for the book title
-        # auto_suggest=False is used to try and get an exact match
-        page = wikipedia.page(book_title, auto_suggest=False)
+    status = record["status"]
+    if status == "book":
+        # Return the summary if it seems to be a book page
+        return record["summary"]
+    if status == "not_book":
+        # Return a message if a page was found but doesn't seem to be a book
+        return f"A Wikipedia page was found for '{book_title}', but it does not appear to be about a book based on its categories."
+    if status == "disambiguation":
+        # Handle disambiguation errors by listing potential options
+        return f"Multiple Wikipedia pages found for '{book_title}'. Please be more specific. Options: {', '.join(record['options'])}"
+    return f"Could not find a Wikipedia page for the book '{book_title}'."
 
-        # --- Book Verification (Heuristic) ---
-        # Check categories to see if it's likely a book page
-        book_categories_keywords = [
-            "novels", "fiction", "literature", "books", "works",
-            "fantasy", "science fiction", "mystery", "thriller",
-            "historical novels", "children's books", "young adult fiction",
-            "romance novels", "horror novels", "biographies", "autobiographies"
-            # Add more keywords as needed
-        ]
-
-        is_likely_book = False
-        page_categories = [cat.lower() for cat in page.categories]
-
-        for keyword in book_categories_keywords:
-            if any(keyword in category for category in page_categories):
-                is_likely_book = True
-                break
-
-        if is_likely_book:
-            # Return the summary if it seems to be a book page
-            return page.summary
-        else:
-            # Return a message if a page was found but doesn't seem to be a book
-            return f"A Wikipedia page was found for '{book_title}', but it does not appear to be about a book based on its categories."
 
-    except wikipedia.exceptions.PageError:
-        return f"Could not find a Wikipedia page for the book '{book_title}'."
-    except wikipedia.exceptions.DisambiguationError as e:
-        # Handle disambiguation errors by listing potential options
-        options = e.options
-        return f"Multiple Wikipedia pages found for '{book_title}'. Please be more specific. Options: {', '.join(options)}"
-    except Exception as e:
-        return f"An error occurred: {e}"
+def fetch_book_details_batch(titles, timeout=None):
+    """
+    Looks up several book titles concurrently (on a bounded pool) and yields
+    (title, details) pairs as each lookup finishes, so fast titles don't wait
+    for the slowest one. details is the same text fetch_book_details_from_wikipedia
+    returns. If timeout (seconds, for the whole batch) expires, the remaining
+    titles are yielded with a timeout message.
+    """
+    futures = {_batch_executor.submit(fetch_book_details_from_wikipedia, title): title for title in titles}
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            yield futures[future], future.result()
+    except FuturesTimeoutError:
+        for future in pending:
+            future.cancel()
+            yield futures[future], f"Sorry, the Wikipedia lookup for '{futures[future]}' took too long."
+
+
+def warm_cache(titles):
+    """
+    Pre-populates the lookup cache for a list of titles.
+    Returns the number of titles that resolved without an error.
+    """
+    resolved = 0
+    for title in titles:
+        try:
+            record = get_book_record(title)
+            resolved += 1
+            print(f"{title}: {record['status']}")
+        except Exception as e:
+            print(f"{title}: error ({e})")
+    return resolved
+
 
 # --- Main Function or Execution Block ---
+# Warm the lookup cache from a file with one title per line:
+#   python wek.py warm titles.txt
+if __name__ == '__main__':
+    if len(sys.argv) != 3 or sys.argv[1] != "warm":
+        print("Usage: python wek.py warm <titles_file>")
+        sys.exit(1)
+    with open(sys.argv[2], 'r', encoding='utf-8') as f:
+        warm_titles = [line.strip() for line in f if line.strip()]
+    count = warm_cache(warm_titles)
+    print(f"Warmed the Wikipedia cache with {count} of {len(warm_titles)} titles.")